@@ -0,0 +1,118 @@
+#!/usr/bin/python
+"""
+=======
+INFOS
+=======
+* compares the serial and the parallel chunked upload (ChunkedUpload) against a local stand-in server,
+  with fixed and adaptive chunk sizes
+* the server adds a latency per request and limits the bandwidth per connection, like a remote API
+* runs offline, no VSD needed
+* python version: 3
+
+========
+CHANGES
+========
+* initial version
+* adaptive chunk sizes
+
+"""
+
+from vsdConnect import connect
+from vsdConnect.upload import ChunkedUpload
+import argparse
+import http.server
+import os
+import random
+import socketserver
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+try:
+    from urllib.parse import urlsplit, parse_qs
+except ImportError:
+    from urlparse import urlsplit, parse_qs
+
+parser = argparse.ArgumentParser(description='Benchmark the chunked upload against a local stand-in server.')
+parser.add_argument('--size', type=int, default=256, help='size of the uploaded file in MB')
+parser.add_argument('--chunksize', type=int, default=4, help='chunk size in MB')
+parser.add_argument('--workers', default='1,2,4,8', help='concurrent chunks to compare, 1 is the serial upload')
+parser.add_argument('--latency', type=float, default=0.05, help='seconds the server waits per request')
+parser.add_argument('--mbps', type=float, default=50., help='bandwidth per connection in MB/s, 0 is unlimited')
+parser.add_argument('--failures', type=float, default=0., help='share of chunks answered with 503')
+parser.add_argument('--adaptive', action='store_true', help='also run with adaptive chunk sizes')
+args = parser.parse_args()
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    chunks = set()
+    lock = threading.Lock()
+
+    def log_message(self, *a):
+        pass
+
+    def _send(self, code, body=b'{}'):
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        ## read the body at the limited bandwidth
+        left = int(self.headers['Content-Length'])
+        start = time.time()
+        while left > 0:
+            block = self.rfile.read(min(left, 256 * 1024))
+            left -= len(block)
+            if args.mbps:
+                delay = (int(self.headers['Content-Length']) - left) / (args.mbps * 1e6) - (time.time() - start)
+                if delay > 0:
+                    time.sleep(delay)
+        time.sleep(args.latency)
+        if url.path.endswith('/chunked_upload'):
+            if random.random() < args.failures:
+                return self._send(503)
+            with self.lock:
+                self.chunks.add(int(query['chunk'][0]))
+            return self._send(200)
+        if url.path.endswith('/chunked_upload/commit'):
+            body = '{{"file": {{"selfUrl": "files/{0}"}}, "relatedObject": {{"selfUrl": "objects/1"}}}}'.format(
+                len(self.chunks))
+            return self._send(200, body.encode())
+        self._send(404)
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+srv = Server(('127.0.0.1', 0), Handler)
+threading.Thread(target=srv.serve_forever, daemon=True).start()
+api = connect.VSDConnecter(authtype='basic', url='http://127.0.0.1:{0}/api/'.format(srv.server_address[1]))
+
+with tempfile.TemporaryDirectory() as tmp:
+    fp = Path(tmp, 'upload.bin')
+    with fp.open('wb') as f:
+        for i in range(args.size):
+            f.write(os.urandom(1024 * 1024))
+
+    print('{0} MB in {1} MB chunks, {2}s latency, {3} MB/s per connection\n'.format(
+        args.size, args.chunksize, args.latency, args.mbps or 'unlimited'))
+    print('{0:>8s} {1:>8s} {2:>8s} {3:>8s} {4:>8s}  {5}'.format(
+        'workers', 'adaptive', 'seconds', 'MB/s', 'retries', 'chunk MB (first, last, max)'))
+    for adaptive in ([False, True] if args.adaptive else [False]):
+        for workers in [int(w) for w in args.workers.split(',')]:
+            Handler.chunks = set()
+            upload = ChunkedUpload(api, fp, args.chunksize * 1024 * 1024, maxWorkers=workers, adaptive=adaptive)
+            upload.backoff = 0.05
+            result = upload.run()
+            assert len(Handler.chunks) == result.chunks
+            sizes = [size / 1048576. for index, size, seconds in result.chunkSizes]
+            print('{0:8d} {1:>8s} {2:8.2f} {3:8.1f} {4:8d}  {5:.1f}, {6:.1f}, {7:.1f}'.format(
+                workers, str(adaptive), result.seconds, result.throughput / 1e6, result.retries,
+                sizes[0], sizes[-1], max(sizes)))
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+"""
+=======
+INFOS
+=======
+* compares the serial SHA-1 of local files (64 KB reads, like checkFileInObject did) with the
+  parallel memory mapped hashing (BulkHasher) with threads and processes
+* the files are read once before, the numbers are for a warm page cache (CPU bound)
+* runs offline, no VSD needed
+* python version: 3
+
+========
+CHANGES
+========
+* initial version
+
+"""
+
+from vsdConnect.hashing import BulkHasher
+import argparse
+import hashlib
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+parser = argparse.ArgumentParser(description='Benchmark the bulk hashing of local files.')
+parser.add_argument('--files', type=int, default=400, help='number of files')
+parser.add_argument('--size', type=float, default=2., help='mean file size in MB, sizes vary from 0.1x to 10x')
+parser.add_argument('--workers', default='1,2,4,8', help='workers to compare')
+parser.add_argument('--processes', action='store_true', help='also run with a process pool')
+parser.add_argument('--dir', default=None, help='hash the files of this directory instead of generated ones')
+args = parser.parse_args()
+
+
+def serialSha1(fp):
+    hasher = hashlib.sha1()
+    with open(fp, 'rb') as f:
+        buf = f.read(65536)
+        while buf:
+            hasher.update(buf)
+            buf = f.read(65536)
+    return hasher.hexdigest().upper()
+
+
+def run(directory):
+    files = [os.path.join(root, name) for root, dirs, names in os.walk(directory) for name in names]
+    total = sum(os.path.getsize(fp) for fp in files)
+    for fp in files:
+        with open(fp, 'rb') as f:
+            while f.read(16 * 1024 * 1024):
+                pass
+    print('{0} files, {1:.0f} MB, {2} CPUs\n'.format(len(files), total / 1e6, os.cpu_count()))
+    print('{0:>20s} {1:>8s} {2:>8s} {3:>8s}'.format('', 'seconds', 'MB/s', 'speedup'))
+
+    start = time.time()
+    expected = dict((fp, serialSha1(fp)) for fp in files)
+    serial = time.time() - start
+    print('{0:>20s} {1:8.2f} {2:8.1f} {3:8.2f}'.format('serial 64 KB reads', serial, total / serial / 1e6, 1.))
+
+    for processes in ([False, True] if args.processes else [False]):
+        for workers in [int(w) for w in args.workers.split(',')]:
+            hasher = BulkHasher(workers, processes=processes)
+            result = dict(hasher.hash(files))
+            assert result == expected
+            print('{0:>20s} {1:8.2f} {2:8.1f} {3:8.2f}'.format(
+                '{0} {1}'.format(workers, 'processes' if processes else 'threads'), hasher.seconds,
+                hasher.throughput / 1e6, serial / hasher.seconds))
+
+
+if args.dir:
+    run(args.dir)
+else:
+    with tempfile.TemporaryDirectory() as tmp:
+        random.seed(1)
+        block = os.urandom(1024 * 1024)
+        for i in range(args.files):
+            size = int(args.size * 1024 * 1024 * random.choice([0.1, 0.2, 0.5, 1, 1, 2, 10]))
+            with Path(tmp, 'f{0:05d}'.format(i)).open('wb') as f:
+                f.write(str(i).encode())
+                for j in range(size // len(block)):
+                    f.write(block)
+                f.write(block[:size % len(block)])
+        run(tmp)
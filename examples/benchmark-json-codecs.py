@@ -0,0 +1,76 @@
+#!/usr/bin/python
+"""
+=======
+INFOS
+=======
+* micro-benchmark of the JSON codecs (orjson, ujson, json) on a VSD listing page of fully expanded raw image objects
+* runs offline, no server needed
+* python version: 3
+
+========
+CHANGES
+========
+* initial version
+
+"""
+
+from vsdConnect import codec
+import argparse
+import timeit
+
+parser = argparse.ArgumentParser(description='Benchmark the JSON codecs on realistic VSD payloads.')
+parser.add_argument('--rpp', type=int, default=500, help='items per page')
+parser.add_argument('--repeat', type=int, default=20)
+args = parser.parse_args()
+
+api = 'https://demo.virtualskeleton.ch/api/'
+
+
+def rawImageObject(i):
+    ## an expanded raw image object as returned with include
+    return {
+        'id': i,
+        'selfUrl': api + 'objects/{0}'.format(i),
+        'name': 'CT_Thorax_{0}.nii'.format(i),
+        'description': 'anonymized ct series of the thorax, slice thickness 0.625mm',
+        'createdDate': '2016-02-26T12:03:52.513',
+        'ontologyCount': 2,
+        'type': {'name': 'RawImage', 'displayName': 'Raw Image', 'displayNameShort': 'Raw',
+                 'selfUrl': api + 'object_types/1'},
+        'downloadUrl': api + 'objects/{0}/download'.format(i),
+        'license': {'selfUrl': api + 'licenses/3'},
+        'files': {'totalCount': 3, 'pagination': {'rpp': 25, 'page': 0},
+                  'items': [{'selfUrl': api + 'files/{0}'.format(i * 10 + f)} for f in range(3)]},
+        'linkedObjects': {'totalCount': 0, 'pagination': {'rpp': 25, 'page': 0}, 'items': []},
+        'ontologyItems': {'totalCount': 2, 'pagination': {'rpp': 25, 'page': 0},
+                          'items': [{'selfUrl': api + 'ontologies/0/{0}'.format(7000 + o)} for o in range(2)]},
+        'objectPreviews': [{'id': i, 'selfUrl': api + 'object-previews/{0}'.format(i),
+                            'imageUrl': api + 'object-previews/{0}/image'.format(i),
+                            'thumbnailUrl': api + 'object-previews/{0}/thumbnail'.format(i)}],
+        'objectGroupRights': [{'selfUrl': api + 'object-group-rights/{0}'.format(i)}],
+        'objectUserRights': [{'selfUrl': api + 'object-user-rights/{0}'.format(i)}],
+        'rawImage': {'sliceThickness': 0.625, 'kilovoltPeak': 120.0, 'spaceBetweenSlices': 0.625,
+                     'modality': {'id': 2, 'name': 'CT', 'description': 'Computed Tomography',
+                                  'selfUrl': api + 'modalities/2'}},
+        'subjectSnapshot': {'ageInDays': 23011, 'weightInKilograms': 71.5, 'heightInMeters': 1.74,
+                            'gender': {'id': 1, 'name': 'male', 'selfUrl': api + 'genders/1'}},
+    }
+
+
+page = {
+    'totalCount': 123456,
+    'pagination': {'rpp': args.rpp, 'page': 0},
+    'items': [rawImageObject(i) for i in range(args.rpp)],
+    'nextPageUrl': api + 'objects?rpp={0}&page=1'.format(args.rpp),
+}
+
+body = codec.JSONCodec().dumpb(page)
+print('page of {0} objects, {1:.1f} kB\n'.format(args.rpp, len(body) / 1024.))
+print('{0:8s} {1:>10s} {2:>10s}'.format('codec', 'loads ms', 'dumpb ms'))
+
+for name in codec.availableCodecs():
+    c = codec.getCodec(name)
+    assert c.loads(c.dumpb(page)) == page
+    loads = min(timeit.repeat(lambda: c.loads(body), number=1, repeat=args.repeat))
+    dumps = min(timeit.repeat(lambda: c.dumpb(page), number=1, repeat=args.repeat))
+    print('{0:8s} {1:10.2f} {2:10.2f}'.format(name, loads * 1000, dumps * 1000))
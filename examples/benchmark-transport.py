@@ -0,0 +1,52 @@
+#!/usr/bin/python
+"""
+=======
+INFOS
+=======
+* compares the transports (requests, httpx, http2) on many small metadata GETs, eg. a folder crawl
+* python version: 3
+* httpx transports need: pip install httpx[http2]
+
+========
+CHANGES
+========
+* initial version
+
+"""
+
+from vsdConnect import connect
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+parser = argparse.ArgumentParser(description='Benchmark the transports of the VSDConnecter.')
+parser.add_argument('--url', default='https://demo.virtualskeleton.ch/api/')
+parser.add_argument('--username', default='demo@virtualskeleton.ch')
+parser.add_argument('--password', default='demo')
+parser.add_argument('--resource', default='objects', help='resource path of the paginated listing to crawl')
+parser.add_argument('--requests', type=int, default=200, help='number of GETs per transport')
+parser.add_argument('--workers', type=int, default=8, help='concurrent requests')
+parser.add_argument('--transports', default='requests,httpx,http2')
+args = parser.parse_args()
+
+for transport in args.transports.split(','):
+    try:
+        api = connect.VSDConnecter(url=args.url, username=args.username, password=args.password,
+                                   transport=transport)
+    except ImportError as err:
+        print('{0:10s} skipped: {1}'.format(transport, err))
+        continue
+
+    ## the urls of the first items, fetched again and again
+    page = api.getPaginated(args.resource)
+    urls = [item['selfUrl'] for item in page.items]
+    urls = [urls[i % len(urls)] for i in range(args.requests)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.workers) as pool:
+        list(pool.map(api.getRequest, urls))
+    elapsed = time.perf_counter() - start
+
+    print('{0:10s} {1} requests in {2:.2f}s, {3:.1f} req/s'.format(
+        transport, len(urls), elapsed, len(urls) / elapsed))
+    api.transport.close()
@@ -1,10 +1,28 @@
 #!/usr/bin/python
+"""
+=======
+INFOS
+=======
+* download the objects of a folder tree of the SMIR (VSD) into a local directory, see VSDConnecter.mirror
+* the folders are recreated as directories, each object is a directory <id>_<name> with its files
+* a rerun only downloads what changed (target/.vsdmirror.json)
+* python version: 3
+
+========
+CHANGES
+========
+* python 3 version based on VSDConnecter.mirror, replaces the serial download of the objects
+
+"""
 
 from vsdConnect import connect
 import sys
 import argparse
 
 parser = argparse.ArgumentParser(description='Download original image files from SMIR to a specific folder.')
+parser.add_argument('--url', default='https://demo.virtualskeleton.ch/api/')
+parser.add_argument('--username', default='demo@virtualskeleton.ch')
+parser.add_argument('--password', default='demo')
 parser.add_argument('--targetFolder', dest='targetFolder', default="./",
                    help='folder to store images in')
 parser.add_argument('--sourceProject', dest='targetProject', required=0,
@@ -13,53 +31,47 @@ parser.add_argument('--sourceFolderID', dest='sourceFolderID', required=0,
                    help='VSD ID of fodler to download')
 parser.add_argument('--sourceFolderName', dest='sourceFolderName', required=0,
                    help='Folder name of folder to download, must be unique, can contain parentfolders, does not need to be complete')
+parser.add_argument('--workers', type=int, default=4, help='objects downloaded concurrently')
+parser.add_argument('--delete', action='store_true', help='remove local files no longer in the folder')
 
+args = parser.parse_args()
 
+if not (args.targetProject or args.sourceFolderID or args.sourceFolderName):
+    print("Arguments incomplete, need either ID or name of VSD folder")
+    sys.exit(1)
 
-args=parser.parse_args()
-
-if (args.targetProject=="" and args.sourceFolderID=="" and args.sourceFolderName==""):
-    print "Arguments incomplete, need either ID or name of VSD folder"
-    sys.exit()
-
-con=connect.VSDConnecter("username","password")
-#con=connect.VSDConnecter()
 
+def fullName(api, folder):
+    """
+    :return: the names of the folder and its parents, eg. SSMPipeline/Femur/01_Original
+    """
+    names = [folder.name]
+    while folder.parentFolder is not None and folder.parentFolder.selfUrl:
+        folder = folder.get_parent(api)
+        names.insert(0, folder.name)
+    return '/'.join(names)
 
 
-print "Arguments:",args
-if args.sourceFolderID==None:
-    #get information of all folders and search for the correct one
-    print "Retrieving folder list from SMIR.."
-    folderList=con.getFolderList()
-    folderHash=con.readFolders(folderList)
-    OriginalFolder=None
-    if (args.targetProject != ""):
-        targetProject=args.targetProject
+api = connect.VSDConnecter(url=args.url, username=args.username, password=args.password)
 
-        
-        print "Retrieving target folder IDs from folder list."
-        searchstring="SSMPipeline/"+args.targetProject+"/01_Original"
-        for key,folder in folderHash.iteritems():
-            if searchstring in folder.fullName:
-                OriginalFolder=folder
-    else:
-        for key,folder in folderHash.iteritems():
-            if args.sourceFolderName in folder.fullName:
-                OriginalFolder=folder
-    if OriginalFolder==None:
-        print "Error retrieving folder, exiting"
-        sys.exit()
-    print "Retrieving file list from folder with ID", OriginalFolder.ID
-    fileIDList=OriginalFolder.containedObjects.keys()
+if args.sourceFolderID:
+    folder = api.getFolder(int(args.sourceFolderID))
 else:
-    fileList=con.getFileListInFolder(args.sourceFolderID)
-    fileIDList=con.getFileIDs(fileList)
-
-
-for ID in fileIDList:
-    print ID
-    filename=con.generateBaseFilenameFromOntology(ID)
-    filename=args.targetFolder+"/"+filename
-    con.downloadFile(ID,filename)
+    if args.targetProject:
+        searchstring = "SSMPipeline/" + args.targetProject + "/01_Original"
+    else:
+        searchstring = args.sourceFolderName
+    ## search the last part of the name, then compare the full names
+    candidates = api.getFolderByName(searchstring.rstrip('/').split('/')[-1], squeeze=False)
+    matches = [f for f in candidates if searchstring in fullName(api, f)]
+    if len(matches) != 1:
+        print("Error retrieving folder, {0} folders match {1}".format(len(matches), searchstring))
+        sys.exit(1)
+    folder = matches[0]
 
+print("Mirroring folder {0} ({1}) to {2}".format(folder.name, folder.id, args.targetFolder))
+result = api.mirror(folder, args.targetFolder, workers=args.workers, delete=args.delete)
+print(result)
+for what, err in result.failed:
+    print("failed: {0}: {1}".format(what, err))
+sys.exit(1 if result.failed else 0)
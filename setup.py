@@ -42,6 +42,11 @@ setup(
     packages = ['vsdConnect'],
     long_description = open('README.md').read(),
     install_requires = install_requires,
+    extras_require = {
+        'http2': ['httpx[http2]'],
+        'fastjson': ['orjson'],
+        'compression': ['brotli', 'zstandard'],
+    },
     url = 'https://github.com/SICASFoundation/vsdConnect'
 
 )
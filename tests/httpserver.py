@@ -0,0 +1,177 @@
+"""
+local HTTP server for the tests: serves files from memory with byte ranges and If-Range,
+can drop the connection in the middle of a body, and answers routes with JSON
+"""
+
+import json
+import re
+import socket
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+_RANGE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+
+class ServedFile(object):
+    """
+    a file of the server
+
+    :param bytes data: the content
+    :param str etag: the validator, sent as ETag and compared with If-Range
+    :param bool ranges: answer range requests with 206
+    :param int cut: bytes of each body sent before the connection is dropped, None sends all
+    """
+
+    def __init__(self, data, etag='"v1"', ranges=True, cut=None):
+        self.data = data
+        self.etag = etag
+        self.ranges = ranges
+        self.cut = cut
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def body(self):
+        """
+        :return: the request body
+        :rtype: bytes
+        """
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def reply(self, status, body=b'', headers=None):
+        """
+        send a response, body is bytes or data sent as JSON
+        """
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+            headers = dict(headers or {})
+            headers.setdefault('Content-Type', 'application/json')
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def record(self):
+        with self.server.lock:
+            self.server.log.append(dict(method=self.command, path=self.path.split('?')[0],
+                                        range=self.headers.get('Range'), ifRange=self.headers.get('If-Range'),
+                                        acceptEncoding=self.headers.get('Accept-Encoding')))
+
+    def route(self):
+        self.record()
+        fn = self.server.routes.get((self.command, self.path.split('?')[0]))
+        if fn is not None:
+            fn(self)
+        elif not self.server.dispatch(self):
+            self.reply(404, dict(error=self.path))
+
+    do_POST = do_PUT = do_DELETE = route
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if ('GET', path) in self.server.routes:
+            return self.route()
+        self.record()
+        if self.server.dispatch(self):
+            return
+        f = self.server.files.get(path)
+        if f is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        size = len(f.data)
+        start, end, status = 0, size, 200
+        m = _RANGE.match(self.headers.get('Range') or '')
+        ifRange = self.headers.get('If-Range')
+        if m and f.ranges and (ifRange is None or ifRange == f.etag):
+            if m.group(1):
+                start = int(m.group(1))
+                end = min(size, int(m.group(2)) + 1) if m.group(2) else size
+            else:
+                # suffix range, the last bytes
+                start = max(0, size - int(m.group(2)))
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */{0}'.format(size))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('ETag', f.etag)
+        if f.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(start, end - 1, size))
+        self.end_headers()
+
+        body = memoryview(f.data)[start:end]
+        if f.cut is not None and f.cut < len(body):
+            self.wfile.write(body[:f.cut])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        self.wfile.write(body)
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), Handler)
+        #: path -> ServedFile
+        self.files = dict()
+        #: (method, path) -> function called with the Handler, answers with handler.reply
+        self.routes = dict()
+        #: method, path, Range, If-Range and Accept-Encoding of the requests
+        self.log = list()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def handle_error(self, request, client_address):
+        # dropped connections
+        pass
+
+    def dispatch(self, handler):
+        """
+        answer a request that has no route, see FakeVSD
+
+        :return: if the request was answered, else a file is served
+        :rtype: bool
+        """
+        return False
+
+    def url(self, path):
+        return 'http://127.0.0.1:{0}{1}'.format(self.server_address[1], path)
+
+    def requests(self, path):
+        with self.lock:
+            return [r for r in self.log if r['path'] == path]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, kwargs=dict(poll_interval=0.05))
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,197 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pathlib import Path
+
+import vsdConnect.models as vsdModels
+from vsdConnect import connect
+from vsdConnect.blobstore import BlobStore, createBlobStore
+
+from httpserver import Server, ServedFile
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+def sha1(data):
+    return hashlib.sha1(data).hexdigest().upper()
+
+
+class BlobStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.store = BlobStore(self.dir / 'store')
+
+    def tearDown(self):
+        shutil.rmtree(str(self.dir))
+
+    def test_add_and_get(self):
+        data = os.urandom(1000)
+        src = self.dir / 'src.bin'
+        src.write_bytes(data)
+        blob = self.store.add(sha1(data), src)
+        self.assertEqual(blob, self.dir / 'store' / sha1(data)[:2] / sha1(data))
+        self.assertIn(sha1(data).lower(), self.store)
+        self.assertEqual((len(self.store), self.store.size), (1, 1000))
+
+        target = self.dir / 'target.bin'
+        self.assertEqual(self.store.get(sha1(data), target), target)
+        self.assertEqual(target.read_bytes(), data)
+        with self.store.open(sha1(data)) as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual((self.store.hits, self.store.misses), (2, 0))
+
+    def test_missing(self):
+        self.assertIsNone(self.store.get('0' * 40, self.dir / 'target.bin'))
+        self.assertIsNone(self.store.open('0' * 40))
+        self.assertFalse((self.dir / 'target.bin').exists())
+        self.assertEqual(self.store.misses, 2)
+
+    def test_link_modes(self):
+        data = b'blob ' * 100
+        self.store.write(sha1(data), data)
+        for link in ('auto', 'copy'):
+            store = BlobStore(self.dir / 'store', link=link)
+            target = self.dir / '{0}.bin'.format(link)
+            store.get(sha1(data), target)
+            self.assertEqual(target.read_bytes(), data)
+        for link in ('hardlink', 'symlink'):
+            with self.assertRaises(ValueError):
+                BlobStore(self.dir / 'store', link=link)
+
+    def test_no_shared_files(self):
+        data = os.urandom(1000)
+        src = self.dir / 'src.bin'
+        src.write_bytes(data)
+        mode = src.stat().st_mode
+        blob = self.store.add(sha1(data), src)
+        # the added file stays writable and apart from the blob
+        self.assertEqual(src.stat().st_mode, mode)
+        self.assertNotEqual(src.stat().st_ino, blob.stat().st_ino)
+        with src.open('r+b') as f:
+            f.write(b'changed')
+
+        target = self.dir / 'target.bin'
+        self.store.get(sha1(data), target)
+        self.assertNotEqual(target.stat().st_ino, blob.stat().st_ino)
+        with target.open('r+b') as f:
+            f.write(b'changed')
+        self.assertEqual(blob.read_bytes(), data)
+
+    def test_least_recently_used_evicted(self):
+        store = BlobStore(self.dir / 'store', maxBytes=250)
+        blobs = [os.urandom(100) for i in range(3)]
+        store.write(sha1(blobs[0]), blobs[0])
+        time.sleep(0.01)
+        store.write(sha1(blobs[1]), blobs[1])
+        time.sleep(0.01)
+        # the first blob is used again, the second is the oldest
+        target = self.dir / 'placed.bin'
+        store.get(sha1(blobs[1]), target)
+        time.sleep(0.01)
+        store.open(sha1(blobs[0])).close()
+        time.sleep(0.01)
+        store.write(sha1(blobs[2]), blobs[2])
+
+        self.assertNotIn(sha1(blobs[1]), store)
+        self.assertIn(sha1(blobs[0]), store)
+        self.assertIn(sha1(blobs[2]), store)
+        self.assertEqual(store.size, 200)
+        # placed files keep their data
+        self.assertEqual(target.read_bytes(), blobs[1])
+
+    def test_index_of_existing_store(self):
+        data = os.urandom(300)
+        self.store.write(sha1(data), data)
+        store = BlobStore(self.dir / 'store')
+        self.assertEqual((len(store), store.size), (1, 300))
+        self.assertEqual(store.evict(100), 300)
+        self.assertEqual(len(store), 0)
+
+    def test_create(self):
+        self.assertIsNone(createBlobStore(None))
+        self.assertIs(createBlobStore(self.store), self.store)
+        self.assertEqual(createBlobStore(self.dir / 'other').root, self.dir / 'other')
+
+
+class DownloadStoreTest(unittest.TestCase):
+    """
+    downloads with a checksum are taken from the blob store
+    """
+
+    transport = 'requests'
+
+    def setUp(self):
+        self.server = Server().start()
+        self.dir = Path(tempfile.mkdtemp())
+        self.data = os.urandom(300 * 1024)
+        self.sha1 = sha1(self.data)
+        self.server.files['/api/files/1/download'] = ServedFile(self.data)
+        self.url = self.server.url('/api/files/1/download')
+        self.api = connect.VSDConnecter(authtype='basic', url=self.server.url('/api/'), transport=self.transport,
+                                        blobstore=self.dir / 'store')
+        self.engine = self.api.downloader
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(str(self.dir))
+
+    def test_connecter_store(self):
+        self.assertIsInstance(self.engine.store, BlobStore)
+        self.assertEqual(self.engine.store.root, self.dir / 'store')
+
+    def test_fetch_from_store(self):
+        result = self.engine.fetch(self.url, self.dir / 'a.bin', checksum=self.sha1)
+        self.assertFalse(result.cached)
+        self.assertIn(self.sha1, self.engine.store)
+        requests = len(self.server.log)
+
+        result = self.engine.fetch(self.url, self.dir / 'b.bin', checksum=self.sha1.lower())
+        self.assertTrue(result.cached)
+        self.assertEqual(result.checksum, self.sha1)
+        self.assertEqual(result.size, len(self.data))
+        self.assertEqual((self.dir / 'b.bin').read_bytes(), self.data)
+        self.assertEqual(len(self.server.log), requests)
+
+    def test_without_checksum_not_stored(self):
+        self.engine.fetch(self.url, self.dir / 'a.bin')
+        self.assertEqual(len(self.engine.store), 0)
+
+    def test_fetch_into_from_store(self):
+        data = self.engine.fetchInto(self.url, checksum=self.sha1).data
+        self.assertEqual(bytes(data), self.data)
+        self.assertIn(self.sha1, self.engine.store)
+        requests = len(self.server.log)
+
+        result = self.engine.fetchInto(self.url, checksum=self.sha1)
+        self.assertTrue(result.cached)
+        self.assertEqual(bytes(result.data), self.data)
+        view = memoryview(bytearray(len(self.data) + 10))
+        result = self.engine.fetchInto(self.url, view, checksum=self.sha1)
+        self.assertEqual(bytes(result.data), self.data)
+        self.assertEqual(len(self.server.log), requests)
+
+    def test_models(self):
+        f = vsdModels.Files(id=1, downloadUrl='files/1/download', fileHashCode=self.sha1)
+        f.download(self.api, self.dir, fn='a.bin')
+        requests = len(self.server.log)
+        f.download(self.api, self.dir, fn='b.bin')
+        self.assertEqual((self.dir / 'b.bin').read_bytes(), self.data)
+        self.assertEqual(bytes(f.download_buffer(self.api)), self.data)
+        self.assertEqual(len(self.server.log), requests)
+
+
+@unittest.skipIf(httpx is None, 'httpx is not installed')
+class HttpxDownloadStoreTest(DownloadStoreTest):
+    transport = 'httpx'
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import json
+import random
+import unittest
+
+import vsdConnect.models as vsdModels
+from vsdConnect import connect
+from vsdConnect.codec import PageReader, availableCodecs, getCodec
+
+from vsdserver import FakeVSD
+
+ITEMS = [
+    dict(selfUrl='https://x/api/objects/1', name='plain'),
+    dict(name='quote " and backslash \\ and \\" both', tail='\\'),
+    dict(name='braces { [ ] } in a string', empty='', nested=dict(a=[1, [2, dict(b='}]')], dict()], c=None)),
+    dict(name=u'unicode é中 \U0001f600 and escapes \n\t\u0001', flags=[True, False, None]),
+    dict(numbers=[0, -1.5e3, 12345678901234, 3.25]),
+    [1, 'list item'],
+    'string item',
+    42,
+    None,
+]
+
+
+def chunked(data, sizes):
+    """
+    data cut into chunks of the sizes, repeated
+    """
+    chunks = list()
+    i = 0
+    while i < len(data):
+        for n in sizes:
+            chunks.append(data[i:i + n])
+            i += n
+    return chunks
+
+
+class PageReaderTest(unittest.TestCase):
+
+    def document(self, items, indent=None, ensure_ascii=True):
+        # meta keys before and after the items
+        page = dict(totalCount=len(items), pagination=dict(rpp=10000, page=0))
+        text = json.dumps(page, indent=indent)[:-1].rstrip()
+        text += ', "items": ' + json.dumps(items, indent=indent, ensure_ascii=ensure_ascii)
+        text += ', "nextPageUrl": "https://x/api/objects?page=1\\"}"}'
+        return text.encode('utf-8')
+
+    def read(self, chunks, loads=None):
+        reader = PageReader(chunks, loads)
+        return list(reader), reader
+
+    def test_every_split(self):
+        for data in (self.document(ITEMS), self.document(ITEMS, indent=2, ensure_ascii=False)):
+            for n in range(1, 40):
+                items, reader = self.read(chunked(data, [n]))
+                self.assertEqual(items, ITEMS)
+                self.assertEqual(reader.count, len(ITEMS))
+                self.assertEqual(reader.meta, dict(totalCount=len(ITEMS), pagination=dict(rpp=10000, page=0),
+                                                   nextPageUrl='https://x/api/objects?page=1"}'))
+
+    def test_random_splits(self):
+        rnd = random.Random(1)
+        data = self.document(ITEMS * 20)
+        for i in range(50):
+            sizes = [rnd.randint(1, 50) for j in range(10)] + [0]
+            self.assertEqual(self.read(chunked(data, sizes))[0], ITEMS * 20)
+
+    def test_codecs(self):
+        data = self.document(ITEMS)
+        for name in availableCodecs():
+            self.assertEqual(self.read(chunked(data, [7]), getCodec(name).loads)[0], ITEMS)
+
+    def test_empty_list(self):
+        items, reader = self.read([b'{"items" : [ ] ,"totalCount":0}'])
+        self.assertEqual(items, [])
+        self.assertEqual(reader.meta, dict(totalCount=0))
+
+    def test_items_one_by_one(self):
+        # an item is available before the rest of the page arrived
+        def chunks():
+            yield b'{"items": [{"a": 1}, '
+            self.assertEqual(received, [dict(a=1)])
+            yield b'{"a": 2}]}'
+
+        received = list()
+        for item in PageReader(chunks()):
+            received.append(item)
+        self.assertEqual(received, [dict(a=1), dict(a=2)])
+
+    def test_truncated(self):
+        data = self.document(ITEMS)
+        for end in (0, 1, 40, len(data) // 2, len(data) - 1):
+            with self.assertRaises(ValueError):
+                self.read(chunked(data[:end], [5]))
+
+    def test_not_an_object(self):
+        with self.assertRaises(ValueError):
+            self.read([b'[1, 2]'])
+
+
+class StreamAllPaginatedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeVSD().start()
+        self.server.rpp = 3
+        for i in range(10):
+            self.server.addFolder(u'folder "{0}" é {{}}'.format(i), self.server.root)
+        self.api = connect.VSDConnecter(authtype='basic', url=self.server.u(''))
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_pages(self):
+        items = list(self.api.streamAllPaginated('folders', chunksize=7))
+        self.assertEqual(items, list(self.api.iterateAllPaginated('folders')))
+        self.assertEqual([f['name'] for f in items[1:]], [u'folder "{0}" é {{}}'.format(i) for i in range(10)])
+        self.assertEqual(len([r for r in self.server.log if r['path'] == '/api/folders']), 8)
+
+    def test_models(self):
+        folders = list(self.api.streamAllPaginated('folders', vsdModels.Folder))
+        self.assertTrue(all(isinstance(f, vsdModels.Folder) for f in folders))
+        self.assertEqual(folders[0].selfUrl, self.server.root['selfUrl'])
+        self.assertEqual(len(folders[0].childFolders), 10)
+
+    def test_empty(self):
+        self.server.folders.clear()
+        self.assertEqual(list(self.api.streamAllPaginated('folders')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
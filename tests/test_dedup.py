@@ -0,0 +1,95 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from vsdConnect import connect
+from vsdConnect.dedup import HashIndex
+
+from vsdserver import FakeVSD
+
+
+def sha1(data):
+    return hashlib.sha1(data).hexdigest().upper()
+
+
+class HashIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeVSD().start()
+        self.dir = Path(tempfile.mkdtemp())
+        self.data = os.urandom(5000)
+        self.known = self.server.addObject('known', [self.data], self.server.root)
+        self.fileUrl = self.server.objectFiles[self.known['id']][0]
+        self.api = connect.VSDConnecter(authtype='basic', url=self.server.u(''))
+        self.index = self.api.buildHashIndex(self.server.root['selfUrl'], path=self.dir / 'index.json')
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(str(self.dir))
+
+    def write(self, name, data):
+        fp = self.dir / name
+        fp.write_bytes(data)
+        return fp
+
+    def uploads(self):
+        return len([r for r in self.server.log if r['method'] == 'POST'])
+
+    def test_hit(self):
+        self.assertIn(sha1(self.data).lower(), self.index)
+        fp = self.write('same.bin', self.data)
+        f, obj = self.api.uploadFile(fp, index=self.index)
+        self.assertEqual((f.selfUrl, obj.selfUrl), (self.fileUrl, self.known['selfUrl']))
+        f, obj = self.api.chunkFileUpload(fp, chunksize=64 * 1024, index=self.index)
+        self.assertEqual(f.selfUrl, self.fileUrl)
+        self.assertEqual(self.uploads(), 0)
+        self.assertEqual((self.index.hits, self.index.bytesAvoided), (2, 2 * len(self.data)))
+
+    def test_miss(self):
+        data = os.urandom(3000)
+        fp = self.write('new.bin', data)
+        self.assertIsNone(self.index.find(sha1(data)))
+        f, obj = self.api.uploadFile(fp, index=self.index)
+        self.assertEqual(self.uploads(), 1)
+        self.assertEqual(f.fileHashCode, sha1(data))
+        self.assertEqual(self.index.find(sha1(data)), dict(file=f.selfUrl, object=obj.selfUrl, size=len(data)))
+
+        # the uploaded file is found the next time
+        self.assertEqual(self.api.uploadFile(fp, index=self.index)[0].selfUrl, f.selfUrl)
+        self.assertEqual(self.uploads(), 1)
+        self.assertEqual(self.index.hits, 2)
+
+    def test_hash_fails(self):
+        indexed = len(self.index)
+        (self.dir / 'folder.bin').mkdir()
+        for fp in (self.dir / 'missing.bin', self.dir / 'folder.bin'):
+            self.assertIsNone(self.api.uploadFile(fp, index=self.index))
+        self.assertEqual(self.uploads(), 0)
+        self.assertEqual((len(self.index), self.index.hits), (indexed, 0))
+
+    def test_saved(self):
+        index = HashIndex.load(self.dir / 'index.json')
+        self.assertEqual(index.hashes, self.index.hashes)
+        self.assertEqual(index.objects, set([self.known['selfUrl']]))
+        self.assertEqual(index.find(sha1(self.data), len(self.data))['file'], self.fileUrl)
+        self.assertEqual(len(HashIndex.load(self.dir / 'missing.json')), 0)
+
+        # indexed objects are not fetched again
+        del self.server.log[:]
+        self.api.buildHashIndex(self.server.root['selfUrl'], path=self.dir / 'index.json')
+        self.assertNotIn('/api/objects/{0}'.format(self.known['id']), [r['path'] for r in self.server.log])
+
+    def test_listing(self):
+        other = self.server.addObject('other', [b'other'])
+        index = HashIndex()
+        self.assertEqual(index.addListing(self.api, 'files'), 2)
+        self.assertEqual(index.find(sha1(b'other'))['object'], other['selfUrl'])
+        self.assertEqual(index.find(sha1(self.data))['object'], self.known['selfUrl'])
+
+
+if __name__ == '__main__':
+    unittest.main()
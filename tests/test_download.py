@@ -0,0 +1,444 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from pathlib import Path
+
+import requests
+
+import vsdConnect.models as vsdModels
+from vsdConnect import connect
+from vsdConnect.download import Checkpoint, ChecksumMismatch, IncompleteDownload, StreamHash
+
+from httpserver import Server, ServedFile
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+SIZE = 1024 * 1024 + 7
+CUT = 100 * 1024
+
+
+class ResumeTest(unittest.TestCase):
+    """
+    interrupted downloads continue from the .part file and its checkpoint
+    """
+
+    transport = 'requests'
+    workers = 1
+
+    def setUp(self):
+        self.server = Server().start()
+        self.dir = Path(tempfile.mkdtemp())
+        self.data = os.urandom(SIZE)
+        self.file = ServedFile(self.data, cut=CUT)
+        self.server.files['/f'] = self.file
+        self.url = self.server.url('/f')
+        self.fp = self.dir / 'f.bin'
+        self.part = self.dir / 'f.bin.part'
+        self.sidecar = self.dir / 'f.bin.part.json'
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(str(self.dir))
+
+    def engine(self):
+        # a new connecter, as after a restart of the process
+        api = connect.VSDConnecter(authtype='basic', url=self.server.url('/api/'), transport=self.transport)
+        engine = api.downloader
+        engine.maxWorkers = self.workers
+        engine.minSegment = 256 * 1024
+        engine.checkpointBytes = 64 * 1024
+        engine.segmentAttempts = 1
+        return engine
+
+    def interrupt(self):
+        """
+        a download that fails, the .part file and the checkpoint stay
+
+        :return: the checkpoint
+        """
+        with self.assertRaises(IncompleteDownload):
+            self.engine().fetch(self.url, self.fp)
+        self.assertFalse(self.fp.exists())
+        self.assertTrue(self.part.is_file())
+        checkpoint = Checkpoint.load(self.sidecar, self.url)
+        self.assertEqual(checkpoint.size, SIZE)
+        self.assertEqual(checkpoint.validator, '"v1"')
+        self.assertTrue(0 < checkpoint.completed() < SIZE)
+        return checkpoint
+
+    def test_resume_at_checkpoint(self):
+        checkpoint = self.interrupt()
+        with self.part.open('rb') as f:
+            for a, b in checkpoint.done:
+                f.seek(a)
+                self.assertEqual(f.read(b - a), self.data[a:b])
+
+        self.file.cut = None
+        del self.server.log[:]
+        result = self.engine().fetch(self.url, self.fp)
+
+        first = checkpoint.missing()[0][0]
+        requests = self.server.requests('/f')
+        self.assertTrue(requests[0]['range'].startswith('bytes={0}-'.format(first)))
+        self.assertEqual(requests[0]['ifRange'], '"v1"')
+        self.assertTrue(all(r['range'] is not None for r in requests))
+        self.assertEqual(result.resumed, checkpoint.completed())
+        self.assertEqual(result.bytes, SIZE - checkpoint.completed())
+        self.assertEqual(self.fp.read_bytes(), self.data)
+        self.assertFalse(self.part.exists())
+        self.assertFalse(self.sidecar.exists())
+
+    def test_restart_when_validator_changes(self):
+        self.interrupt()
+
+        self.file.data = self.data = os.urandom(SIZE)
+        self.file.etag = '"v2"'
+        self.file.cut = None
+        del self.server.log[:]
+        result = self.engine().fetch(self.url, self.fp)
+
+        requests = self.server.requests('/f')
+        self.assertEqual(requests[0]['ifRange'], '"v1"')
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.bytes, SIZE)
+        self.assertEqual(self.fp.read_bytes(), self.data)
+        self.assertFalse(self.sidecar.exists())
+
+    def test_restart_when_size_changes(self):
+        self.interrupt()
+
+        # the same validator, but not the size of the checkpoint
+        self.file.data = self.data = os.urandom(SIZE + 1000)
+        self.file.cut = None
+        self.engine().fetch(self.url, self.fp)
+        self.assertEqual(self.fp.read_bytes(), self.data)
+
+    def test_no_resume(self):
+        self.interrupt()
+
+        self.file.cut = None
+        del self.server.log[:]
+        result = self.engine().fetch(self.url, self.fp, resume=False)
+        self.assertTrue(self.server.requests('/f')[0]['range'].startswith('bytes=0-'))
+        self.assertEqual(result.resumed, 0)
+        self.assertEqual(self.fp.read_bytes(), self.data)
+
+    def test_without_ranges(self):
+        self.file.ranges = False
+        self.file.cut = None
+        result = self.engine().fetch(self.url, self.fp)
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(self.fp.read_bytes(), self.data)
+        self.assertFalse(self.sidecar.exists())
+
+
+class ParallelResumeTest(ResumeTest):
+    workers = 4
+
+
+@unittest.skipIf(httpx is None, 'httpx is not installed')
+class HttpxResumeTest(ResumeTest):
+    transport = 'httpx'
+
+
+@unittest.skipIf(httpx is None, 'httpx is not installed')
+class HttpxParallelResumeTest(ResumeTest):
+    transport = 'httpx'
+    workers = 4
+
+
+class StreamHashTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.data = os.urandom(300 * 1000)
+        self.sha1 = hashlib.sha1(self.data).hexdigest().upper()
+
+    def tearDown(self):
+        shutil.rmtree(str(self.dir))
+
+    def test_sequential_without_path(self):
+        digest = StreamHash()
+        for i in range(0, len(self.data), 7000):
+            digest.update(i, self.data[i:i + 7000])
+        self.assertEqual(digest.hexdigest(len(self.data)), self.sha1)
+        self.assertEqual(digest.readBack, 0)
+
+    def test_out_of_order_without_path(self):
+        digest = StreamHash()
+        digest.update(1000, self.data[1000:2000])
+        digest.flushed(1000, 2000)
+        with self.assertRaises(IOError):
+            digest.hexdigest(len(self.data))
+
+    def test_out_of_order(self):
+        fp = self.dir / 'f.part'
+        fp.write_bytes(self.data)
+        digest = StreamHash(fp)
+        # the second half arrives first, it is read back once the first half is hashed
+        half = len(self.data) // 2
+        digest.update(half, self.data[half:])
+        digest.flushed(half, len(self.data))
+        digest.update(0, self.data[:half])
+        digest.flushed(0, half)
+        self.assertEqual(digest.pos, len(self.data))
+        self.assertEqual(digest.readBack, len(self.data) - half)
+        self.assertEqual(digest.hexdigest(len(self.data)), self.sha1)
+
+
+class ChecksumTest(unittest.TestCase):
+    """
+    downloads are hashed while they are written and compared with the expected SHA-1
+    """
+
+    transport = 'requests'
+    workers = 4
+
+    def setUp(self):
+        self.server = Server().start()
+        self.dir = Path(tempfile.mkdtemp())
+        self.data = os.urandom(SIZE)
+        self.sha1 = hashlib.sha1(self.data).hexdigest().upper()
+        self.file = ServedFile(self.data)
+        self.server.files['/api/files/1/download'] = self.file
+        self.url = self.server.url('/api/files/1/download')
+        self.fp = self.dir / 'f.bin'
+        self.api = connect.VSDConnecter(authtype='basic', url=self.server.url('/api/'), transport=self.transport)
+        self.engine = self.api.downloader
+        self.engine.maxWorkers = self.workers
+        self.engine.minSegment = 256 * 1024
+        self.engine.checkpointBytes = 64 * 1024
+        self.engine.segmentAttempts = 1
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(str(self.dir))
+
+    def test_verified(self):
+        result = self.engine.fetch(self.url, self.fp, checksum=self.sha1.lower())
+        self.assertEqual(result.checksum, self.sha1)
+        self.assertEqual(self.fp.read_bytes(), self.data)
+
+    def test_accepted_digests(self):
+        result = self.engine.fetch(self.url, self.fp, checksum=['0' * 40, self.sha1])
+        self.assertEqual(result.checksum, self.sha1)
+
+    def test_single_stream(self):
+        self.file.ranges = False
+        result = self.engine.fetch(self.url, self.fp, checksum=self.sha1)
+        self.assertEqual(result.checksum, self.sha1)
+
+    def test_mismatch(self):
+        with self.assertRaises(ChecksumMismatch) as ctx:
+            self.engine.fetch(self.url, self.fp, checksum='0' * 40)
+        self.assertEqual(ctx.exception.actual, self.sha1)
+        self.assertEqual(ctx.exception.expected, set(['0' * 40]))
+        # downloaded again before giving up, nothing is kept
+        self.assertEqual(len([r for r in self.server.log if r['range'].startswith('bytes=0-')]),
+                         self.engine.verifyAttempts)
+        self.assertEqual(sorted(os.listdir(str(self.dir))), [])
+
+    def test_resumed_download_is_verified(self):
+        self.file.cut = CUT
+        with self.assertRaises(IncompleteDownload):
+            self.engine.fetch(self.url, self.fp, checksum=self.sha1)
+        self.file.cut = None
+        result = self.engine.fetch(self.url, self.fp, checksum=self.sha1)
+        self.assertTrue(result.resumed > 0)
+        self.assertEqual(result.checksum, self.sha1)
+        self.assertEqual(self.fp.read_bytes(), self.data)
+
+    def test_corrupt_part_is_downloaded_again(self):
+        self.file.cut = CUT
+        with self.assertRaises(IncompleteDownload):
+            self.engine.fetch(self.url, self.fp, checksum=self.sha1)
+        part = self.dir / 'f.bin.part'
+        with part.open('r+b') as f:
+            f.write(b'\0' * 100)
+        self.file.cut = None
+        result = self.engine.fetch(self.url, self.fp, checksum=self.sha1)
+        self.assertEqual(result.checksum, self.sha1)
+        self.assertEqual(self.fp.read_bytes(), self.data)
+
+    def test_file_download_checks_file_hash(self):
+        f = vsdModels.Files(id=1, downloadUrl='files/1/download', fileHashCode=self.sha1)
+        f.download(self.api, working_dir=self.dir, fn='a.bin')
+        self.assertEqual((self.dir / 'a.bin').read_bytes(), self.data)
+
+        f = vsdModels.Files(id=1, downloadUrl='files/1/download', fileHashCode='0' * 40)
+        with self.assertRaises(ChecksumMismatch):
+            f.download(self.api, working_dir=self.dir, fn='b.bin')
+        f.download(self.api, working_dir=self.dir, fn='b.bin', verify=False)
+        self.assertEqual((self.dir / 'b.bin').read_bytes(), self.data)
+
+
+@unittest.skipIf(httpx is None, 'httpx is not installed')
+class HttpxChecksumTest(ChecksumTest):
+    transport = 'httpx'
+
+
+class FetchIntoTest(unittest.TestCase):
+    """
+    downloads into memory: bytearray, memoryview, file object or a new buffer
+    """
+
+    transport = 'requests'
+
+    def setUp(self):
+        self.server = Server().start()
+        self.data = os.urandom(SIZE)
+        self.sha1 = hashlib.sha1(self.data).hexdigest().upper()
+        self.file = ServedFile(self.data)
+        self.server.files['/api/files/1/download'] = self.file
+        self.url = self.server.url('/api/files/1/download')
+        self.api = connect.VSDConnecter(authtype='basic', url=self.server.url('/api/'), transport=self.transport)
+        self.engine = self.api.downloader
+        self.engine.minSegment = 256 * 1024
+
+    def tearDown(self):
+        self.server.stop()
+
+    def fetch(self, buffer=None, **kwargs):
+        return self.engine.fetchInto(self.url, buffer, **kwargs)
+
+    def test_new_bytearray(self):
+        result = self.fetch()
+        self.assertIsInstance(result.data, bytearray)
+        self.assertEqual(result.data, self.data)
+        self.assertTrue(result.segments > 1)
+
+    def test_bytearray_resized_in_place(self):
+        for size in (10, SIZE + 1000):
+            buf = bytearray(size)
+            result = self.fetch(buf)
+            self.assertIs(result.data, buf)
+            self.assertEqual(buf, self.data)
+
+    def test_memoryview(self):
+        buf = bytearray(SIZE + 1000)
+        result = self.fetch(memoryview(buf))
+        self.assertEqual(len(result.data), SIZE)
+        self.assertEqual(buf[:SIZE], self.data)
+        with self.assertRaises(ValueError):
+            self.fetch(memoryview(bytearray(100)))
+        with self.assertRaises(ValueError):
+            self.fetch(memoryview(bytes(SIZE)))
+
+    def test_file_object(self):
+        buf = io.BytesIO()
+        result = self.fetch(buf, checksum=self.sha1)
+        self.assertIs(result.data, buf)
+        self.assertEqual(buf.getvalue(), self.data)
+        self.assertEqual(result.checksum, self.sha1)
+
+    def test_spooled_when_large(self):
+        self.engine.spoolBytes = 64 * 1024
+        result = self.fetch()
+        self.assertEqual(result.data.tell(), 0)
+        self.assertEqual(result.data.read(), self.data)
+
+    def test_without_ranges(self):
+        self.file.ranges = False
+        self.assertEqual(self.fetch().data, self.data)
+        buf = io.BytesIO()
+        self.fetch(buf)
+        self.assertEqual(buf.getvalue(), self.data)
+
+    def test_lost_connections_continue(self):
+        self.file.cut = CUT
+        # a file object gets the rest of the body in one segment, CUT bytes per attempt
+        self.engine.segmentAttempts = SIZE // CUT + 1
+        self.assertEqual(self.fetch(checksum=self.sha1).data, self.data)
+        buf = io.BytesIO()
+        self.fetch(buf)
+        self.assertEqual(buf.getvalue(), self.data)
+        self.assertTrue(all(r['range'] for r in self.server.log))
+
+    def test_checksum(self):
+        self.assertEqual(self.fetch(checksum=self.sha1).checksum, self.sha1)
+        buf = io.BytesIO(b'header')
+        buf.seek(6)
+        with self.assertRaises(ChecksumMismatch):
+            self.fetch(buf, checksum='0' * 40)
+        # the body is written again from the same position, not appended
+        self.assertEqual(buf.getvalue(), b'header' + self.data)
+
+    def test_connecter_and_models(self):
+        self.assertEqual(self.api.downloadBuffer('files/1/download'), self.data)
+        f = vsdModels.Files(id=1, downloadUrl='files/1/download', fileHashCode=self.sha1)
+        self.assertEqual(f.download_buffer(self.api), self.data)
+        f.fileHashCode = '0' * 40
+        with self.assertRaises(ChecksumMismatch):
+            f.download_buffer(self.api)
+
+
+@unittest.skipIf(httpx is None, 'httpx is not installed')
+class HttpxFetchIntoTest(FetchIntoTest):
+    transport = 'httpx'
+
+
+class RequestCountTest(unittest.TestCase):
+    """
+    client errors are not sent again, server errors are
+    """
+
+    transport = 'requests'
+
+    def setUp(self):
+        self.server = Server().start()
+        self.dir = Path(tempfile.mkdtemp())
+        self.api = connect.VSDConnecter(authtype='basic', url=self.server.url('/api/'), transport=self.transport)
+        self.api.retryBackoff = 0.01
+        self.engine = self.api.downloader
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(str(self.dir))
+
+    def test_empty_file(self):
+        self.server.files['/empty'] = ServedFile(b'')
+        for fetch in (lambda url: self.engine.fetch(url, self.dir / 'empty.bin'), self.engine.fetchInto):
+            del self.server.log[:]
+            fetch(self.server.url('/empty'))
+            # the range probe answered with 416, then the whole file
+            self.assertEqual([r['range'] is not None for r in self.server.log], [True, False])
+        self.assertEqual((self.dir / 'empty.bin').read_bytes(), b'')
+
+    def test_not_found(self):
+        for status in (403, 404):
+            del self.server.log[:]
+            self.server.routes[('GET', '/missing')] = lambda h: h.reply(status, b'')
+            with self.assertRaises(requests.exceptions.HTTPError):
+                self.engine.fetch(self.server.url('/missing'), self.dir / 'missing.bin')
+            self.assertEqual(len(self.server.log), 1)
+
+    def test_server_errors_retried(self):
+        calls = list()
+
+        def flaky(h):
+            calls.append(1)
+            if len(calls) < 3:
+                h.reply(503 if len(calls) == 1 else 429, b'')
+            else:
+                h.reply(200, b'data', {'Content-Type': 'application/octet-stream'})
+
+        self.server.routes[('GET', '/flaky')] = flaky
+        self.engine.fetch(self.server.url('/flaky'), self.dir / 'flaky.bin')
+        self.assertEqual(len(calls), 3)
+        self.assertEqual((self.dir / 'flaky.bin').read_bytes(), b'data')
+
+
+@unittest.skipIf(httpx is None, 'httpx is not installed')
+class HttpxRequestCountTest(RequestCountTest):
+    transport = 'httpx'
+
+
+if __name__ == '__main__':
+    unittest.main()
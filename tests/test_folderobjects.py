@@ -0,0 +1,58 @@
+import unittest
+
+import vsdConnect.models as vsdModels
+from vsdConnect import connect
+
+URL = 'https://127.0.0.1:1/api/'
+
+
+class FolderObjectsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.api = connect.VSDConnecter(authtype='basic', url=URL)
+        self.puts = list()
+        self.response = None
+        self.api.putRequest = self.putRequest
+        self.folder = vsdModels.Folder(selfUrl=URL + 'folders/1', id=1, name='f', containedObjects=[
+            vsdModels.APIBase(selfUrl=URL + 'objects/1'), vsdModels.APIBase(selfUrl=URL + 'objects/2')])
+
+    def putRequest(self, resource, data):
+        self.puts.append(data)
+        return self.response
+
+    def contained(self):
+        return [o.selfUrl for o in self.folder.containedObjects]
+
+    def test_add_sends_one_update(self):
+        self.response = dict(selfUrl=URL + 'folders/1', id=1, name='f')
+        res = self.api.addObjectsToFolder(self.folder, [URL + 'objects/2', URL + 'objects/3', URL + 'objects/4'])
+        self.assertIsInstance(res, vsdModels.Folder)
+        self.assertEqual(len(self.puts), 1)
+        self.assertEqual([o['selfUrl'] for o in self.puts[0]['containedObjects']],
+                         [URL + 'objects/1', URL + 'objects/2', URL + 'objects/3', URL + 'objects/4'])
+        self.assertEqual(self.contained(), [URL + 'objects/1', URL + 'objects/2', URL + 'objects/3',
+                                            URL + 'objects/4'])
+
+    def test_add_present_sends_nothing(self):
+        self.assertIs(self.api.addObjectsToFolder(self.folder, [URL + 'objects/1']), self.folder)
+        self.assertEqual(self.puts, [])
+
+    def test_failed_add_keeps_folder(self):
+        self.assertIsNone(self.api.addObjectsToFolder(self.folder, [URL + 'objects/3']))
+        self.assertEqual(len(self.puts), 1)
+        self.assertEqual(self.contained(), [URL + 'objects/1', URL + 'objects/2'])
+
+    def test_remove(self):
+        self.response = dict(selfUrl=URL + 'folders/1', id=1, name='f')
+        self.assertTrue(self.api.removeObjectsFromFolder(self.folder, [URL + 'objects/1', URL + 'objects/9']))
+        self.assertEqual(self.contained(), [URL + 'objects/2'])
+
+    def test_failed_remove_keeps_folder(self):
+        self.assertFalse(self.api.removeObjectsFromFolder(self.folder, [URL + 'objects/1']))
+        self.assertFalse(self.api.removeObjectFromFolder(self.folder, vsdModels.APIBase(selfUrl=URL + 'objects/2')))
+        self.assertEqual(len(self.puts), 2)
+        self.assertEqual(self.contained(), [URL + 'objects/1', URL + 'objects/2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
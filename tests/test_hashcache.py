@@ -0,0 +1,77 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from vsdConnect.hashcache import HashCache
+
+
+class HashCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = os.path.join(self.dir, 'hashes.sqlite')
+        self.files = list()
+        for i in range(3):
+            fp = os.path.join(self.dir, 'f{0}.bin'.format(i))
+            with open(fp, 'wb') as f:
+                f.write(os.urandom(10000 + i))
+            self.files.append(fp)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def sha1(self, fp):
+        with open(fp, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest().upper()
+
+    def test_sha1_persists_without_close(self):
+        cache = HashCache(self.db)
+        for fp in self.files:
+            self.assertEqual(cache.sha1(fp), self.sha1(fp))
+        self.assertEqual(cache.misses, 3)
+
+        # a second session while the first one is still open, nothing flushed explicitly
+        reopened = HashCache(self.db)
+        for fp in self.files:
+            self.assertEqual(reopened.sha1(fp), self.sha1(fp))
+        self.assertEqual((reopened.hits, reopened.misses), (3, 0))
+        reopened.close()
+        cache.close()
+
+    def test_put_commits_after_commit_seconds(self):
+        cache = HashCache(self.db, commitSeconds=0)
+        st = os.stat(self.files[0])
+        cache.put(self.files[0], st, self.sha1(self.files[0]))
+
+        reopened = HashCache(self.db)
+        self.assertEqual(reopened.get(self.files[0]), self.sha1(self.files[0]))
+        reopened.close()
+        cache.close()
+
+    def test_close_writes_pending(self):
+        cache = HashCache(self.db, commitEvery=1000, commitSeconds=3600)
+        for fp in self.files:
+            cache.put(fp, os.stat(fp), self.sha1(fp))
+        cache.close()
+
+        reopened = HashCache(self.db)
+        self.assertEqual(len(reopened), 3)
+        reopened.close()
+
+    def test_modified_file_is_hashed_again(self):
+        cache = HashCache(self.db)
+        cache.sha1(self.files[0])
+        cache.close()
+        with open(self.files[0], 'ab') as f:
+            f.write(b'more')
+
+        reopened = HashCache(self.db)
+        self.assertEqual(reopened.sha1(self.files[0]), self.sha1(self.files[0]))
+        self.assertEqual((reopened.hits, reopened.misses), (0, 1))
+        reopened.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from vsdConnect.hashing import BulkHasher, mmapSha1
+
+
+class BulkHasherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dir, 'sub'))
+        self.expected = dict()
+        for i, name in enumerate(['a.bin', 'empty.bin', os.path.join('sub', 'b.bin')]):
+            fp = os.path.join(self.dir, name)
+            data = os.urandom(5000 * i)
+            with open(fp, 'wb') as f:
+                f.write(data)
+            self.expected[fp] = hashlib.sha1(data).hexdigest().upper()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_mmap_sha1(self):
+        for fp, sha1 in self.expected.items():
+            self.assertEqual(mmapSha1(fp, bufsize=4096), sha1)
+
+    def test_directory(self):
+        self.assertEqual(dict(BulkHasher(2).hash(self.dir)), self.expected)
+
+    def test_iterable(self):
+        self.assertEqual(dict(BulkHasher(2).hash([Path(fp) for fp in self.expected])), self.expected)
+
+    def test_single_file(self):
+        fp = os.path.join(self.dir, 'a.bin')
+        self.assertEqual(list(BulkHasher(2).hash(fp)), [(fp, self.expected[fp])])
+        self.assertEqual(list(BulkHasher(2).hash(Path(fp))), [(fp, self.expected[fp])])
+
+    def test_duplicate_paths(self):
+        fp = os.path.join(self.dir, 'a.bin')
+        paths = [fp, Path(fp), os.path.join(self.dir, 'sub', '..', 'a.bin')] + list(self.expected)
+        self.assertEqual(sorted(BulkHasher(2).hash(paths)), sorted(self.expected.items()))
+
+    def test_missing_file_fails(self):
+        hasher = BulkHasher(2)
+        self.assertEqual(list(hasher.hash(os.path.join(self.dir, 'missing.bin'))), [])
+        self.assertEqual(len(hasher.failed), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
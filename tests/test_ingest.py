@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from vsdConnect import connect
+from vsdConnect.ingest import Ingest
+
+from vsdserver import FakeVSD
+
+
+class IngestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeVSD().start()
+        self.server.rpp = 2
+        self.dir = Path(tempfile.mkdtemp())
+        self.data = dict()
+        for rel in ('top.bin', 'a/one.bin', 'a/two.bin', 'a/c/three.bin', 'b/four.bin'):
+            fp = self.dir / rel
+            fp.parent.mkdir(parents=True, exist_ok=True)
+            self.data[rel] = os.urandom(1000 + len(rel))
+            fp.write_bytes(self.data[rel])
+        self.api = connect.VSDConnecter(authtype='basic', url=self.server.u(''))
+        self.api.maxAttempts = 2
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(str(self.dir))
+
+    def folder(self, path):
+        folder = self.server.root
+        for name in path.split('/') if path else []:
+            children = [self.server.folders[int(c['selfUrl'].rsplit('/', 1)[1])] for c in folder['childFolders']]
+            folder = [c for c in children if c['name'] == name][0]
+        return folder
+
+    def contents(self, path):
+        names = list()
+        for o in self.folder(path)['containedObjects']:
+            obj = self.server.objects[int(o['selfUrl'].rsplit('/', 1)[1])]
+            names.append(obj['name'])
+        return sorted(names)
+
+    def test_run(self):
+        # an existing folder is used, among other folders of the server
+        existing = self.server.addFolder('a', self.server.root)
+        for i in range(5):
+            self.server.addFolder('other{0}'.format(i), existing)
+        result = Ingest(self.api, self.dir, workers=3).run(self.server.root['selfUrl'])
+
+        self.assertEqual(result.failed, [])
+        self.assertEqual(result.foldersCreated, 2)
+        self.assertEqual(self.folder('a'), existing)
+        self.assertEqual(self.contents(''), ['top.bin'])
+        self.assertEqual(self.contents('a'), ['one.bin', 'two.bin'])
+        self.assertEqual(self.contents('a/c'), ['three.bin'])
+        self.assertEqual(self.contents('b'), ['four.bin'])
+        for obj in self.server.objects.values():
+            f = self.server.vsdFiles[int(self.server.objectFiles[obj['id']][0].rsplit('/', 1)[1])]
+            rel = [r for r in self.data if r.endswith('/' + obj['name']) or r == obj['name']][0]
+            self.assertEqual(self.server.fileData(f), self.data[rel])
+
+    def test_folders_listed_once(self):
+        parent = self.server.addFolder('a', self.server.root)
+        others = [self.server.addFolder('other{0}'.format(i), parent) for i in range(6)]
+        Ingest(self.api, self.dir, workers=3).run(self.server.root['selfUrl'])
+        gets = [r['path'] for r in self.server.log if r['method'] == 'GET']
+        # the 8 folders in pages of 2, no request per child folder
+        self.assertEqual(gets.count('/api/folders'), 4)
+        for other in others:
+            self.assertNotIn('/api/folders/{0}'.format(other['id']), gets)
+
+    def test_error_page_fails_the_file(self):
+        self.server.fail('POST', 'upload', 502, b'<html>Bad Gateway</html>')
+        self.server.fail('POST', 'upload', 500, b'')
+        result = Ingest(self.api, self.dir, workers=1).run(self.server.root['selfUrl'])
+        self.assertEqual(len(result.failed), 2)
+        self.assertEqual(len(self.server.objects), len(self.data) - 2)
+
+        # the next run uploads the failed files only
+        result = Ingest(self.api, self.dir, workers=1).run(self.server.root['selfUrl'])
+        self.assertEqual(result.failed, [])
+        self.assertEqual(result.resumed, len(self.data) - 2)
+        self.assertEqual(len(self.server.objects), len(self.data))
+
+
+if __name__ == '__main__':
+    unittest.main()
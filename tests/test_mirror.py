@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from vsdConnect import connect
+from vsdConnect.mirror import FolderMirror, MirrorManifest
+
+from vsdserver import FakeVSD
+
+
+class FolderMirrorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeVSD().start()
+        self.dir = Path(tempfile.mkdtemp())
+        self.target = self.dir / 'mirror'
+        self.sub = self.server.addFolder('sub', self.server.root)
+        self.datas = [os.urandom(3000 + i) for i in range(3)]
+        self.first = self.server.addObject('first', self.datas[:2], self.server.root)
+        self.second = self.server.addObject('second', self.datas[2:], self.sub)
+        # the same content as a file of first
+        self.copy = self.server.addObject('copy', self.datas[:1], self.sub)
+        self.api = connect.VSDConnecter(authtype='basic', url=self.server.u(''), blobstore=self.dir / 'store')
+        self.api.maxAttempts = 1
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(str(self.dir))
+
+    def mirror(self, target=None, delete=False, workers=2):
+        return FolderMirror(self.api, target or self.target, workers=workers).run(self.server.root['selfUrl'],
+                                                                                  delete=delete)
+
+    def path(self, obj, n, folder=''):
+        return Path(self.target, folder, '{0}_{1}'.format(obj['id'], obj['name']),
+                    '{0}_{1}.dcm'.format(obj['name'], n))
+
+    def downloads(self):
+        return len([r for r in self.server.log if r['path'].endswith('/download')])
+
+    def test_run(self):
+        result = self.mirror()
+        self.assertEqual(result.failed, [])
+        self.assertEqual((result.folders, result.objects, result.files), (2, 3, 4))
+        self.assertEqual((result.downloaded, result.skipped, result.removed), (4, 0, 0))
+        self.assertEqual(self.path(self.first, 0).read_bytes(), self.datas[0])
+        self.assertEqual(self.path(self.first, 1).read_bytes(), self.datas[1])
+        self.assertEqual(self.path(self.second, 0, 'sub').read_bytes(), self.datas[2])
+        self.assertEqual(self.path(self.copy, 0, 'sub').read_bytes(), self.datas[0])
+        manifest = MirrorManifest.load(self.target)
+        self.assertEqual(manifest.folder, self.server.root['selfUrl'])
+        self.assertEqual(len(manifest.files), 4)
+
+    def test_unchanged_files_skipped(self):
+        self.mirror()
+        downloads = self.downloads()
+        result = self.mirror()
+        self.assertEqual((result.downloaded, result.skipped, result.failed), (0, 4, []))
+        self.assertEqual(self.downloads(), downloads)
+
+        # a file modified locally is transferred again
+        fp = self.path(self.second, 0, 'sub')
+        fp.write_bytes(os.urandom(len(self.datas[2])))
+        st = fp.stat()
+        os.utime(str(fp), ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        result = self.mirror()
+        self.assertEqual((result.downloaded, result.skipped), (1, 3))
+        self.assertEqual(fp.read_bytes(), self.datas[2])
+
+    def test_removed_files(self):
+        self.mirror()
+        self.sub['containedObjects'] = [o for o in self.sub['containedObjects']
+                                        if o['selfUrl'] != self.second['selfUrl']]
+        result = self.mirror()
+        self.assertEqual((result.objects, result.skipped, result.removed), (2, 3, 1))
+        # only dropped from the manifest
+        self.assertTrue(self.path(self.second, 0, 'sub').exists())
+        self.assertEqual(len(MirrorManifest.load(self.target).files), 3)
+
+        self.server.root['containedObjects'] = list()
+        result = self.mirror(delete=True)
+        self.assertEqual(result.removed, 2)
+        self.assertFalse(self.path(self.first, 0).exists())
+        self.assertFalse(self.path(self.first, 1).exists())
+        self.assertTrue(self.path(self.copy, 0, 'sub').exists())
+
+    def test_listing_error_prunes_nothing(self):
+        self.mirror()
+        self.server.fail('GET', 'objects/{0}'.format(self.second['id']), 500)
+        result = self.mirror(delete=True)
+        self.assertEqual([what for what, err in result.failed], [self.second['selfUrl']])
+        self.assertEqual(result.removed, 0)
+        self.assertTrue(self.path(self.second, 0, 'sub').exists())
+        self.assertEqual(len(MirrorManifest.load(self.target).files), 4)
+
+    def test_blob_store_reused(self):
+        # one file after the other, the copy is taken from the store
+        result = self.mirror(workers=1)
+        self.assertEqual(result.downloaded, 4)
+        self.assertEqual(self.downloads(), 3)
+
+        # another mirror of the same files transfers nothing over the network
+        other = self.dir / 'other'
+        result = self.mirror(other)
+        self.assertEqual((result.downloaded, result.skipped, result.failed), (4, 0, []))
+        self.assertEqual(self.downloads(), 3)
+        for fp in self.target.rglob('*.dcm'):
+            self.assertEqual((other / fp.relative_to(self.target)).read_bytes(), fp.read_bytes())
+
+
+if __name__ == '__main__':
+    unittest.main()
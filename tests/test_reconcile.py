@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from vsdConnect import connect
+from vsdConnect.models import APIBase
+from vsdConnect.reconcile import Reconciler, RemoteIndex
+
+from vsdserver import FakeVSD
+
+
+class ReconcileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeVSD().start()
+        self.dir = Path(tempfile.mkdtemp())
+        sub = self.server.addFolder('sub', self.server.root)
+        self.datas = [os.urandom(2000 + i) for i in range(4)]
+        self.first = self.server.addObject('first', self.datas[:2], self.server.root)
+        self.second = self.server.addObject('second', self.datas[2:3], sub)
+        # on the server only
+        self.server.addObject('extra', [b'extra'], sub)
+        for i, data in enumerate(self.datas):
+            (self.dir / '{0}.bin'.format(i)).write_bytes(data)
+        self.api = connect.VSDConnecter(authtype='basic', url=self.server.u(''))
+        self.api.maxAttempts = 1
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(str(self.dir))
+
+    def test_run(self):
+        result = Reconciler(self.api, workers=2).run(self.dir, self.server.root['selfUrl'])
+        self.assertEqual(sorted(Path(fp).name for fp in result.present), ['0.bin', '1.bin', '2.bin'])
+        self.assertEqual([Path(fp).name for fp in result.missing], ['3.bin'])
+        self.assertEqual(len(result.extra), 1)
+        self.assertEqual(result.failed, [])
+
+    def test_server_errors_fail(self):
+        self.server.fail('GET', r'objects/{0}/files'.format(self.second['id']), 500)
+        with self.assertLogs('vsdConnect.dedup', 'WARNING'):
+            result = Reconciler(self.api, workers=2).run(self.dir, self.server.root['selfUrl'])
+        self.assertEqual([url for url, err in result.failed], [self.second['selfUrl']])
+        self.assertEqual(sorted(Path(fp).name for fp in result.missing), ['2.bin', '3.bin'])
+
+    def test_index_extended_after_errors(self):
+        self.server.fail('GET', r'objects/{0}'.format(self.first['id']), 503)
+        objects = [APIBase(selfUrl=o['selfUrl']) for o in (self.first, self.second)]
+        index = RemoteIndex()
+        self.assertEqual(index.addObjects(self.api, objects, workers=2), 1)
+        self.assertEqual(list(index.failed), [self.first['selfUrl']])
+
+        # the failed object is fetched again, the other one is not
+        result = Reconciler(self.api).run(self.dir, objects, index=index)
+        self.assertEqual(index.failed, dict())
+        self.assertEqual(result.failed, [])
+        self.assertEqual(len(result.present), 3)
+        gets = [r['path'] for r in self.server.log if r['method'] == 'GET']
+        self.assertEqual(gets.count('/api/objects/{0}'.format(self.second['id'])), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
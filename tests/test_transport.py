@@ -0,0 +1,263 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from pathlib import Path
+
+import requests
+
+from vsdConnect import connect
+from vsdConnect.connect import Deadline, DeadlineExceeded
+from vsdConnect.upload import MultipartFile
+
+from httpserver import Server
+from vsdserver import FakeVSD
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+
+class TransportTest(unittest.TestCase):
+    """
+    the connecter behaves the same with every transport
+    """
+
+    transport = 'requests'
+
+    def setUp(self):
+        self.server = Server().start()
+        self.api = connect.VSDConnecter(authtype='basic', url=self.server.url('/api/'), username='user',
+                                        password='secret', timeout=(2, 2), transport=self.transport)
+        self.api.maxAttempts = 2
+
+    def tearDown(self):
+        self.api.transport.close()
+        self.server.stop()
+
+    def route(self, method, path, fn):
+        self.server.routes[(method, '/api/' + path)] = fn
+
+    def test_get_json(self):
+        self.route('GET', 'objects', lambda h: h.reply(200, dict(
+            path=h.path, auth=h.headers.get('Authorization'), items=[dict(selfUrl='objects/1')])))
+        res = self.api.getRequest('objects', rpp=10)
+        # parameters that are None are not sent
+        self.assertEqual(res['path'], '/api/objects?rpp=10')
+        self.assertTrue(res['auth'].startswith('Basic '))
+        self.assertEqual(res['items'], [dict(selfUrl='objects/1')])
+
+    def test_http_error(self):
+        self.route('GET', 'missing', lambda h: h.reply(404, dict(error='not found')))
+        with self.assertRaises(requests.exceptions.HTTPError) as ctx:
+            self.api.getRequest('missing')
+        self.assertEqual(ctx.exception.response.status_code, 404)
+
+    def test_retry_after_server_error(self):
+        calls = list()
+
+        def flaky(h):
+            calls.append(1)
+            h.reply(500 if len(calls) == 1 else 200, dict(calls=len(calls)))
+
+        self.route('GET', 'flaky', flaky)
+        self.assertEqual(self.api.getRequest('flaky'), dict(calls=2))
+
+    def test_timeout(self):
+        def slow(h):
+            time.sleep(1)
+            h.reply(200, dict())
+
+        self.route('GET', 'slow', slow)
+        self.api.maxAttempts = 1
+        with self.assertRaises(requests.exceptions.Timeout):
+            self.api.getRequest('slow', timeout=(2, 0.2))
+
+    def test_post_json(self):
+        self.route('POST', 'folders', lambda h: h.reply(200, dict(
+            contentType=h.headers.get('Content-Type'), data=json.loads(h.body().decode('utf-8')))))
+        res = self.api.postRequest('folders', dict(name='f', parentFolder=dict(selfUrl='folders/1')))
+        self.assertEqual(res['contentType'], 'application/json')
+        self.assertEqual(res['data'], dict(name='f', parentFolder=dict(selfUrl='folders/1')))
+
+    def test_put_json(self):
+        self.route('PUT', 'objects', lambda h: h.reply(200, json.loads(h.body().decode('utf-8'))))
+        self.assertEqual(self.api.putRequest('objects', dict(id=1)), dict(id=1))
+
+    def test_post_streamed_multipart(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            fp = Path(tmp, 'image.dcm')
+            data = os.urandom(300 * 1024)
+            fp.write_bytes(data)
+            self.route('POST', 'upload', lambda h: h.reply(200, dict(
+                contentType=h.headers.get('Content-Type'), length=int(h.headers['Content-Length']),
+                found=data in h.body())))
+            body = MultipartFile(fp, filename='image.dcm')
+            res = self.api._post(self.server.url('/api/upload'), data=body, headers=body.headers())
+        finally:
+            shutil.rmtree(tmp)
+        self.assertTrue(res['contentType'].startswith('multipart/form-data; boundary='))
+        self.assertEqual(res['length'], len(body))
+        self.assertTrue(res['found'])
+
+    def test_compressed_response(self):
+        items = [dict(selfUrl='objects/{0}'.format(i), name='object') for i in range(1000)]
+        raw = json.dumps(dict(items=items)).encode('utf-8')
+        self.route('GET', 'objects/5/files', lambda h: h.reply(200, gzip.compress(raw), {
+            'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}))
+        self.assertEqual(self.api.getRequest('objects/5/files')['items'], items)
+        self.assertIn('gzip', self.server.log[-1]['acceptEncoding'])
+
+        stats = self.api.getTransferStats().endpoints['GET /api/objects/{id}/files']
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['bodyBytes'], len(raw))
+        self.assertLess(stats['wireBytes'], len(raw))
+        self.assertEqual(stats['encodings'], dict(gzip=1))
+
+    def test_accept_encoding(self):
+        codings = [c.strip() for c in self.api.transport.acceptEncoding().split(',')]
+        self.assertIn('gzip', codings)
+        self.assertNotIn('identity', codings)
+
+
+@unittest.skipIf(httpx is None, 'httpx is not installed')
+class HttpxTransportTest(TransportTest):
+    transport = 'httpx'
+
+
+@unittest.skipIf(httpx is None or h2 is None, 'httpx[http2] is not installed')
+class Http2TransportTest(TransportTest):
+    transport = 'http2'
+
+
+class DeadlineTest(unittest.TestCase):
+
+    def test_clamp(self):
+        deadline = Deadline(5)
+        left = deadline.remaining()
+        self.assertTrue(4 < left <= 5)
+        connect_, read = deadline.clamp(None)
+        self.assertTrue(4 < connect_ <= 5 and 4 < read <= 5)
+        self.assertEqual(deadline.clamp(1), 1)
+        self.assertEqual(deadline.clamp((2, 3)), (2, 3))
+        connect_, read = deadline.clamp((2, 30))
+        self.assertEqual(connect_, 2)
+        self.assertTrue(4 < read <= 5)
+        self.assertTrue(4 < deadline.clamp((None, 1))[0] <= 5)
+
+    def test_expired(self):
+        deadline = Deadline(0)
+        self.assertTrue(deadline.expired())
+        with self.assertRaises(DeadlineExceeded):
+            deadline.clamp(10)
+        # a timeout of requests, caught like one
+        self.assertTrue(issubclass(DeadlineExceeded, requests.exceptions.Timeout))
+
+
+class DeadlineRequestTest(unittest.TestCase):
+    """
+    deadlines and the retry budget limit the time of requests
+    """
+
+    transport = 'requests'
+
+    def setUp(self):
+        self.server = FakeVSD().start()
+        self.api = connect.VSDConnecter(authtype='basic', url=self.server.u(''), timeout=(2, 2),
+                                        transport=self.transport)
+        self.api.retryBackoff = 0.05
+
+    def tearDown(self):
+        self.api.transport.close()
+        self.server.stop()
+
+    def test_nested_deadlines_only_shorten(self):
+        with self.api.deadline(0.5) as outer:
+            with self.api.deadline(10) as inner:
+                self.assertIs(inner, outer)
+            with self.api.deadline(0.1) as inner:
+                self.assertLessEqual(inner.remaining(), 0.1)
+                self.assertIs(self.api._deadline(), inner)
+            self.assertIs(self.api._deadline(), outer)
+        self.assertIsNone(self.api._deadline())
+
+    def test_deadline_is_per_thread(self):
+        seen = list()
+        with self.api.deadline(5):
+            t = threading.Thread(target=lambda: seen.append(self.api._deadline()))
+            t.start()
+            t.join()
+        self.assertEqual(seen, [None])
+
+    def test_retry_budget(self):
+        self.server.fail('GET', 'folders/1', 503, times=100)
+        self.api.retrySeconds = 0.5
+        self.api.retryBackoff = 0.2
+        start = time.time()
+        with self.assertRaises(DeadlineExceeded):
+            self.api.getFolder(1)
+        self.assertLess(time.time() - start, 1.5)
+        self.assertLess(len(self.server.log), self.api.maxAttempts)
+
+    def test_backoff(self):
+        self.server.fail('GET', 'folders/1', 503, times=2)
+        self.api.retryBackoff = 0.1
+        start = time.time()
+        self.assertEqual(self.api.getFolder(1).name, 'root')
+        # 0.1 and 0.2 seconds before the second and third attempt
+        self.assertGreaterEqual(time.time() - start, 0.3)
+        self.assertEqual(len(self.server.log), 3)
+
+    def test_timeout_limited_by_deadline(self):
+        self.server.delay = 1
+        start = time.time()
+        with self.assertRaises(requests.exceptions.Timeout):
+            with self.api.deadline(0.3):
+                self.api.getFolder(1)
+        self.assertLess(time.time() - start, 0.9)
+
+    def test_get_all_paginated(self):
+        self.server.rpp = 1
+        for i in range(5):
+            self.server.addFolder('f{0}'.format(i), self.server.root)
+        self.assertEqual(len(self.api.getAllPaginated('folders', deadline=5)), 6)
+        self.server.delay = 0.15
+        with self.assertRaises(DeadlineExceeded):
+            self.api.getAllPaginated('folders', deadline=0.5)
+
+    def test_walk_folder(self):
+        parent = self.server.root
+        for i in range(5):
+            parent = self.server.addFolder('f{0}'.format(i), parent)
+        self.server.delay = 0.15
+        walked = list()
+        with self.assertRaises(DeadlineExceeded):
+            for folder, dirs, objects in self.api.walkFolder(self.server.root['selfUrl'], deadline=0.5):
+                walked.append(folder.name)
+        self.assertTrue(1 <= len(walked) < 6)
+
+        # the deadline is not active in the code of the caller between the folders
+        self.server.delay = 0
+        for folder, dirs, objects in self.api.walkFolder(self.server.root['selfUrl'], deadline=5):
+            self.assertIsNone(self.api._deadline())
+
+
+@unittest.skipIf(httpx is None, 'httpx is not installed')
+class HttpxDeadlineRequestTest(DeadlineRequestTest):
+    transport = 'httpx'
+
+
+if __name__ == '__main__':
+    unittest.main()
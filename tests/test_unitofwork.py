@@ -0,0 +1,126 @@
+import unittest
+
+import vsdConnect.models as vsdModels
+from vsdConnect import connect
+
+from vsdserver import FakeVSD
+
+
+class UnitOfWorkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeVSD().start()
+        self.api = connect.VSDConnecter(authtype='basic', url=self.server.u(''))
+        self.api.maxAttempts = 1
+        urls = [self.server.addObject(name, [name.encode('ascii')])['selfUrl'] for name in ('a', 'b', 'c')]
+        self.a, self.b, self.c = [self.api.getObject(url) for url in urls]
+        self.folder = self.api.getFolder(self.server.addFolder('target', self.server.root)['selfUrl'])
+        self.group = vsdModels.Group(id=1, selfUrl=self.server.u('groups/1'))
+        self.user = vsdModels.User(id=2, selfUrl=self.server.u('users/2'))
+        self.read, self.edit = [vsdModels.ObjectRight(selfUrl=self.server.u('object-rights/{0}'.format(i)))
+                                for i in (1, 2)]
+        del self.server.log[:]
+
+    def tearDown(self):
+        self.server.stop()
+
+    def requests(self):
+        return [(r['method'], r['path'][len('/api/'):]) for r in self.server.log]
+
+    def contained(self):
+        return [o['selfUrl'] for o in self.server.folders[self.folder.id]['containedObjects']]
+
+    def test_merged_and_ordered(self):
+        with self.api.unitOfWork(workers=4) as uow:
+            self.a.name = 'first'
+            uow.putObject(self.a)
+            self.a.name = 'renamed'
+            uow.putObject(self.a)
+            uow.addObjectToFolder(self.folder, self.a)
+            uow.addObjectsToFolder(self.folder, [self.b, self.c])
+            uow.removeObjectFromFolder(self.folder, self.c)
+            uow.postObjectGroupRights(self.a, self.group, [self.read])
+            uow.postObjectGroupRights(self.a, self.group, [self.edit, self.read])
+            uow.addLink(self.a, self.b)
+            uow.addLink(self.b, self.a)
+            self.assertEqual(self.server.log, [])
+
+        result = uow.result
+        self.assertEqual((result.recorded, result.issued, result.avoided, result.failed), (9, 4, 5, []))
+        # the object is updated before the requests referring to it
+        requests = self.requests()
+        self.assertEqual(requests[0], ('PUT', 'objects/{0}'.format(self.a.id)))
+        self.assertEqual(sorted(requests[1:]), [('POST', 'object-group-rights'), ('POST', 'object-links'),
+                                                ('PUT', 'folders')])
+
+        self.assertEqual(self.server.objects[self.a.id]['name'], 'renamed')
+        self.assertEqual(self.contained(), [self.a.selfUrl, self.b.selfUrl])
+        posted = dict(self.server.posted)
+        self.assertEqual(posted['object-group-rights']['relatedRights'],
+                         [dict(selfUrl=self.read.selfUrl), dict(selfUrl=self.edit.selfUrl)])
+        self.assertEqual(posted['object-group-rights']['relatedGroup'], dict(selfUrl=self.group.selfUrl))
+        self.assertEqual(posted['object-links']['object1'], dict(selfUrl=self.a.selfUrl))
+        self.assertEqual(posted['object-links']['object2'], dict(selfUrl=self.b.selfUrl))
+
+    def test_block_raises(self):
+        with self.assertRaises(KeyError):
+            with self.api.unitOfWork() as uow:
+                uow.putObject(self.a)
+                uow.addObjectToFolder(self.folder, self.a)
+                uow.addLink(self.a, self.b)
+                raise KeyError('stop')
+        self.assertEqual(self.server.log, [])
+        self.assertEqual((uow.result.recorded, uow.result.discarded, uow.result.issued), (3, 3, 0))
+
+        # the discarded changes are not sent by the next flush
+        uow.flush()
+        self.assertEqual(self.server.log, [])
+
+    def test_failure_mid_commit(self):
+        self.server.fail('PUT', 'objects/{0}'.format(self.a.id), 500)
+        self.server.fail('POST', 'object-links', 500)
+        with self.api.unitOfWork(workers=2) as uow:
+            for obj in (self.a, self.b):
+                obj.name = 'renamed'
+                uow.putObject(obj)
+            uow.addObjectsToFolder(self.folder, [self.a, self.b])
+            uow.postObjectUserRights(self.b, self.user, [self.read])
+            uow.addLink(self.a, self.b)
+
+        # the failed requests are reported, the others are sent
+        self.assertEqual(sorted(uow.result.failed), [(self.a.selfUrl, 'link not created'),
+                                                     (self.a.selfUrl, 'update failed')])
+        self.assertEqual(uow.result.issued, 5)
+        self.assertEqual(self.server.objects[self.a.id]['name'], 'a')
+        self.assertEqual(self.server.objects[self.b.id]['name'], 'renamed')
+        self.assertEqual(self.contained(), [self.a.selfUrl, self.b.selfUrl])
+        self.assertEqual([resource for resource, data in self.server.posted], ['object-user-rights'])
+
+    def test_error_page_fails(self):
+        self.server.fail('POST', 'object-group-rights', 502, b'<html>Bad Gateway</html>')
+        with self.api.unitOfWork() as uow:
+            uow.postObjectGroupRights(self.a, self.group, [self.read])
+            uow.addLink(self.a, self.b)
+        self.assertEqual([what for what, err in uow.result.failed], [self.a.selfUrl])
+        self.assertEqual([resource for resource, data in self.server.posted], ['object-links'])
+
+    def test_rights_and_links(self):
+        right = self.api.postObjectUserRights(self.a, self.user, [self.read, self.edit])
+        self.assertIsInstance(right, vsdModels.ObjectUserRight)
+        self.assertIsNotNone(right.id)
+        self.assertEqual(right.selfUrl, self.server.u('object-user-rights/{0}'.format(right.id)))
+        self.assertEqual(right.relatedUser.selfUrl, self.user.selfUrl)
+        self.assertEqual([r.selfUrl for r in right.relatedRights], [self.read.selfUrl, self.edit.selfUrl])
+
+        right = self.api.postObjectGroupRights(self.a, self.group, [self.read])
+        self.assertIsInstance(right, vsdModels.ObjectGroupRight)
+        self.assertEqual(right.relatedObject.selfUrl, self.a.selfUrl)
+
+        link = self.api.addLink(self.a, self.b)
+        self.assertEqual(link['object1'], dict(selfUrl=self.a.selfUrl))
+        self.assertEqual(link['object2'], dict(selfUrl=self.b.selfUrl))
+        self.assertIsNotNone(link['selfUrl'])
+
+
+if __name__ == '__main__':
+    unittest.main()
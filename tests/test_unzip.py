@@ -0,0 +1,197 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from pathlib import Path
+
+import vsdConnect.models as vsdModels
+from vsdConnect import connect
+from vsdConnect.unzip import BadZipFile, MemberHandler, ZipStreamParser
+
+from httpserver import Server, ServedFile
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class _Unseekable(io.RawIOBase):
+    # a stream zipfile cannot seek in, the members get data descriptors
+
+    def __init__(self):
+        self.buf = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        return self.buf.write(b)
+
+
+def makeZip(members, unseekable=False, zip64=False):
+    """
+    :param list members: (name, data, compression)
+    :return: the ZIP file
+    :rtype: bytes
+    """
+    out = _Unseekable() if unseekable else io.BytesIO()
+    with zipfile.ZipFile(out, 'w') as z:
+        for name, data, compression in members:
+            info = zipfile.ZipInfo(name)
+            info.compress_type = compression
+            with z.open(info, 'w', force_zip64=zip64) as f:
+                f.write(data)
+    return (out.buf if unseekable else out).getvalue()
+
+
+MEMBERS = [
+    ('series/1.dcm', os.urandom(200 * 1024), zipfile.ZIP_STORED),
+    ('series/2.dcm', b'dicom ' * 50000, zipfile.ZIP_DEFLATED),
+    ('series/empty.txt', b'', zipfile.ZIP_DEFLATED),
+    ('report.txt', b'text ' * 1000, zipfile.ZIP_DEFLATED),
+]
+
+
+class ZipStreamParserTest(unittest.TestCase):
+
+    def parse(self, data, chunk=None, members=None):
+        extracted = dict()
+        handler = MemberHandler(callback=lambda name, d: extracted.__setitem__(name, bytes(d)), members=members)
+        parser = ZipStreamParser(handler)
+        chunk = chunk or len(data)
+        for i in range(0, len(data), chunk):
+            parser.feed(data[i:i + chunk])
+        parser.close()
+        self.assertEqual(sorted(handler.members), sorted(extracted))
+        return extracted
+
+    def expected(self, names=None):
+        return dict((name, data) for name, data, c in MEMBERS if names is None or name in names)
+
+    def test_chunks(self):
+        data = makeZip(MEMBERS)
+        for chunk in (None, 1, 7, 4096):
+            self.assertEqual(self.parse(data, chunk), self.expected())
+
+    def test_data_descriptors(self):
+        members = [m for m in MEMBERS if m[2] == zipfile.ZIP_DEFLATED]
+        data = makeZip(members, unseekable=True)
+        self.assertTrue(all(i.flag_bits & 0x08 for i in zipfile.ZipFile(io.BytesIO(data)).infolist()))
+        for chunk in (None, 3, 1000):
+            self.assertEqual(self.parse(data, chunk), dict((n, d) for n, d, c in members))
+
+    def test_zip64(self):
+        self.assertEqual(self.parse(makeZip(MEMBERS, zip64=True), 999), self.expected())
+
+    def test_filter(self):
+        data = makeZip(MEMBERS)
+        self.assertEqual(self.parse(data, members=['series/*.dcm']), self.expected(['series/1.dcm', 'series/2.dcm']))
+        self.assertEqual(self.parse(data, members=lambda name: name == 'report.txt'), self.expected(['report.txt']))
+
+    def test_bad_crc(self):
+        data = bytearray(makeZip(MEMBERS[:1]))
+        data[100] ^= 0xff
+        with self.assertRaises(BadZipFile):
+            self.parse(bytes(data))
+
+    def test_truncated(self):
+        data = makeZip(MEMBERS)
+        with self.assertRaises(BadZipFile):
+            self.parse(data[:len(data) // 2])
+
+    def test_unsafe_names(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            handler = MemberHandler(Path(tmp, 'out'))
+            parser = ZipStreamParser(handler)
+            parser.feed(makeZip([('../evil.txt', b'1', zipfile.ZIP_STORED),
+                                 ('/abs/x.txt', b'2', zipfile.ZIP_DEFLATED)]))
+            parser.close()
+            self.assertEqual(Path(tmp, 'out', 'evil.txt').read_bytes(), b'1')
+            self.assertEqual(Path(tmp, 'out', 'abs', 'x.txt').read_bytes(), b'2')
+            self.assertEqual(sorted(os.listdir(tmp)), ['out'])
+        finally:
+            shutil.rmtree(tmp)
+
+
+class ExtractTest(unittest.TestCase):
+    """
+    ZIP files extracted while they download
+    """
+
+    transport = 'requests'
+
+    def setUp(self):
+        self.server = Server().start()
+        self.dir = Path(tempfile.mkdtemp())
+        self.zip = makeZip(MEMBERS)
+        self.file = ServedFile(self.zip)
+        self.server.files['/api/objects/1/download'] = self.file
+        self.url = self.server.url('/api/objects/1/download')
+        self.api = connect.VSDConnecter(authtype='basic', url=self.server.url('/api/'), transport=self.transport)
+        self.engine = self.api.downloader
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(str(self.dir))
+
+    def assertExtracted(self, target, names=None):
+        for name, data, c in MEMBERS:
+            if names is None or name in names:
+                self.assertEqual(Path(target, name).read_bytes(), data)
+            else:
+                self.assertFalse(Path(target, name).exists())
+
+    def test_with_ranges(self):
+        result = self.engine.extract(self.url, self.dir)
+        self.assertEqual(sorted(result.members), sorted(n for n, d, c in MEMBERS))
+        self.assertExtracted(self.dir)
+        self.assertTrue(self.server.log[0]['range'].startswith('bytes=-'))
+        self.assertFalse(any(r['range'] is None for r in self.server.log))
+
+    def test_selected_members_only(self):
+        result = self.engine.extract(self.url, self.dir, members=['report.txt'])
+        self.assertEqual(result.members, ['report.txt'])
+        self.assertExtracted(self.dir, ['report.txt'])
+        # the stored member of 200 kB is not downloaded
+        self.assertLess(result.bytes, len(self.zip) // 2)
+
+    def test_without_ranges(self):
+        self.file.ranges = False
+        result = self.engine.extract(self.url, self.dir, members=['series/*'])
+        self.assertEqual(sorted(result.members), ['series/1.dcm', 'series/2.dcm', 'series/empty.txt'])
+        self.assertExtracted(self.dir, ['series/1.dcm', 'series/2.dcm', 'series/empty.txt'])
+
+    def test_lost_connections_continue(self):
+        self.file.cut = 50 * 1024
+        self.engine.segmentAttempts = 20
+        self.engine.extract(self.url, self.dir)
+        self.assertExtracted(self.dir)
+
+    def test_callback(self):
+        extracted = dict()
+        self.engine.extract(self.url, callback=lambda name, data: extracted.__setitem__(name, bytes(data)))
+        self.assertEqual(extracted, dict((n, d) for n, d, c in MEMBERS))
+        self.assertEqual(os.listdir(str(self.dir)), [])
+
+    def test_connecter_and_models(self):
+        names = self.api.extractZip('objects/1/download', self.dir / 'a', members='report.txt')
+        self.assertEqual(names, ['report.txt'])
+        self.assertExtracted(self.dir / 'a', ['report.txt'])
+
+        obj = vsdModels.APIObject(id=1, name='study', downloadUrl='objects/1/download')
+        obj.extract(self.api, self.dir)
+        self.assertExtracted(self.dir / 'study')
+
+
+@unittest.skipIf(httpx is None, 'httpx is not installed')
+class HttpxExtractTest(ExtractTest):
+    transport = 'httpx'
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pathlib import Path
+
+import requests
+
+from vsdConnect import connect
+from vsdConnect.upload import ChunkedUpload, UploadManifest
+
+from vsdserver import FakeVSD
+
+CHUNK = 64 * 1024
+
+
+class UploadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeVSD().start()
+        self.dir = Path(tempfile.mkdtemp())
+        self.data = os.urandom(10 * CHUNK + 123)
+        self.fp = self.dir / 'image.bin'
+        self.fp.write_bytes(self.data)
+        self.api = connect.VSDConnecter(authtype='basic', url=self.server.u(''))
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(str(self.dir))
+
+    def upload(self, **kwargs):
+        upload = ChunkedUpload(self.api, self.fp, CHUNK, stateDir=self.dir / 'state', **kwargs)
+        upload.backoff = 0.01
+        return upload
+
+    def committed(self, result):
+        """
+        :return: the content of the committed file
+        :rtype: bytes
+        """
+        i = int(result.response['file']['selfUrl'].rsplit('/', 1)[1])
+        return self.server.fileData(self.server.vsdFiles[i])
+
+    def posts(self, resource):
+        return len([r for r in self.server.log if r['method'] == 'POST' and r['path'] == '/api/' + resource])
+
+
+class ChunkedUploadTest(UploadTestCase):
+
+    def test_chunks_assembled_in_order(self):
+        sent = list()
+        result = self.upload(maxWorkers=4, progress=sent.append).run()
+        self.assertEqual(result.chunks, 11)
+        self.assertEqual(result.workers, 4)
+        self.assertEqual(sorted(self.server.received), list(range(1, 12)))
+        self.assertEqual([c[:2] for c in result.chunkSizes], [(i, CHUNK) for i in range(1, 11)] + [(11, 123)])
+        self.assertEqual(self.committed(result), self.data)
+        self.assertEqual(max(sent), len(self.data))
+        self.assertEqual(self.posts('chunked_upload/commit'), 1)
+
+    def test_failed_chunk_sent_again(self):
+        # the first chunk that arrives fails, it is sent again while the other connections go on
+        self.server.fail('POST', 'chunked_upload', 503)
+        sent = list()
+        result = self.upload(maxWorkers=4, progress=sent.append).run()
+        self.assertEqual(result.retries, 1)
+        self.assertEqual(self.posts('chunked_upload'), 12)
+        self.assertEqual(len(self.server.received), 11)
+        self.assertEqual(self.committed(result), self.data)
+        self.assertEqual(max(sent), len(self.data))
+
+    def test_chunk_out_of_attempts_fails(self):
+        self.server.fail('POST', 'chunked_upload', 503, times=100)
+        upload = self.upload(maxWorkers=1)
+        upload.attempts = 3
+        with self.assertRaises(requests.HTTPError):
+            upload.run()
+        self.assertEqual(self.posts('chunked_upload'), 3)
+        self.assertEqual(self.posts('chunked_upload/commit'), 0)
+        self.assertEqual(self.server.objects, dict())
+
+    def test_client_error_not_sent_again(self):
+        self.server.fail('POST', 'chunked_upload', 400)
+        with self.assertRaises(requests.HTTPError):
+            self.upload(maxWorkers=1).run()
+        self.assertEqual(self.posts('chunked_upload'), 1)
+        self.assertEqual(self.posts('chunked_upload/commit'), 0)
+
+
+class ResumeTest(UploadTestCase):
+
+    def interrupt(self, chunks):
+        """
+        upload chunks one after the other until the next one fails
+        """
+        self.server.fail('POST', 'chunked_upload', 400, after=chunks)
+        with self.assertRaises(requests.HTTPError):
+            self.upload(maxWorkers=1).run()
+        self.assertEqual(sorted(self.server.received), list(range(1, chunks + 1)))
+        del self.server.received[:]
+
+    def test_interrupted_upload_resumes(self):
+        self.interrupt(4)
+        manifest = UploadManifest.load(UploadManifest.location(self.fp, self.dir / 'state'), self.fp,
+                                       self.fp.name, CHUNK)
+        self.assertEqual(manifest.completed(), 4 * CHUNK)
+
+        result = self.upload(maxWorkers=2).run()
+        self.assertEqual(result.resumed, 4 * CHUNK)
+        self.assertEqual(result.chunks, 11)
+        self.assertEqual(sorted(self.server.received), list(range(5, 12)))
+        self.assertEqual(self.committed(result), self.data)
+        # the manifest of a committed upload is removed
+        self.assertEqual(list((self.dir / 'state').iterdir()), [])
+
+    def test_changed_file_sent_again(self):
+        self.interrupt(4)
+        self.data = os.urandom(len(self.data))
+        self.fp.write_bytes(self.data)
+        st = self.fp.stat()
+        os.utime(str(self.fp), (st.st_atime, st.st_mtime + 10))
+        path = UploadManifest.location(self.fp, self.dir / 'state')
+        self.assertTrue(path.exists())
+        self.assertIsNone(UploadManifest.load(path, self.fp, self.fp.name, CHUNK))
+
+        result = self.upload(maxWorkers=2).run()
+        self.assertEqual(result.resumed, 0)
+        self.assertEqual(sorted(self.server.received), list(range(1, 12)))
+        self.assertEqual(self.committed(result), self.data)
+
+    def test_other_chunk_size_sent_again(self):
+        self.interrupt(4)
+        result = ChunkedUpload(self.api, self.fp, 2 * CHUNK, maxWorkers=2, stateDir=self.dir / 'state').run()
+        self.assertEqual(result.resumed, 0)
+        self.assertEqual(sorted(self.server.received), list(range(1, 7)))
+        self.assertEqual(self.committed(result), self.data)
+
+    def test_without_resume(self):
+        self.interrupt(4)
+        result = self.upload(maxWorkers=2, resume=False).run()
+        self.assertEqual(result.resumed, 0)
+        self.assertEqual(sorted(self.server.received), list(range(1, 12)))
+        self.assertEqual(self.committed(result), self.data)
+
+
+class AdaptiveSizeTest(UploadTestCase):
+
+    def sizer(self, chunk):
+        upload = self.upload(adaptive=True)
+        upload.minChunk, upload.maxChunk = CHUNK, 16 * CHUNK
+        upload._chunk = chunk
+        return upload
+
+    def assertSize(self, upload, size):
+        self.assertEqual(upload._chunk, size)
+        self.assertEqual(upload._chunk % 65536, 0)
+
+    def test_grows_with_throughput(self):
+        upload = self.sizer(2 * CHUNK)
+        # fast chunks double the size until maxChunk
+        for size in (4, 8, 16, 16):
+            upload._adapt(upload._chunk, 0.001)
+            self.assertSize(upload, size * CHUNK)
+        # a chunk of chunkSeconds keeps the size
+        upload._adapt(upload._chunk, upload.chunkSeconds)
+        self.assertSize(upload, 16 * CHUNK)
+        # between the limits the size follows the rate
+        upload._adapt(12 * CHUNK, upload.chunkSeconds)
+        self.assertSize(upload, 12 * CHUNK)
+
+    def test_shrinks_with_throughput(self):
+        upload = self.sizer(16 * CHUNK)
+        for size in (8, 4, 2, 1, 1):
+            upload._adapt(upload._chunk, 1000)
+            self.assertSize(upload, size * CHUNK)
+        upload._adapt(4 * CHUNK, upload.chunkSeconds * 2)
+        self.assertSize(upload, 2 * CHUNK)
+
+    def test_failed_attempt_halves(self):
+        upload = self.sizer(10 * CHUNK)
+        for size in (5, 2, 1, 1):
+            upload._shrink()
+            self.assertSize(upload, size * CHUNK)
+
+    def test_run(self):
+        self.data = os.urandom(40 * CHUNK + 5)
+        self.fp.write_bytes(self.data)
+        upload = self.sizer(CHUNK)
+        upload.chunksize = CHUNK
+        result = upload.run()
+        lengths = [c[1] for c in result.chunkSizes]
+        self.assertEqual([c[0] for c in result.chunkSizes], list(range(1, result.chunks + 1)))
+        self.assertEqual(sum(lengths), len(self.data))
+        # only the rest of the file is smaller than minChunk
+        self.assertTrue(all(CHUNK <= n <= 16 * CHUNK for n in lengths[:-1]))
+        self.assertGreater(max(lengths), CHUNK)
+        self.assertEqual(self.committed(result), self.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
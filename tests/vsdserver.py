@@ -0,0 +1,231 @@
+"""
+in-memory VSD API for the tests: folders, objects with their files, uploads, chunked uploads,
+rights and links, on the local server of httpserver
+"""
+
+import hashlib
+import itertools
+import json
+import re
+import time
+
+try:
+    from urllib.parse import parse_qs, urlsplit
+except ImportError:
+    from urlparse import parse_qs, urlsplit
+
+from httpserver import Server, ServedFile
+
+
+class FakeVSD(Server):
+    """
+    the resources are dicts like the JSON of the API, with full selfUrls. listings are paged with rpp items.
+    fail() makes the next requests of a resource answer with an error status
+    """
+
+    rpp = 10
+
+    def __init__(self):
+        Server.__init__(self)
+        self.ids = itertools.count(1)
+        #: id -> folder, object, file
+        self.folders = dict()
+        self.objects = dict()
+        self.vsdFiles = dict()
+        #: object id -> selfUrls of its files
+        self.objectFiles = dict()
+        #: chunk index -> data of the chunked upload
+        self.chunks = dict()
+        #: indexes of the received chunks, in the order of arrival
+        self.received = list()
+        #: (resource, data) of the posted rights and links
+        self.posted = list()
+        #: seconds each request is delayed
+        self.delay = 0
+        # [method, pattern, status, body, times left, requests left before]
+        self._failures = list()
+        self._handlers = [
+            ('GET', r'folders', self.listFolders),
+            ('GET', r'folders/(\d+)', self.getFolder),
+            ('POST', r'folders', self.postFolder),
+            ('PUT', r'folders', self.putFolder),
+            ('GET', r'objects/(\d+)', self.getObject),
+            ('PUT', r'objects/(\d+)', self.putObject),
+            ('GET', r'objects/(\d+)/files', self.listObjectFiles),
+            ('GET', r'files', self.listFiles),
+            ('GET', r'files/(\d+)', self.getFile),
+            ('POST', r'upload', self.upload),
+            ('POST', r'chunked_upload', self.chunk),
+            ('POST', r'chunked_upload/commit', self.commit),
+            ('POST', r'(object-links|object-user-rights|object-group-rights)', self.post),
+        ]
+        self.root = self.addFolder('root')
+
+    def u(self, resource):
+        return self.url('/api/' + resource)
+
+    def fail(self, method, pattern, status=500, body=None, times=1, after=0):
+        """
+        answer the next requests whose resource matches pattern with status. the first after of
+        these requests are answered as usual
+        """
+        with self.lock:
+            self._failures.append([method, re.compile(pattern + '$'), status, body, times, after])
+
+    def dispatch(self, h):
+        parts = urlsplit(h.path)
+        resource = parts.path[len('/api/'):]
+        query = dict((k, v[0]) for k, v in parse_qs(parts.query).items())
+        data = h.body()
+        if self.delay:
+            time.sleep(self.delay)
+        with self.lock:
+            for failure in self._failures:
+                if failure[0] == h.command and failure[1].match(resource) and failure[4]:
+                    if failure[5]:
+                        failure[5] -= 1
+                        continue
+                    failure[4] -= 1
+                    body = failure[3] if failure[3] is not None else dict(error='failed')
+                    h.reply(failure[2], body, {'Content-Type': 'text/html'} if isinstance(body, bytes) else None)
+                    return True
+        for method, pattern, fn in self._handlers:
+            m = re.match(pattern + '$', resource)
+            if m and method == h.command:
+                with self.lock:
+                    status, body = fn(h, data, query, *m.groups())
+                h.reply(status, body)
+                return True
+        return False
+
+    # the resources
+
+    def addFolder(self, name, parent=None):
+        """
+        :return: the new folder
+        :rtype: dict
+        """
+        i = next(self.ids)
+        folder = dict(id=i, name=name, selfUrl=self.u('folders/{0}'.format(i)), childFolders=[],
+                      containedObjects=[])
+        if parent is not None:
+            folder['parentFolder'] = dict(selfUrl=parent['selfUrl'])
+            parent['childFolders'].append(dict(selfUrl=folder['selfUrl']))
+        self.folders[i] = folder
+        return folder
+
+    def addObject(self, name, datas, folder=None):
+        """
+        an object with a file per data, served at files/<id>/download
+
+        :return: the object
+        :rtype: dict
+        """
+        i = next(self.ids)
+        obj = dict(id=i, name=name, selfUrl=self.u('objects/{0}'.format(i)), type=dict(name='RawImage'))
+        self.objects[i] = obj
+        self.objectFiles[i] = list()
+        for n, data in enumerate(datas):
+            j = next(self.ids)
+            self.vsdFiles[j] = dict(id=j, selfUrl=self.u('files/{0}'.format(j)), size=len(data),
+                                    fileHashCode=hashlib.sha1(data).hexdigest().upper(),
+                                    originalFileName='{0}_{1}.dcm'.format(name, n),
+                                    downloadUrl=self.u('files/{0}/download'.format(j)),
+                                    objects=self._page([dict(selfUrl=obj['selfUrl'])], 0, 'x'))
+            self.files['/api/files/{0}/download'.format(j)] = ServedFile(data)
+            self.objectFiles[i].append(self.vsdFiles[j]['selfUrl'])
+        if folder is not None:
+            folder['containedObjects'].append(dict(selfUrl=obj['selfUrl']))
+        return obj
+
+    def fileData(self, f):
+        """
+        :return: the content of a file
+        :rtype: bytes
+        """
+        return self.files['/api/files/{0}/download'.format(f['id'])].data
+
+    def _page(self, items, page, resource):
+        start = page * self.rpp
+        # the models accept rpp of 10 and more, smaller pages are announced as 10
+        res = dict(totalCount=len(items), pagination=dict(rpp=max(self.rpp, 10), page=page),
+                   items=items[start:start + self.rpp])
+        if start + self.rpp < len(items):
+            res['nextPageUrl'] = self.u('{0}?rpp={1}&page={2}'.format(resource, self.rpp, page + 1))
+        return res
+
+    def _get(self, table, i):
+        item = table.get(int(i))
+        return (200, item) if item is not None else (404, dict(error='not found'))
+
+    def listFolders(self, h, data, query):
+        items = [self.folders[i] for i in sorted(self.folders)]
+        return 200, self._page(items, int(query.get('page', 0)), 'folders')
+
+    def getFolder(self, h, data, query, i):
+        return self._get(self.folders, i)
+
+    def postFolder(self, h, data, query):
+        data = json.loads(data.decode('utf-8'))
+        parent = self.folders[int(data['parentFolder']['selfUrl'].rsplit('/', 1)[1])]
+        return 201, self.addFolder(data['name'], parent)
+
+    def putFolder(self, h, data, query):
+        data = json.loads(data.decode('utf-8'))
+        folder = self.folders[data['id']]
+        folder['containedObjects'] = [dict(selfUrl=o['selfUrl']) for o in data.get('containedObjects') or []]
+        return 200, folder
+
+    def getObject(self, h, data, query, i):
+        status, obj = self._get(self.objects, i)
+        if status == 200:
+            files = [dict(selfUrl=url) for url in self.objectFiles[int(i)]]
+            obj = dict(obj, files=self._page(files, 0, 'objects/{0}/files'.format(i)))
+        return status, obj
+
+    def putObject(self, h, data, query, i):
+        data = json.loads(data.decode('utf-8'))
+        obj = self.objects[int(i)]
+        obj.update((k, v) for k, v in data.items() if v is not None and k != 'files')
+        return 200, obj
+
+    def listObjectFiles(self, h, data, query, i):
+        items = [dict(selfUrl=url) for url in self.objectFiles[int(i)]]
+        return 200, self._page(items, int(query.get('page', 0)), 'objects/{0}/files'.format(i))
+
+    def listFiles(self, h, data, query):
+        items = [self.vsdFiles[i] for i in sorted(self.vsdFiles)]
+        return 200, self._page(items, int(query.get('page', 0)), 'files')
+
+    def getFile(self, h, data, query, i):
+        return self._get(self.vsdFiles, i)
+
+    def _created(self, name, data):
+        obj = self.addObject(name, [data])
+        return dict(file=dict(selfUrl=self.objectFiles[obj['id']][0]), relatedObject=dict(selfUrl=obj['selfUrl']))
+
+    def _content(self, h, part):
+        # the file of a multipart body without the closing boundary
+        boundary = h.headers['Content-Type'].split('boundary=')[1].encode('ascii')
+        return part[:-len(b'\r\n--' + boundary + b'--\r\n')]
+
+    def upload(self, h, data, query):
+        head, content = data.split(b'\r\n\r\n', 1)
+        name = head.split(b'filename="', 1)[1].split(b'"', 1)[0].decode('utf-8')
+        return 200, self._created(name, self._content(h, content))
+
+    def chunk(self, h, data, query):
+        self.chunks[int(query['chunk'])] = self._content(h, data.split(b'\r\n\r\n', 1)[1])
+        self.received.append(int(query['chunk']))
+        return 200, dict()
+
+    def commit(self, h, data, query):
+        content = b''.join(self.chunks[i] for i in sorted(self.chunks))
+        self.chunks.clear()
+        return 200, self._created(query['filename'], content)
+
+    def post(self, h, data, query, resource):
+        data = json.loads(data.decode('utf-8'))
+        self.posted.append((resource, data))
+        i = next(self.ids)
+        return 201, dict(data, id=i, selfUrl=self.u('{0}/{1}'.format(resource, i)))
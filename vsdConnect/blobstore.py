@@ -0,0 +1,314 @@
+#!/usr/bin/python
+"""
+=======
+INFOS
+=======
+* python version: 3.5
+* connectVSD 0.8.1
+* module: blobstore
+
+========
+CHANGES
+========
+* content addressed store of downloaded files with LRU eviction
+
+"""
+
+import logging
+import os
+import shutil
+import stat
+import threading
+import time
+import uuid
+
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+#: ioctl cloning a file on Linux (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def reflink(src, dst):
+    """
+    copy src to dst sharing the data blocks (copy on write), Linux only
+
+    :raises: OSError if the file system does not support it
+    """
+
+    import fcntl
+
+    with open(str(src), 'rb') as s, open(str(dst), 'wb') as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+class BlobStore(object):
+    """
+    local store of downloaded files keyed by their SHA-1 (fileHashCode). a file linked to several
+    objects, or downloaded again by the next job, is placed from the store instead of the network.
+
+    blobs are read only files root/AB/ABCDEF... . files are added to the store and placed into target
+    directories as reflink (copy on write) or copy, see link, so a blob never shares its data with a
+    file that may be modified. the least recently used blobs are removed when the store grows over
+    maxBytes; the access time of a blob is its last use.
+
+    :param Path root: directory of the store
+    :param int maxBytes: size cap in bytes, None is unlimited
+    :param str link: 'auto' (reflink or copy), 'reflink' or 'copy'
+    """
+
+    def __init__(self, root, maxBytes=None, link='auto'):
+        if link not in ('auto', 'reflink', 'copy'):
+            raise ValueError("unknown link '{0}', use 'auto', 'reflink' or 'copy'".format(link))
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.maxBytes = maxBytes
+        self.link = link
+        self._lock = threading.Lock()
+        self._index = None
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, sha1):
+        """
+        :return: the file of a blob
+        :rtype: Path
+        """
+        sha1 = sha1.upper()
+        return self.root / sha1[:2] / sha1
+
+    def _scan(self):
+        # hash -> (size, last use) of the blobs on disk, built once
+        if self._index is None:
+            index = dict()
+            for sub in self.root.iterdir():
+                if not sub.is_dir() or len(sub.name) != 2:
+                    continue
+                for blob in sub.iterdir():
+                    if blob.name.startswith('.'):
+                        continue
+                    st = blob.stat()
+                    index[blob.name] = (st.st_size, st.st_atime)
+            self._index = index
+        return self._index
+
+    @property
+    def size(self):
+        """
+        :return: bytes in the store
+        :rtype: int
+        """
+        with self._lock:
+            return sum(size for size, used in self._scan().values())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._scan())
+
+    def __contains__(self, sha1):
+        return self.path(sha1).is_file()
+
+    def _touch(self, blob, st):
+        # the access time marks the last use, also on file systems mounted noatime
+        now = time.time()
+        try:
+            os.utime(str(blob), (now, st.st_mtime))
+        except OSError:
+            pass
+        with self._lock:
+            self._scan()[blob.name] = (st.st_size, now)
+
+    def _place(self, src, dst):
+        """
+        create dst with the content of src as a file of its own: reflink or copy
+        """
+
+        modes = ('reflink', 'copy') if self.link == 'auto' else (self.link,)
+        for mode in modes:
+            try:
+                if mode == 'reflink':
+                    reflink(src, dst)
+                else:
+                    shutil.copyfile(str(src), str(dst))
+                return mode
+            except (OSError, IOError, ImportError) as err:
+                if mode == modes[-1]:
+                    raise
+                logger.debug('%s of %s failed: %s', mode, src, err)
+                try:
+                    os.unlink(str(dst))
+                except OSError:
+                    pass
+
+    def get(self, sha1, fp):
+        """
+        place the blob at fp, an existing fp is replaced
+
+        :param str sha1: SHA-1 of the file
+        :param Path fp: target file
+        :return: fp or None if the blob is not in the store
+        :rtype: Path
+        """
+
+        blob = self.path(sha1)
+        try:
+            st = blob.stat()
+        except OSError:
+            self.misses += 1
+            return None
+        fp = Path(fp)
+        tmp = fp.with_name('.{0}.{1}.tmp'.format(fp.name, uuid.uuid4().hex[:8]))
+        try:
+            mode = self._place(blob, tmp)
+            os.replace(str(tmp), str(fp))
+        except OSError as err:
+            # evicted by another process in between
+            logger.info('blob %s not placed: %s', sha1, err)
+            try:
+                os.unlink(str(tmp))
+            except OSError:
+                pass
+            self.misses += 1
+            return None
+        self._touch(blob, st)
+        self.hits += 1
+        logger.debug('%s from the blob store (%s)', fp, mode)
+        return fp
+
+    def open(self, sha1):
+        """
+        :return: the blob opened for reading or None if it is not in the store
+        :rtype: file
+        """
+
+        blob = self.path(sha1)
+        try:
+            f = blob.open('rb')
+        except OSError:
+            self.misses += 1
+            return None
+        self._touch(blob, os.fstat(f.fileno()))
+        self.hits += 1
+        return f
+
+    def add(self, sha1, fp):
+        """
+        add a downloaded file, which has to match sha1. the blob is a reflink or copy of the file,
+        the file itself is not changed
+
+        :param str sha1: SHA-1 of the file
+        :param Path fp: the file
+        :return: the blob
+        :rtype: Path
+        """
+
+        blob = self.path(sha1)
+        if blob.is_file():
+            return blob
+        blob.parent.mkdir(exist_ok=True)
+        tmp = blob.with_name('.{0}.{1}.tmp'.format(blob.name, uuid.uuid4().hex[:8]))
+        try:
+            self._place(fp, tmp)
+            os.chmod(str(tmp), stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(str(tmp), str(blob))
+        finally:
+            try:
+                os.unlink(str(tmp))
+            except OSError:
+                pass
+        self._touch(blob, blob.stat())
+        self.evict()
+        return blob
+
+    def write(self, sha1, data):
+        """
+        add a blob from memory
+
+        :param str sha1: SHA-1 of data
+        :param data: bytes-like object
+        :return: the blob
+        :rtype: Path
+        """
+
+        blob = self.path(sha1)
+        if blob.is_file():
+            return blob
+        blob.parent.mkdir(exist_ok=True)
+        tmp = blob.with_name('.{0}.{1}.tmp'.format(blob.name, uuid.uuid4().hex[:8]))
+        try:
+            with tmp.open('wb') as f:
+                f.write(data)
+            os.chmod(str(tmp), stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(str(tmp), str(blob))
+        finally:
+            try:
+                os.unlink(str(tmp))
+            except OSError:
+                pass
+        self._touch(blob, blob.stat())
+        self.evict()
+        return blob
+
+    def remove(self, sha1):
+        """
+        remove a blob, files placed from it are not affected
+        """
+
+        blob = self.path(sha1)
+        try:
+            blob.unlink()
+        except OSError:
+            pass
+        with self._lock:
+            self._scan().pop(blob.name, None)
+
+    def evict(self, maxBytes=None):
+        """
+        remove the least recently used blobs until the store is not larger than maxBytes
+
+        :param int maxBytes: default is the cap of the store
+        :return: bytes removed
+        :rtype: int
+        """
+
+        if maxBytes is None:
+            maxBytes = self.maxBytes
+        if maxBytes is None:
+            return 0
+        with self._lock:
+            index = self._scan()
+            total = sum(size for size, used in index.values())
+            if total <= maxBytes:
+                return 0
+            victims = list()
+            for sha1, (size, used) in sorted(index.items(), key=lambda kv: kv[1][1]):
+                if total <= maxBytes:
+                    break
+                victims.append(sha1)
+                total -= size
+            for sha1 in victims:
+                index.pop(sha1)
+        removed = 0
+        for sha1 in victims:
+            blob = self.path(sha1)
+            try:
+                size = blob.stat().st_size
+                blob.unlink()
+            except OSError:
+                continue
+            removed += size
+        logger.info('blob store %s: evicted %s blobs, %s bytes', self.root, len(victims), removed)
+        return removed
+
+
+def createBlobStore(store):
+    """
+    :param store: None, a directory or a BlobStore
+    :return: the blob store or None
+    :rtype: BlobStore
+    """
+
+    if store is None or isinstance(store, BlobStore):
+        return store
+    return BlobStore(store)
@@ -0,0 +1,315 @@
+#!/usr/bin/python
+"""
+=======
+INFOS
+=======
+* python version: 3.5
+* connectVSD 0.8.1
+* module: codec
+
+========
+CHANGES
+========
+* pluggable JSON codec: orjson, ujson or json (stdlib)
+* incremental reader for the items of large pages
+
+"""
+
+import json
+import re
+
+
+class JSONCodec(object):
+    """
+    JSON codec based on the standard library. base class of the codecs
+    """
+
+    name = 'json'
+
+    def loads(self, data):
+        """
+        decode a JSON document
+
+        :param bytes,str data: the document
+        :return: the decoded data
+        :raises: ValueError
+        """
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+    def dumps(self, obj, indent=None, sort_keys=False):
+        """
+        encode to a JSON string
+
+        :param obj: data to encode
+        :param int indent: indentation for pretty printing
+        :param bool sort_keys: sort the keys of dictionaries
+        :rtype: str
+        """
+        return json.dumps(obj, indent=indent, sort_keys=sort_keys)
+
+    def dumpb(self, obj, indent=None, sort_keys=False):
+        """
+        encode to UTF-8 JSON bytes, eg. for a request body
+
+        :param obj: data to encode
+        :param int indent: indentation for pretty printing
+        :param bool sort_keys: sort the keys of dictionaries
+        :rtype: bytes
+        """
+        return self.dumps(obj, indent=indent, sort_keys=sort_keys).encode('utf-8')
+
+
+class OrjsonCodec(JSONCodec):
+    """
+    codec based on orjson. orjson only indents by 2, other indents use the standard library
+    """
+
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+
+    def loads(self, data):
+        return self.orjson.loads(data)
+
+    def dumpb(self, obj, indent=None, sort_keys=False):
+        if indent not in (None, 2):
+            return super(OrjsonCodec, self).dumpb(obj, indent=indent, sort_keys=sort_keys)
+        option = 0
+        if indent:
+            option |= self.orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= self.orjson.OPT_SORT_KEYS
+        return self.orjson.dumps(obj, option=option)
+
+    def dumps(self, obj, indent=None, sort_keys=False):
+        if indent not in (None, 2):
+            return super(OrjsonCodec, self).dumps(obj, indent=indent, sort_keys=sort_keys)
+        return self.dumpb(obj, indent=indent, sort_keys=sort_keys).decode('utf-8')
+
+
+class UjsonCodec(JSONCodec):
+    """
+    codec based on ujson
+    """
+
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self.ujson = ujson
+
+    def loads(self, data):
+        return self.ujson.loads(data)
+
+    def dumps(self, obj, indent=None, sort_keys=False):
+        return self.ujson.dumps(obj, indent=indent or 0, sort_keys=sort_keys, escape_forward_slashes=False)
+
+
+codecs = {
+    'orjson': OrjsonCodec,
+    'ujson': UjsonCodec,
+    'json': JSONCodec,
+}
+
+_default = None
+
+
+def availableCodecs():
+    """
+    :return: names of the installed codecs, fastest first
+    :rtype: list of str
+    """
+
+    names = list()
+    for name in ('orjson', 'ujson', 'json'):
+        try:
+            codecs[name]()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def getCodec(name=None):
+    """
+    get a codec by name
+
+    :param str name: 'orjson', 'ujson', 'json', 'auto' (fastest installed) or None (the default codec)
+    :return: the codec
+    :rtype: JSONCodec
+    :raises: ImportError if the requested codec is not installed
+    """
+
+    global _default
+
+    if isinstance(name, JSONCodec):
+        return name
+    if name is None:
+        if _default is None:
+            _default = getCodec('auto')
+        return _default
+    if name == 'auto':
+        return codecs[availableCodecs()[0]]()
+    if name not in codecs:
+        raise ValueError("unknown codec '{0}', use one of {1}".format(name, sorted(codecs)))
+    return codecs[name]()
+
+
+def setCodec(name):
+    """
+    set the default codec used by the models and by new connecters
+
+    :param str name: 'orjson', 'ujson', 'json' or 'auto'
+    :return: the codec
+    :rtype: JSONCodec
+    """
+
+    global _default
+
+    _default = getCodec(name)
+    return _default
+
+
+_WS = re.compile(br'[ \t\r\n]*')
+_STRUCT = re.compile(br'["{}\[\]]')
+_STRING = re.compile(br'["\\]')
+_SCALAR_END = re.compile(br'[,}\] \t\r\n]')
+
+_LBRACE, _RBRACE, _LBRACKET, _RBRACKET = ord('{'), ord('}'), ord('['), ord(']')
+_QUOTE, _BACKSLASH, _COMMA, _COLON = ord('"'), ord('\\'), ord(','), ord(':')
+
+
+class PageReader(object):
+    """
+    incremental reader for a JSON object with one large list, eg. a page with rpp=10000.
+    the items of the list are decoded one by one while the chunks arrive, memory is bounded by
+    one item and one chunk. the other keys (totalCount, pagination, nextPageUrl) are available
+    in meta once the reader is exhausted
+
+    >> reader = PageReader(res.iter_content(65536))
+    >> for item in reader:
+    >>     ...
+    >> reader.meta['nextPageUrl']
+
+    :param chunks: iterable of bytes
+    :param loads: function decoding one item, default is the default codec
+    :param str key: key of the list to stream
+    """
+
+    def __init__(self, chunks, loads=None, key='items'):
+        self._chunks = iter(chunks)
+        self._buf = bytearray()
+        self._pos = 0
+        self.loads = loads or getCodec().loads
+        self.key = key
+        self.meta = dict()
+        self.count = 0
+
+    def _fill(self):
+        # append the next chunk, dropping the consumed part of the buffer
+        for chunk in self._chunks:
+            if chunk:
+                if self._pos:
+                    del self._buf[:self._pos]
+                    self._pos = 0
+                self._buf += chunk
+                return True
+        return False
+
+    def _peek(self):
+        # next non whitespace byte
+        while True:
+            self._pos = _WS.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                raise ValueError('truncated JSON document')
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError('invalid JSON document, expected {0!r} at {1!r}'.format(
+                chr(char), bytes(self._buf[self._pos:self._pos + 20])))
+        self._pos += 1
+
+    def _readValue(self):
+        # the raw bytes of the value at the current position. offsets are relative to _pos,
+        # which is moved to 0 when the buffer is compacted
+        self._peek()
+        off = 0
+        if self._buf[self._pos] in (_LBRACE, _LBRACKET, _QUOTE):
+            depth = 0
+            instr = False
+            while True:
+                buf, base = self._buf, self._pos
+                if base + off > len(buf):
+                    # escaped character not received yet
+                    if not self._fill():
+                        raise ValueError('truncated JSON document')
+                    continue
+                m = (_STRING if instr else _STRUCT).search(buf, base + off)
+                if m is None:
+                    off = len(buf) - base
+                    if not self._fill():
+                        raise ValueError('truncated JSON document')
+                    continue
+                char = buf[m.start()]
+                off = m.end() - base
+                if instr:
+                    if char == _BACKSLASH:
+                        off += 1
+                    else:
+                        instr = False
+                        if depth == 0:
+                            break
+                elif char == _QUOTE:
+                    instr = True
+                elif char in (_LBRACE, _LBRACKET):
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        break
+        else:
+            while True:
+                m = _SCALAR_END.search(self._buf, self._pos)
+                if m is not None:
+                    off = m.start() - self._pos
+                    break
+                if not self._fill():
+                    off = len(self._buf) - self._pos
+                    break
+        end = self._pos + off
+        raw = bytes(self._buf[self._pos:end])
+        self._pos = end
+        return raw
+
+    def __iter__(self):
+        self._expect(_LBRACE)
+        while True:
+            char = self._peek()
+            if char == _RBRACE:
+                self._pos += 1
+                return
+            if char == _COMMA:
+                self._pos += 1
+                continue
+            key = self.loads(self._readValue())
+            self._expect(_COLON)
+            if key == self.key and self._peek() == _LBRACKET:
+                self._pos += 1
+                while True:
+                    char = self._peek()
+                    if char == _RBRACKET:
+                        self._pos += 1
+                        break
+                    if char == _COMMA:
+                        self._pos += 1
+                        continue
+                    self.count += 1
+                    yield self.loads(self._readValue())
+            else:
+                self.meta[key] = self.loads(self._readValue())
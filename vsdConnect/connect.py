@@ -14,19 +14,42 @@ CHANGES
 
 * changed / added JwT auth
 * added models module
+* added request timeouts and deadlines
+* added pluggable transport (requests, httpx)
+* added pluggable JSON codec (orjson, ujson, json)
+* added compression negotiation and transfer statistics
+* added streaming page reader
+* added download engine
+* added SHA-1 verification of downloaded files
+* added downloads into memory
+* added streaming ZIP extraction
+* added blob store of downloaded files
+* added folder mirror
+* added concurrent preview fetching with a disk cache
+* added streaming multipart upload
+* added parallel chunked upload with retries
+* added resumable chunked upload
+* added adaptive chunk sizes for chunked upload
+* added ingestion of local directory trees
+* added upload deduplication against an index of the server file hashes
+* added persistent cache of local file hashes
+* added parallel bulk hashing of local files
+* added bulk reconciliation of local files with the server by hash
+* added batched folder membership updates
+* added unit of work coalescing changes
 
 
 """
 
 from __future__ import print_function
 
-import math
-import hashlib
+import time
+import threading
+from contextlib import contextmanager
 
 from datetime import datetime
 from calendar import timegm
 import base64
-import shutil
 
 import urllib
 import jwt
@@ -55,6 +78,18 @@ except:
     import xml.etree.ElementTree as ET
 
 import vsdConnect.models as vsdModels
+from vsdConnect.transport import createTransport
+from vsdConnect.codec import getCodec, PageReader
+from vsdConnect.download import DownloadEngine
+from vsdConnect.mirror import FolderMirror
+from vsdConnect.preview import PreviewFetcher
+from vsdConnect.upload import MultipartFile, ChunkedUpload
+from vsdConnect.ingest import Ingest
+from vsdConnect.dedup import HashIndex
+from vsdConnect.hashcache import createHashCache
+from vsdConnect.hashing import BulkHasher, mmapSha1
+from vsdConnect.reconcile import Reconciler
+from vsdConnect.unitofwork import UnitOfWork
 #from vsdConnect import models as vsdModels
 #import models as vsdModels
 import logging
@@ -72,7 +107,7 @@ class SAMLAuth(AuthBase):
 
     def __call__(self, r):
         # modify and return the request
-        r.headers['Authorization'] = b'SAML auth=' + self.enctoken
+        r.headers['Authorization'] = 'SAML auth=' + self.enctoken.decode('ascii')
         return r
 
 
@@ -124,7 +159,83 @@ class JWTAuth(AuthBase):
         return r
 
 
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """the time budget of an operation is used up"""
+
+
+class Deadline(object):
+    """
+    time budget for a composite operation (walk a folder, read all pages, mirror, ...).
+    every request issued while the deadline is active gets its timeout limited to the remaining budget
+
+    :param float seconds: budget in seconds from now
+    """
+
+    def __init__(self, seconds):
+        self.seconds = float(seconds)
+        self.expires = time.monotonic() + self.seconds
+
+    def __repr__(self):
+        return 'Deadline({0:.1f}s of {1:.1f}s left)'.format(self.remaining(), self.seconds)
+
+    def remaining(self):
+        """
+        :return: seconds left, 0 if expired
+        :rtype: float
+        """
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self):
+        """
+        :raises: DeadlineExceeded if the budget is used up
+        """
+        if self.expired():
+            raise DeadlineExceeded('deadline of {0:.1f}s exceeded'.format(self.seconds))
+
+    def clamp(self, timeout):
+        """
+        limit a requests timeout (None, float or (connect, read) tuple) to the remaining budget
+
+        :param timeout: the requested timeout
+        :return: the timeout limited to the remaining time
+        :raises: DeadlineExceeded if the budget is used up
+        """
+        self.check()
+        left = self.remaining()
+        if timeout is None:
+            return (left, left)
+        if isinstance(timeout, tuple):
+            return tuple(left if t is None else min(t, left) for t in timeout)
+        return min(timeout, left)
+
+
 class VSDConnecter(object):
+    """
+    connection to the VSD API
+
+    :param str authtype: 'jwt' (default), 'basic' or 'saml'
+    :param str url: url of the api
+    :param str username: username (basic and jwt)
+    :param str password: password (basic and jwt)
+    :param str version: api version
+    :param token: saml token
+    :param timeout: default timeout of every request in seconds, a float or a (connect, read) tuple.
+        a request is sent up to maxAttempts times with a backoff, all attempts together take at most
+        retrySeconds. a Deadline (see deadline) limits a whole operation instead
+    :param transport: HTTP backend: 'requests' (default), 'httpx', 'http2' or a transport.Transport
+    :param codec: JSON codec for responses and request bodies: 'orjson', 'ujson', 'json' or
+        None for the default codec (see codec.setCodec)
+    :param blobstore: local store of downloaded files keyed by fileHashCode, a directory or a
+        blobstore.BlobStore (eg. with a size cap). None disables it
+    :param previewCache: disk cache of preview images keyed by preview id, a directory or a
+        preview.PreviewCache (eg. with a size cap). None keeps previews in memory only
+    :param hashCache: persistent cache of the SHA-1 of local files, a database file or a
+        hashcache.HashCache. None hashes the files every time
+    """
+
     def __init__(
             self,
             authtype='jwt',
@@ -133,6 +244,12 @@ class VSDConnecter(object):
             password="demo",
             version="",
             token=None,
+            timeout=(10, 120),
+            transport='requests',
+            codec=None,
+            blobstore=None,
+            previewCache=None,
+            hashCache=None,
     ):
 
         self.version = version
@@ -142,6 +259,20 @@ class VSDConnecter(object):
         self.authtype = authtype
         self.maxAttempts = 10
         self.maxAttempts401 = 10
+        #: client errors that are sent again, other 4xx statuses fail at once
+        self.retryClientErrors = (401, 408, 429)
+        #: seconds all attempts of a request may take together, when no deadline is active
+        self.retrySeconds = 300
+        #: seconds waited before the second attempt, doubled per attempt up to maxBackoff
+        self.retryBackoff = 0.5
+        self.maxBackoff = 10
+        self.timeout = timeout
+        self._local = threading.local()
+        self.transport = createTransport(transport, self.s)
+        self.codec = getCodec(codec)
+        self.downloader = DownloadEngine(self, store=blobstore)
+        self.previews = PreviewFetcher(self, previewCache)
+        self.hashes = createHashCache(hashCache)
 
         if version:
             self.version = str(version) + '/'
@@ -216,12 +347,13 @@ class VSDConnecter(object):
 
         token = False
         try:
-            res = self.s.get(self.url + 'tokens/jwt', auth=(self.username, self.password), verify=False)
+            res = self.transport.request('GET', self.url + 'tokens/jwt', auth=(self.username, self.password),
+                                         verify=False, timeout=self._timeout())
             res.raise_for_status()
         except:
             logger.error(res)
             raise
-        token = vsdModels.Token(**res.json())
+        token = vsdModels.Token(**self._json(res))
         try:
             payload = jwt.decode(token.tokenValue, verify=False)
 
@@ -231,72 +363,192 @@ class VSDConnecter(object):
 
         return token
 
+    #################################################
+    # timeouts and deadlines
+    ################################################
+
+    @contextmanager
+    def deadline(self, seconds):
+        """
+        context manager limiting all requests of the current thread to a time budget.
+        nested deadlines can only shorten the budget, never extend it
+
+        >> with api.deadline(300):
+        >>     items = api.getAllPaginated('objects')
+
+        :param seconds: budget in seconds, a Deadline or None (no limit)
+        :yields: the active Deadline or None
+        :raises: DeadlineExceeded if a request is attempted after the budget is used up
+        """
+
+        outer = self._deadline()
+        if seconds is None:
+            yield outer
+            return
+        inner = seconds if isinstance(seconds, Deadline) else Deadline(seconds)
+        if outer is not None and outer.remaining() < inner.remaining():
+            inner = outer
+        self._local.deadline = inner
+        try:
+            yield inner
+        finally:
+            self._local.deadline = outer
+
+    def _deadline(self):
+        """
+        :return: the deadline active in the current thread
+        :rtype: Deadline or None
+        """
+        return getattr(self._local, 'deadline', None)
+
+    def getTransferStats(self):
+        """
+        bytes received per endpoint, compressed (wire) and decoded. print(api.getTransferStats().report())
+        shows the table
+
+        :return: the transfer statistics of the transport
+        :rtype: transport.TransferStats
+        """
+        return self.transport.stats
+
+    def _timeout(self, timeout=None):
+        """
+        resolve the timeout of a single request: the per call value or the connecter default,
+        limited to the remaining budget of the active deadline
+
+        :param timeout: per call timeout, float or (connect, read) tuple
+        :return: timeout for the requests call
+        :raises: DeadlineExceeded
+        """
+
+        if timeout is None:
+            timeout = self.timeout
+        deadline = self._deadline()
+        if deadline is not None:
+            timeout = deadline.clamp(timeout)
+        return timeout
+
     #################################################
     # requests library wrappers
     ################################################
 
-    def _download(self, url, fp, onlyHeader = False):
+    def _download(self, url, fp, onlyHeader = False, timeout=None, progress=None, checksum=None):
         '''
-        download a file
+        download a file with the download engine (see self.downloader, eg. for the buffer size)
 
         :param Path fp: filepath of the file to created
         :param Bool onlyHeader: get only the header information for file types with header/raw
+        :param timeout: timeout for the request, default is the connecter timeout
+        :param progress: function called with the number of bytes written so far
+        :param checksum: SHA-1 (eg. fileHashCode) or list of SHA-1 the file must match
         :return: filename
         :rtype: str
+        :raises: ChecksumMismatch
         '''
-        r = urlparse(url)
-        res = self._requestsAttempts(self.s.get, r.geturl(), params=r.params, stream=True)
-        try:
-            filename = fp.name  # path object
-        except:
-            filename = fp  # string
+        result = self.downloader.fetch(url, fp, onlyHeader=onlyHeader, timeout=timeout, progress=progress,
+                                       checksum=checksum)
+        return result.filename
 
-        with fp.open('wb') as f:
-            print('file created')
-            for n, chunk in enumerate(res.iter_content(1024)):
-                f.write(chunk)
-                if onlyHeader and n > 2:
-                    break
-        return filename
 
+    def _json(self, res):
+        """
+        decode the JSON body of a response with the codec of the connecter
+
+        :param res: the response
+        :return: json data
+        :rtype: json
+        """
+        return self.codec.loads(res.content)
+
+    def _encodeBody(self, kwargs):
+        """
+        encode a json= request body with the codec of the connecter
+
+        :param dict kwargs: kwargs for the request call, modified in place
+        :return: kwargs
+        :rtype: dict
+        """
+
+        data = kwargs.pop('json', None)
+        if data is not None:
+            kwargs['data'] = self.codec.dumpb(data)
+            headers = dict(kwargs.get('headers') or {})
+            headers['Content-Type'] = 'application/json'
+            kwargs['headers'] = headers
+        return kwargs
 
     def _requestsAttempts(self, method, url, *args, **kwargs):
-        #     generic wrapper around request library with multiple attempts
+        #     generic wrapper around the transport with multiple attempts
         #     replaces self._httpResponseCheck(self, response):
-        #     :param method: string of the method to call "get", "put"
+        #     :param method: string of the method to call "GET", "PUT"
         #     :param url: full  url
         #     :param args: args for request call
-        #     :param kwargs: kwargs for request call
+        #     :param kwargs: kwargs for request call, timeout defaults to self.timeout
         #     :return: request object (raise if error after self.maxAttempts)
-        for i in range(self.maxAttempts):
-            res = method(url, *args, **kwargs)
-            try:
-                self._stayAlive()
-                res.raise_for_status()
-                return res
-            except:
-                logger.info("Connection attempt %s/%s: %s %s" % (i, self.maxAttempts, res , url))
-                if res.status_code == 401 and i > self.maxAttempts401:
+        #     :raises: DeadlineExceeded if the attempts take longer than retrySeconds or the active deadline
+        timeout = kwargs.pop('timeout', None)
+        self._encodeBody(kwargs)
+        # without a deadline of the caller, all attempts together are limited to retrySeconds
+        with self.deadline(self.retrySeconds):
+            for i in range(self.maxAttempts):
+                if i:
+                    self._backoff(i)
+                try:
+                    res = self.transport.request(method, url, *args, timeout=self._timeout(timeout), **kwargs)
+                except DeadlineExceeded:
                     raise
-        # re-raise if > max attempts
-        res.raise_for_status()
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+                    logger.info("Connection attempt %s/%s: %s %s" % (i, self.maxAttempts, err, url))
+                    if i == self.maxAttempts - 1:
+                        raise
+                    continue
+                try:
+                    self._stayAlive()
+                    res.raise_for_status()
+                    return res
+                except:
+                    logger.info("Connection attempt %s/%s: %s %s" % (i, self.maxAttempts, res , url))
+                    if 400 <= res.status_code < 500 and res.status_code not in self.retryClientErrors:
+                        # the same request gets the same answer
+                        raise
+                    if res.status_code == 401 and i > self.maxAttempts401:
+                        raise
+                    if i < self.maxAttempts - 1:
+                        # release the connection of a streamed response before the next attempt
+                        res.close()
+            # re-raise if > max attempts
+            res.raise_for_status()
+
+    def _backoff(self, attempt):
+        """
+        wait before the next attempt: retryBackoff doubled per attempt, at most maxBackoff and
+        never past the active deadline
+        """
+
+        delay = min(self.retryBackoff * 2 ** (attempt - 1), self.maxBackoff)
+        deadline = self._deadline()
+        if deadline is not None:
+            delay = min(delay, deadline.remaining())
+        time.sleep(delay)
 
     def _get(self, resource, *args, **kwargs):  # reimplements VSDConnect.getRequest
-        return self._requestsAttempts(self.s.get, resource, *args, **kwargs).json()
+        return self._json(self._requestsAttempts('GET', resource, *args, **kwargs))
 
     def _put(self, resource, *args, **kwargs):  # reimplements VSDConnect.putRequest
-        return self._requestsAttempts(self.s.put, resource, *args, **kwargs).json()
+        return self._json(self._requestsAttempts('PUT', resource, *args, **kwargs))
 
     def _delete(self, resource, *args, **kwargs):
-        return self._requestsAttempts(self.s.delete, resource, *args, **kwargs)#.json()
+        return self._requestsAttempts('DELETE', resource, *args, **kwargs)#.json()
 
     def _post(self, resource, *args, **kwargs): # reimplements VSDConnect.postRequest
         # should I avoid multiplt attempts? not idempotent, no multiple  attempts
-        #return self._requestsAttempts(self.s.post, resource, *args, **kwargs).json()
-        return self.s.post(resource, *args, **kwargs).json()
+        #return self._requestsAttempts('POST', resource, *args, **kwargs).json()
+        kwargs['timeout'] = self._timeout(kwargs.get('timeout'))
+        self._encodeBody(kwargs)
+        return self._json(self.transport.request('POST', resource, *args, **kwargs))
 
     def _options(self, resource, *args, **kwargs):
-        return self._requestsAttempts(self.s.options, resource, *args, **kwargs).json()
+        return self._json(self._requestsAttempts('OPTIONS', resource, *args, **kwargs))
 
     #################################################
     # api objects handling
@@ -329,7 +581,7 @@ class VSDConnecter(object):
 
         res = urlparse(str(resource))
 
-        if res.scheme == 'https':
+        if res.scheme in ('http', 'https'):
             return resource
         else:
             return self.url + resource
@@ -351,7 +603,7 @@ class VSDConnecter(object):
     # api objects handling (READ)
     ################################################
 
-    def getRequest(self, resource, rpp=None, page=None, include=None):
+    def getRequest(self, resource, rpp=None, page=None, include=None, timeout=None):
         """
         generic get request function
 
@@ -359,33 +611,34 @@ class VSDConnecter(object):
         :param int rpp: results per page to show
         :param int page: page nr to show, starts with 0
         :param str include: option to include more informations
+        :param timeout: timeout for the request, default is the connecter timeout
         :return: list of objects or None
         :rtype: json or None
         """
 
         params = dict([('rpp', rpp), ('page', page), ('include', include)])
-        return self._get(self.fullUrl(resource), params=params)
+        return self._get(self.fullUrl(resource), params=params, timeout=timeout)
 
 
-    def downloadZip(self, resource, fp):
+    def downloadZip(self, resource, fp, timeout=None):
         """
         download the zipfile into the given file (fp)
 
         :param str resource: download URL
         :param Path fp:  filepath
+        :param timeout: timeout for the request, default is the connecter timeout
         :return: None or status_code ok (200)
         :rtype: int
         """
 
         self._stayAlive()
 
-        res = self.s.get(self.fullUrl(resource), stream = True)
-        if res.ok:
-            with fp.open('wb') as f:
-                shutil.copyfileobj(res.raw, f)
-            return res.status_code
-        else:
+        try:
+            result = self.downloader.fetch(self.fullUrl(resource), fp, timeout=timeout)
+        except requests.exceptions.HTTPError as err:
+            logger.error('download of %s failed: %s', resource, err)
             return None
+        return result.status_code
 
 
     def downloadObject(self, obj, workingDir=None):
@@ -402,16 +655,115 @@ class VSDConnecter(object):
         if workingDir:
             fp = Path(workingDir, fp)
 
-        return self._download(self.fullUrl(obj.downloadUrl), fp.name)
+        return self._download(self.fullUrl(obj.downloadUrl), fp)
 
-    def downloadObjectPreviewImages(self, object, thumbnail=True):
-        field = 'thumbnailUrl' if thumbnail else 'imageUrl'
-        embeddedImages = list()
-        for i, preview in enumerate(object.objectPreviews):
-            p_obj = vsdModels.Preview(**self.getRequest(preview.selfUrl))
-            img = self._requestsAttempts(self.s.get, getattr(p_obj, field))
-            embeddedImages.append(base64.b64encode(img.content))
-        return embeddedImages
+    def extractZip(self, resource, targetDir=None, members=None, callback=None, timeout=None, progress=None):
+        """
+        download a ZIP file and extract it while it streams in, without storing the .zip
+        (see DownloadEngine.extract)
+
+        :param str resource: download URL
+        :param Path targetDir: directory to extract to
+        :param members: None (all), a function name -> bool or a list of names and glob patterns
+        :param callback: function called with the name and the data of each member instead of writing files
+        :param timeout: timeout for the requests, default is the connecter timeout
+        :param progress: function called with the number of bytes received so far
+        :return: names of the extracted members
+        :rtype: list of str
+        :raises: BadZipFile
+        """
+
+        self._stayAlive()
+
+        result = self.downloader.extract(self.fullUrl(resource), targetDir, callback=callback, members=members,
+                                         timeout=timeout, progress=progress)
+        return result.members
+
+    def extractObject(self, obj, workingDir=None, members=None, callback=None):
+        """
+        download the object and extract its files into a directory based on the object name and the
+        working directory, instead of storing the ZIP
+
+        :param APIObject obj: object
+        :param Path workingDir: workpath, where to create the directory
+        :param members: None (all), a function name -> bool or a list of names and glob patterns
+        :param callback: function called with the name and the data of each member instead of writing files
+        :return: names of the extracted members
+        :rtype: list of str
+        """
+
+        target = None
+        if callback is None:
+            target = Path(obj.name)
+            if workingDir:
+                target = Path(workingDir, target)
+
+        return self.extractZip(obj.downloadUrl, target, members=members, callback=callback)
+
+    def downloadBuffer(self, resource, buffer=None, timeout=None, progress=None, checksum=None):
+        """
+        download a file or object ZIP into memory instead of a file, eg. for pydicom or numpy
+        (see DownloadEngine.fetchInto)
+
+        :param str resource: download URL
+        :param buffer: bytearray, writable memoryview, writable file object or None (new bytearray,
+            or a spooled temporary file for large files)
+        :param timeout: timeout for the request, default is the connecter timeout
+        :param progress: function called with the number of bytes written so far
+        :param checksum: SHA-1 (eg. fileHashCode) or list of SHA-1 the file must match
+        :return: the bytearray, the filled part of the memoryview or the file object
+        :raises: ChecksumMismatch
+        """
+
+        result = self.downloader.fetchInto(self.fullUrl(resource), buffer, timeout=timeout, progress=progress,
+                                           checksum=checksum)
+        return result.data
+
+    def downloadObjectPreviewImages(self, object, thumbnail=True, encode=True):
+        """
+        download the preview images of an object
+
+        :param APIObject object: the object
+        :param bool thumbnail: the thumbnails, otherwise the full images
+        :param bool encode: base64 encode the images, otherwise the raw bytes are returned
+        :return: list of images (base64 encoded bytes or bytes)
+        :rtype: list
+        """
+        images = self.getObjectPreviews([object], thumbnail=thumbnail)[0]
+        if encode:
+            return [base64.b64encode(img) for img in images]
+        return images
+
+    def getObjectPreviews(self, objects, thumbnail=True, paths=False):
+        """
+        get the preview images of many objects concurrently (see PreviewFetcher, eg. for the workers).
+        with a previewCache, cached images are returned without requests
+
+        :param objects: APIObjects or APIBase with the selfUrl of the objects, eg. the content of a folder
+        :param bool thumbnail: the thumbnails, otherwise the full images
+        :param bool paths: return the files in the preview cache instead of the bytes
+        :return: per object a list of images, in the order of objects
+        :rtype: list of list of bytes or Path
+        """
+
+        self._stayAlive()
+
+        return self.previews.fetchObjects(objects, thumbnail=thumbnail, paths=paths)
+
+    def prefetchPreviews(self, folder, thumbnail=True, recursive=False):
+        """
+        load the preview images of the objects of a folder into the preview cache
+
+        :param folder: Folder, selfUrl or ID of the folder
+        :param bool thumbnail: the thumbnails, otherwise the full images
+        :param bool recursive: also the objects of the sub folders
+        :return: number of images in the cache for the folder
+        :rtype: int
+        """
+
+        self._stayAlive()
+
+        return self.previews.prefetch(folder, thumbnail=thumbnail, recursive=recursive)
 
     def getPaginated(self, resource):
         """
@@ -422,59 +774,109 @@ class VSDConnecter(object):
         page = vsdModels.Pagination(**res)
         return page
 
-    def getAllPaginated(self, resource, itemlist=list()):
+    def getAllPaginated(self, resource, itemlist=None, deadline=None):
         """
         returns all items as list
 
         :param str resource: resource path
         :param list itemlist: list of items
+        :param deadline: time budget in seconds (or Deadline) for reading all pages
         :return: list of items
         :rtype: list of Pagination objects
+        :raises: DeadlineExceeded
         """
 
-        res = self.getRequest(resource)
-        page = vsdModels.Pagination(**res)
-        for item in page.items:
-            itemlist.append(item)
-        if page.nextPageUrl:
-            return self.getAllPaginated(page.nextPageUrl, itemlist=itemlist)
-        else:
-            return itemlist
+        if itemlist is None:
+            itemlist = list()
+
+        with self.deadline(deadline):
+            while resource:
+                res = self.getRequest(resource)
+                page = vsdModels.Pagination(**res)
+                for item in page.items:
+                    itemlist.append(item)
+                resource = page.nextPageUrl
+        return itemlist
 
-    def iteratePageItems(self, page, func=dict):
+    def iteratePageItems(self, page, func=dict, deadline=None):
         """
         generator that returns all items
 
         :param Pagination: Pagination object
         :param func: function for converting resource
+        :param deadline: time budget in seconds (or Deadline) for fetching the following pages
         :return: iterator of items
         :rtype: iterator  of dict or model object (depending on func)
         """
 
-        for item in page.items:
-            yield func(**item)
+        if deadline is not None and not isinstance(deadline, Deadline):
+            deadline = Deadline(deadline)
 
-        if page.nextPageUrl:
-            res = self.getRequest(page.nextPageUrl)
-            nextPage = vsdModels.Pagination(**res)
-            for nextItem in self.iteratePageItems(nextPage, func=func):
-                yield nextItem
+        while page is not None:
+            for item in page.items:
+                yield func(**item)
 
-    def iterateAllPaginated(self, resource, func=dict):
+            if not page.nextPageUrl:
+                break
+            # the deadline is only active during the request, not while the caller consumes items
+            with self.deadline(deadline):
+                res = self.getRequest(page.nextPageUrl)
+            page = vsdModels.Pagination(**res)
+
+    def iterateAllPaginated(self, resource, func=dict, deadline=None):
         """
         returns all items as list
 
         :param str resource: resource path
         :param func: function for converting resource
+        :param deadline: time budget in seconds (or Deadline) for fetching all pages
         :return: iterator of items
         :rtype: list of dict or model object
         """
 
-        res = self.getRequest(resource)
+        if deadline is not None and not isinstance(deadline, Deadline):
+            deadline = Deadline(deadline)
+
+        with self.deadline(deadline):
+            res = self.getRequest(resource)
         page = vsdModels.Pagination(**res)
-        for item in self.iteratePageItems(page, func):
+        for item in self.iteratePageItems(page, func, deadline=deadline):
             yield item
 
+    def streamAllPaginated(self, resource, func=dict, rpp=None, deadline=None, chunksize=65536):
+        """
+        generator returning all items like iterateAllPaginated, but each page is parsed while it streams in.
+        the first item is available after its bytes arrived and memory is bounded by one item instead of
+        the whole page. use for large pages, eg. rpp=10000 for dicom series
+
+        :param str resource: resource path
+        :param func: function for converting resource
+        :param int rpp: results per page
+        :param deadline: time budget in seconds (or Deadline) for fetching all pages
+        :param int chunksize: size of the chunks read from the response
+        :return: iterator of items
+        :rtype: iterator of dict or model object (depending on func)
+        """
+
+        if deadline is not None and not isinstance(deadline, Deadline):
+            deadline = Deadline(deadline)
+
+        params = dict([('rpp', rpp)])
+        headers = {'Accept-Encoding': self.transport.acceptEncoding()}
+        while resource:
+            with self.deadline(deadline):
+                res = self._requestsAttempts('GET', self.fullUrl(resource), params=params,
+                                             headers=headers, stream=True)
+            try:
+                reader = PageReader(res.iter_content(chunksize), self.codec.loads)
+                for item in reader:
+                    yield func(**item)
+            finally:
+                res.close()
+            # the nextPageUrl contains the rpp
+            resource = reader.meta.get('nextPageUrl')
+            params = None
+
     def getObjects(self, idList=None):
         """
         retrieves list of objects (restricting to idList if provided)
@@ -600,20 +1002,27 @@ class VSDConnecter(object):
 
         return filehash
 
-    def walkFolder(self, folder, topdown=True):
+    def walkFolder(self, folder, topdown=True, deadline=None):
         """
         Generate the folder object and the file names in a directory tree by walking the tree either top-down or bottom-up.
         For each directory in the tree rooted at directory top (including top itself), it yields a 3-tuple
         (folderObject, dirnames, containedOnbjects).
         compare to os.walk
         :param folder: selfUrl of the top folder (or folder object)
+        :param deadline: time budget in seconds (or Deadline) for walking the whole tree
         :return: (folderObject, dirnames, containedOnbjects)
         :rtype: (vsdmodels.Folder, list(vsdmodels.APIBasic), list(vsdmodels.APIBasic))
+        :raises: DeadlineExceeded
         """
-        if isinstance(folder, basestring):
-            folderObject = self.getFolder(folder)
-        else:
+        if deadline is not None and not isinstance(deadline, Deadline):
+            deadline = Deadline(deadline)
+
+        if isinstance(folder, vsdModels.Folder):
             folderObject = folder
+        else:
+            # the deadline is only active during the request, not while the caller consumes the tree
+            with self.deadline(deadline):
+                folderObject = self.getFolder(folder)
         dirs = folderObject.childFolders
         containedObjects = folderObject.containedObjects
         if dirs is None:
@@ -624,11 +1033,29 @@ class VSDConnecter(object):
             yield folderObject, dirs, containedObjects
 
         for nextDir in dirs:
-            for x in self.walkFolder(nextDir.selfUrl):
+            for x in self.walkFolder(nextDir.selfUrl, topdown=topdown, deadline=deadline):
                 yield x
         if not topdown:
             yield folderObject, dirs, containedObjects
 
+    def mirror(self, folder, targetDir, workers=4, delete=False):
+        """
+        mirror a folder tree to a local directory: the folders are recreated as directories and the
+        files of the objects downloaded by a pool of workers (see FolderMirror). files already present
+        with matching size and hash are skipped, a rerun only transfers what changed
+
+        :param folder: Folder, selfUrl or ID of the top folder
+        :param Path targetDir: the mirror directory
+        :param int workers: objects downloaded concurrently
+        :param bool delete: remove local files that are no longer in the folder
+        :return: the counts of the run, the failed files are in result.failed
+        :rtype: MirrorResult
+        """
+
+        self._stayAlive()
+
+        return FolderMirror(self, targetDir, workers=workers).run(folder, delete=delete)
+
     def checkFileInObject(self, obj, fp):
         """
         check if a local file is part of an object
@@ -644,21 +1071,76 @@ class VSDConnecter(object):
         filehash = self.getObjectFilesHash(obj)
 
         ## Local hash
-        BLOCKSIZE = 65536
-        hasher = hashlib.sha1()
-
-        with fp.open('rb') as afile:
-            buf = afile.read(BLOCKSIZE)
-            while len(buf) > 0:
-                hasher.update(buf)
-                buf = afile.read(BLOCKSIZE)
-        localhash = hasher.hexdigest()
+        localhash = self.localSha1(fp)
 
-        if localhash.upper() in filehash:
+        if localhash in filehash:
             containted = True
 
         return containted
 
+    def localSha1(self, fp):
+        """
+        SHA-1 of a local file, from the hash cache if the file is unchanged since it was hashed
+
+        :param Path fp: the local file
+        :return: the hash (uppercase, like fileHashCode)
+        :rtype: str
+        """
+
+        if self.hashes is not None:
+            return self.hashes.sha1(fp)
+        return mmapSha1(fp)
+
+    def hashFiles(self, paths, workers=None, processes=False):
+        """
+        generator of the SHA-1 of many local files, hashed concurrently with memory mapped reads
+        (see hashing.BulkHasher). with a hash cache, unchanged files are not read again
+
+        :param paths: a directory (all files below), a file or an iterable of files
+        :param int workers: files hashed concurrently, default is the number of CPUs
+        :param bool processes: hash in a process pool instead of threads
+        :return: (path, SHA-1) per file, in the order of completion
+        :rtype: iterator of (str, str)
+        """
+
+        hasher = BulkHasher(workers, processes=processes, cache=self.hashes)
+        for item in hasher.hash(paths):
+            yield item
+        logger.info('%s', hasher)
+
+    def reconcile(self, local, remote, recursive=True, workers=8, hashWorkers=None):
+        """
+        match many local files with the files on the server by SHA-1 (see reconcile.Reconciler).
+        the server files are indexed concurrently while the local files are hashed
+
+        :param local: a directory (all files below), a file or an iterable of files
+        :param remote: Folder, selfUrl or ID of a folder, a list of objects or a reconcile.RemoteIndex
+        :param bool recursive: also the objects of the sub folders
+        :param int workers: concurrent requests
+        :param int hashWorkers: files hashed concurrently, default is the number of CPUs
+        :return: the local files present (with their objects and files) and missing on the server,
+            and the server files without local copy
+        :rtype: ReconcileResult
+        """
+
+        self._stayAlive()
+
+        return Reconciler(self, workers=workers, hashWorkers=hashWorkers).run(local, remote, recursive=recursive)
+
+    def warmHashCache(self, directory, workers=4):
+        """
+        hash the files of a local directory tree that are not in the hash cache yet
+
+        :param Path directory: the directory
+        :param int workers: files hashed concurrently
+        :return: number of files in the tree and number hashed
+        :rtype: (int, int)
+        """
+
+        if self.hashes is None:
+            raise ValueError('warming needs a hash cache, see the hashCache of the VSDConnecter')
+        return self.hashes.warm(directory, workers=workers)
+
     def searchTerm(self, resource, search, mode='default'):
         """ search a resource using oAuths
 
@@ -1277,37 +1759,47 @@ class VSDConnecter(object):
                     break
                 yield (chunk)
 
-    def chunkFileUpload(self, fp, chunksize=1024 * 4096):
+    def chunkFileUpload(self, fp, chunksize=1024 * 4096, maxWorkers=4, progress=None, timeout=None, resume=True,
+                        stateDir=None, adaptive=False, index=None):
         """
-        upload large files in chunks of max 100 MB size
+        upload large files in chunks of max 100 MB size. maxWorkers chunks are sent concurrently,
+        streamed from disk, and a failed chunk is sent again (see upload.ChunkedUpload).
+        the uploaded chunks are recorded in <fp>.upload.json, a failed upload called again only
+        sends the missing chunks and the commit
 
         :param Path fp: the file to upload
         :param int chunksize: size in bytes of the chunk parts, default is 4MB
-        :return: the generated object
-        :rtype: APIObject
-        """
-        parts = int(math.ceil(fp.stat().st_size / float(chunksize)))
-        err = False
-        maxchunksize = 1024 * 1024 * 100
+        :param int maxWorkers: chunks sent concurrently, 1 sends them one after the other
+        :param progress: function called with the number of bytes sent so far
+        :param timeout: timeout for the requests, default is the connecter timeout
+        :param bool resume: record the uploaded chunks and skip them when called again
+        :param Path stateDir: directory of the upload manifests, default is next to the file
+        :param bool adaptive: chunksize is the first chunk size, the next ones follow the measured throughput
+        :param HashIndex index: hashes of the files on the server, a file already there is not uploaded
+        :return: the file and the generated object
+        :rtype: (APIFile, APIObject)
+        """
+        fp = Path(fp)
+        maxchunksize = ChunkedUpload.maxChunk
         if chunksize >= maxchunksize:
             print(
                 'not uploaded: defined chunksize {0} is bigger than the allowed maximum {1}'.format(chunksize, maxchunksize))
             return None
 
-        part = 0
-        for part, chunk in enumerate(self.chunkedread(fp, chunksize),1):
-            logger.info('({2})uploading part {0} of {1}'.format(part, parts, fp.name))
-            files = {'file': (str(fp.name), chunk)}
-            res = self._post(self.fullUrl('/chunked_upload?chunk={0}').format(part), files=files)
-
-            print('finish, uploaded part {0} of {1} '.format(part, parts))
-        res = self._post(self.fullUrl('chunked_upload/commit?filename={0}'.format(fp.name)))
+        sha1 = self.localSha1(fp) if index is not None else None
+        known = self._findUploaded(index, sha1, fp.stat().st_size)
+        if known is not None:
+            return known
+
+        upload = ChunkedUpload(self, fp, chunksize, maxWorkers=maxWorkers, progress=progress, resume=resume,
+                               stateDir=stateDir, adaptive=adaptive)
+        result = upload.run(timeout=timeout)
+        logger.info('%s', result)
+        res = result.response
+        if index is not None:
+            index.put(sha1, res['file']['selfUrl'], res['relatedObject']['selfUrl'], result.size)
         return self.getFile(res['file']['selfUrl']), self.getObject(res['relatedObject']['selfUrl'])
 
-        # relObj = res['relatedObject']
-        # obj = self.getObject(relObj['selfUrl'])
-        # return obj
-
 
 
     def postFolder(self, parent, name, check=True):
@@ -1355,28 +1847,112 @@ class VSDConnecter(object):
             assert folder.name == name
             return folder
 
-    def uploadFile(self, filename):
+    def uploadFile(self, filename, progress=None, timeout=None, index=None):
         """
-        push (post) a file to the server
+        push (post) a file to the server. the file is streamed from disk as multipart body,
+        memory stays constant regardless of the file size (see upload.MultipartFile)
 
         :param Path filename: the file to be uploaded
+        :param progress: function called with the number of bytes sent so far
+        :param timeout: timeout for the request, default is the connecter timeout
+        :param HashIndex index: hashes of the files on the server, a file already there is not uploaded
         :return: the file object containing the related object selfUrl
         :rtype: APIObject
         """
 
         try:
-            data = filename.open(mode='rb').read()
-            ##workaround for file without file extensions
-            if filename.suffix == '':
-                filename = filename.with_suffix('.dcm')
-            files = {'file': (str(filename.name), data)}
-        except:
+            body = self._uploadBody(filename, progress=progress)
+            sha1 = self.localSha1(filename) if index is not None else None
+        except (IOError, OSError):
             print("opening file", filename, "failed, aborting")
             return
 
-        res = self._post(self.url + 'upload', files=files)
+        known = self._findUploaded(index, sha1, body.size)
+        if known is not None:
+            return known
+        res = self._postUpload(body, timeout=timeout)
+        if index is not None:
+            index.put(sha1, res['file']['selfUrl'], res['relatedObject']['selfUrl'], body.size)
         return self.getFile(res['file']['selfUrl']), self.getObject(res['relatedObject']['selfUrl'])
 
+    def _findUploaded(self, index, sha1, size):
+        """
+        look up the hash of a local file in the hash index
+
+        :param HashIndex index: the index, None finds nothing
+        :param str sha1: SHA-1 of the local file
+        :param int size: size of the local file
+        :return: the file and object on the server or None
+        :rtype: (APIFile, APIObject)
+        """
+
+        if index is None:
+            return None
+        entry = index.find(sha1, size)
+        if entry is None:
+            return None
+        logger.info('%s is on the server as %s, not uploaded', sha1, entry['file'])
+        obj = self.getObject(entry['object']) if entry.get('object') else None
+        return self.getFile(entry['file']), obj
+
+    def buildHashIndex(self, folder=None, path=None, recursive=True, workers=8):
+        """
+        index the SHA-1 of the files on the server, for uploads without duplicates
+        (see uploadFile, chunkFileUpload and ingest). objects already in a saved index
+        are not fetched again
+
+        :param folder: Folder, selfUrl or ID of the folder to index, None only loads the index
+        :param Path path: file the index is loaded from and saved to, None keeps it in memory
+        :param bool recursive: also the objects of the sub folders
+        :param int workers: concurrent requests
+        :return: the index
+        :rtype: HashIndex
+        """
+
+        self._stayAlive()
+
+        index = HashIndex.load(path) if path is not None else HashIndex()
+        if folder is not None:
+            index.addFolder(self, folder, recursive=recursive, workers=workers)
+            index.save()
+        return index
+
+    def _uploadFile(self, filename, progress=None, timeout=None):
+        """
+        post a file as streamed multipart body
+
+        :return: the response with the selfUrls of the file and the related object
+        :rtype: json
+        """
+
+        return self._postUpload(self._uploadBody(filename, progress=progress), timeout=timeout)
+
+    def _uploadBody(self, filename, progress=None):
+        """
+        the multipart body of a file upload, only the local file is accessed
+
+        :rtype: MultipartFile
+        """
+
+        filename = Path(filename)
+        name = filename.name
+        ##workaround for file without file extensions
+        if filename.suffix == '':
+            name = filename.with_suffix('.dcm').name
+        return MultipartFile(filename, filename=name, progress=progress)
+
+    def _postUpload(self, body, timeout=None):
+        """
+        post a multipart body to the upload resource
+
+        :return: the response with the selfUrls of the file and the related object
+        :rtype: json
+        """
+
+        res = self._post(self.url + 'upload', data=body, headers=body.headers(), timeout=timeout)
+        logger.info('%s', body)
+        return res
+
 
     #################################################
     # api objects handling (UPDATE)
@@ -1422,8 +1998,8 @@ class VSDConnecter(object):
         :rtype: json
         """
 
-        req = self.s.post(self.fullUrl(resource))
-        return req.json()
+        req = self.transport.request('POST', self.fullUrl(resource), timeout=self._timeout())
+        return self._json(req)
 
     def putRequestSimple(self, resource):
         """
@@ -1434,8 +2010,8 @@ class VSDConnecter(object):
         :rtype: json
         """
 
-        req = self.s.put(self.fullUrl(resource))
-        return req.json()
+        req = self.transport.request('PUT', self.fullUrl(resource), timeout=self._timeout())
+        return self._json(req)
 
     def publishObject(self, obj):
         """
@@ -1447,7 +2023,7 @@ class VSDConnecter(object):
         """
 
         try:
-            req = self.s.put(obj.selfUrl + '/publish')
+            req = self.transport.request('PUT', obj.selfUrl + '/publish', timeout=self._timeout())
             if req.status_code == requests.codes.ok:
                 print('object {0} published'.format(obj.id))
                 return self.getObject(obj.selfUrl)
@@ -1497,7 +2073,7 @@ class VSDConnecter(object):
             objRight.relatedRights = rights
             objRight.relatedUser = dict([('selfUrl', group.selfUrl)])
             res = self.postRequest('object-user-rights', data=objRight.to_struct())
-            objRight.set(res)
+            objRight.populate(**res)
 
         else:
             objRight = vsdModels.ObjectGroupRight()
@@ -1505,7 +2081,7 @@ class VSDConnecter(object):
             objRight.relatedRights = rights
             objRight.relatedGroup = dict([('selfUrl', group.selfUrl)])
             res = self.postRequest('object-group-rights', data=objRight.to_struct())
-            objRight.set(res)
+            objRight.populate(**res)
         return objRight
 
     def postObjectUserRights(self, obj, user, perms):
@@ -1529,7 +2105,7 @@ class VSDConnecter(object):
         objRight.relatedUser = dict([('selfUrl', user.selfUrl)])
 
         res = self.postRequest('object-user-rights', data=objRight.to_struct())
-        objRight.set(res)
+        objRight.populate(**res)
 
         return objRight
 
@@ -1555,7 +2131,7 @@ class VSDConnecter(object):
         objRight.relatedGroup = dict([('selfUrl', group.selfUrl)])
 
         res = self.postRequest('object-group-rights', data=objRight.to_struct())
-        objRight.set(res)
+        objRight.populate(**res)
 
         return objRight
 
@@ -1589,7 +2165,9 @@ class VSDConnecter(object):
         :rtype: json
         """
 
-        link = vsdModels.ObjectLink(object1=obj1, object2=obj2)
+        # the objects are referred to by selfUrl, not sent with all their fields
+        link = vsdModels.ObjectLinks(object1=vsdModels.APIBase(selfUrl=obj1.selfUrl),
+                                     object2=vsdModels.APIBase(selfUrl=obj2.selfUrl))
         link.validate()
         return self.postRequest('object-links', data=link.to_struct())
 
@@ -1677,6 +2255,136 @@ class VSDConnecter(object):
             print('Root folder does not exist', rootfolder)
             return None
 
+    def ingest(self, localDir, remoteRoot, workers=4, chunkThreshold=500 * 1024 * 1024, stateDir=None, index=None):
+        """
+        upload a local directory tree into a folder: the sub directories are created as folders once,
+        the files uploaded by a pool of workers and the objects added to their folders with one update
+        per folder (see ingest.Ingest). the progress is recorded in stateDir, an interrupted ingestion
+        called again continues where it stopped
+
+        :param Path localDir: the local directory, its content is added to the remote root
+        :param remoteRoot: Folder, selfUrl or ID of the remote root folder
+        :param int workers: concurrent uploads and folder requests
+        :param int chunkThreshold: size in bytes from which files are uploaded in chunks
+        :param Path stateDir: directory of the ingestion state, default is localDir/.vsdingest
+        :param HashIndex index: hashes of the files on the server, files already there are not uploaded,
+            their objects are added to the folders
+        :return: counts and throughput per stage, the failed files are in result.failed
+        :rtype: IngestResult
+        """
+
+        self._stayAlive()
+
+        return Ingest(self, localDir, workers=workers, chunkThreshold=chunkThreshold, stateDir=stateDir,
+                      index=index).run(remoteRoot)
+
+    def unitOfWork(self, workers=8):
+        """
+        context manager collecting changes (putObject, folder membership, object rights, links)
+        and sending them when the block ends, redundant changes merged and independent requests
+        sent concurrently (see unitofwork.UnitOfWork)::
+
+            with api.unitOfWork() as uow:
+                uow.putObject(obj)
+                uow.addObjectToFolder(folder, obj)
+            print(uow.result)
+
+        :param int workers: concurrent requests
+        :return: the unit of work
+        :rtype: UnitOfWork
+        """
+
+        self._stayAlive()
+
+        return UnitOfWork(self, workers=workers)
+
+    def updateFolderObjects(self, target, add=None, remove=None):
+        """
+        add and remove many objects of a folder with one update. the membership is checked against a
+        set of selfUrls, objects already in the folder are not added twice. nothing is sent if the
+        folder does not change
+
+        :param Folder target: the folder, its containedObjects are replaced once the update succeeded
+        :param add: objects to add (APIObject, APIBase or selfUrl)
+        :param remove: objects to remove (APIObject, APIBase or selfUrl)
+        :return: the updated folder, None if nothing changed or the update failed
+        :rtype: json
+        """
+
+        objects = self._changedFolderObjects(target, add, remove)
+        if objects is None:
+            return None
+        return self._putFolderObjects(target, objects)
+
+    def _changedFolderObjects(self, target, add=None, remove=None):
+        """
+        the objects of a folder after adding and removing objects, the folder is not changed
+
+        :return: the new containedObjects, None if they are unchanged
+        :rtype: list of APIBase
+        """
+
+        contained = target.containedObjects or list()
+        present = set(o.selfUrl for o in contained)
+        drop = set(getattr(o, 'selfUrl', o) for o in remove or []) & present
+        added = list()
+        for obj in add or []:
+            url = getattr(obj, 'selfUrl', obj)
+            if url not in present:
+                present.add(url)
+                added.append(vsdModels.APIBase(selfUrl=url))
+
+        if not added and not drop:
+            return None
+        return [o for o in contained if o.selfUrl not in drop] + added
+
+    def _putFolderObjects(self, target, objects):
+        """
+        update the objects of a folder, target.containedObjects is only replaced if the update succeeded
+
+        :param Folder target: the folder
+        :param list objects: the new containedObjects (APIBase)
+        :return: the updated folder, None if the update failed
+        :rtype: json
+        """
+
+        data = target.to_struct()
+        data['containedObjects'] = [o.to_struct() for o in objects]
+        res = self.putRequest('folders', data=data)
+        if res is not None:
+            target.containedObjects = objects
+        return res
+
+    def addObjectsToFolder(self, target, objects):
+        """
+        add many objects to the folder with one update
+
+        :param Folder target: the target folder
+        :param objects: the objects to add (APIObject, APIBase or selfUrl)
+        :return: updated folder, the target if the objects are already in it, None if the update failed
+        :rtype: Folder
+        """
+
+        changed = self._changedFolderObjects(target, add=objects)
+        if changed is None:
+            return target
+        res = self._putFolderObjects(target, changed)
+        if res is None:
+            return None
+        return vsdModels.Folder(**res)
+
+    def removeObjectsFromFolder(self, target, objects):
+        """
+        remove many objects from the folder with one update
+
+        :param Folder target: the target folder
+        :param objects: the objects to remove (APIObject, APIBase or selfUrl)
+        :return: if the folder was updated, False if the update failed and the target is unchanged
+        :rtype: bool
+        """
+
+        return self.updateFolderObjects(target, remove=objects) is not None
+
     def addObjectToFolder(self, target, obj):
         """
         add an object to the folder
@@ -1687,17 +2395,7 @@ class VSDConnecter(object):
         :rtype: Folder
         """
 
-        objSelfUrl = vsdModels.APIBase(**obj.to_struct())
-
-        if not objSelfUrl in target.containedObjects:
-            target.containedObjects.append(objSelfUrl)
-            res = self.putRequest('folders', data=target.to_struct())
-
-            target = vsdModels.Folder(**res)
-            return target
-
-        else:
-            return target
+        return self.addObjectsToFolder(target, [obj])
 
     def removeObjectFromFolder(self, target, obj):
         """
@@ -1705,26 +2403,14 @@ class VSDConnecter(object):
 
         :param APIFolder target: the target folder
         :param APIObject obj: the object to remove
-        :return: updated folder
-        :rtype: APIFolder
+        :return: if the folder was updated
+        :rtype: bool
         """
 
-        objSelfUrl = dict([('selfUrl', obj.selfUrl)])
-        objects = target.containedObjects
-
-        isset = False
-
-        if objects:
-            if objects.count(objSelfUrl) > 0:
-                objects.remove(objSelfUrl)
-                target.containedObjects = objects
-                res = self.putRequest('folders', data=target.to_struct())
-
-                if not isinstance(res, int):
-                    isset = True
-            else:
-                print('object not part of that folder')
-        else:
+        if not target.containedObjects:
             print('folder containes no objects')
-
-        return isset
+            return False
+        if obj.selfUrl not in set(o.selfUrl for o in target.containedObjects):
+            print('object not part of that folder')
+            return False
+        return self.removeObjectsFromFolder(target, [obj])
@@ -0,0 +1,230 @@
+#!/usr/bin/python
+"""
+=======
+INFOS
+=======
+* python version: 3.5
+* connectVSD 0.8.1
+* module: dedup
+
+========
+CHANGES
+========
+* local index of the file hashes on the server, for uploads without duplicates
+
+"""
+
+import logging
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from requests.exceptions import RequestException
+
+import vsdConnect.models as vsdModels
+from vsdConnect.codec import getCodec
+
+logger = logging.getLogger(__name__)
+
+
+class HashIndex(object):
+    """
+    local index of the files on the server by their SHA-1 (fileHashCode and anonymizedFileHashCode),
+    built from folder and file listings. a local file whose hash is in the index is already on the
+    server and does not have to be uploaded again. hits and bytesAvoided count the uploads saved
+
+    the index is a cache: files removed on the server stay in it until it is rebuilt. objects and files
+    that could not be read are in failed, their files are missing from the index
+
+    :param Path path: file the index is saved to, None keeps it in memory only
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path is not None else None
+        #: SHA-1 (uppercase) -> dict(file, object, size)
+        self.hashes = dict()
+        #: selfUrls of the objects whose files are indexed
+        self.objects = set()
+        #: selfUrl -> error of the objects and files not indexed, until they are indexed
+        self.failed = dict()
+        self.hits = 0
+        self.bytesAvoided = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        """
+        :return: the index saved in path, an empty index if there is none
+        :rtype: HashIndex
+        """
+        index = cls(path)
+        try:
+            data = getCodec().loads(Path(path).read_bytes())
+        except (IOError, OSError, ValueError):
+            return index
+        if isinstance(data, dict):
+            index._restore(data)
+        return index
+
+    def _restore(self, data):
+        self.hashes = data.get('hashes') or dict()
+        self.objects = set(data.get('objects') or [])
+
+    def _data(self):
+        return dict(hashes=self.hashes, objects=sorted(self.objects))
+
+    def save(self):
+        """
+        write the index atomically to its path
+        """
+        if self.path is None:
+            return
+        with self._lock:
+            data = self._data()
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + '.tmp')
+            tmp.write_bytes(getCodec().dumpb(data))
+            os.replace(str(tmp), str(self.path))
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __contains__(self, sha1):
+        return sha1.upper() in self.hashes
+
+    def put(self, sha1, fileUrl, objectUrl=None, size=None):
+        """
+        add a file to the index, eg. after it was uploaded
+
+        :param str sha1: SHA-1 of the file
+        :param str fileUrl: selfUrl of the file
+        :param str objectUrl: selfUrl of the object of the file
+        :param int size: size of the file in bytes
+        """
+        with self._lock:
+            self.hashes.setdefault(sha1.upper(), dict(file=fileUrl, object=objectUrl, size=size))
+
+    def add(self, f, obj=None):
+        """
+        add a file of the server, under its hash and its anonymized hash
+
+        :param APIFile f: the file
+        :param obj: the object of the file (or its selfUrl), default is the first object of the file
+        """
+        if obj is None and f.objects is not None and f.objects.items:
+            obj = f.objects.items[0].get('selfUrl')
+        objectUrl = getattr(obj, 'selfUrl', obj)
+        for h in (f.fileHashCode, f.anonymizedFileHashCode):
+            if h:
+                self.put(h, f.selfUrl, objectUrl, f.size)
+
+    def find(self, sha1, size=None):
+        """
+        look up a local file, a match is counted as upload avoided
+
+        :param str sha1: SHA-1 of the local file
+        :param int size: size of the local file in bytes
+        :return: dict(file, object, size) of the file on the server, or None
+        :rtype: dict
+        """
+        with self._lock:
+            entry = self.hashes.get(sha1.upper())
+            if entry is None:
+                return None
+            self.hits += 1
+            self.bytesAvoided += size if size is not None else entry.get('size') or 0
+        return entry
+
+    def _fail(self, url, err):
+        logger.warning('%s: %s', url, err)
+        with self._lock:
+            self.failed[url] = str(err)
+
+    def addObjects(self, apisession, objects, workers=8):
+        """
+        index the files of objects, concurrently. objects already indexed are skipped,
+        the objects that could not be read are in failed
+
+        :param VSDConnecter apisession: the API session
+        :param objects: APIObjects or APIBase with the selfUrl of the objects
+        :param int workers: concurrent requests
+        :return: number of files added
+        :rtype: int
+        """
+
+        todo = [o for o in objects if o.selfUrl not in self.objects]
+        deadline = apisession._deadline()
+
+        def one(item):
+            try:
+                with apisession.deadline(deadline):
+                    obj = item if isinstance(item, vsdModels.APIObject) else apisession.getObject(item.selfUrl)
+                    files = apisession.getObjectFiles(obj)
+            except RequestException as err:
+                self._fail(item.selfUrl, 'files not indexed: {0}'.format(err))
+                return 0
+            for f in files:
+                self.add(f, item.selfUrl)
+            with self._lock:
+                self.objects.add(item.selfUrl)
+                self.failed.pop(item.selfUrl, None)
+            return len(files)
+
+        with ThreadPoolExecutor(max(1, workers)) as pool:
+            return sum(pool.map(one, todo))
+
+    def addFolder(self, apisession, folder, recursive=True, workers=8):
+        """
+        index the files of the objects of a folder
+
+        :param VSDConnecter apisession: the API session
+        :param folder: Folder, selfUrl or ID of the folder
+        :param bool recursive: also the objects of the sub folders
+        :param int workers: concurrent requests
+        :return: number of files added
+        :rtype: int
+        """
+        if recursive:
+            objects = [obj for f, dirs, objs in apisession.walkFolder(folder) for obj in objs]
+        else:
+            if not isinstance(folder, vsdModels.Folder):
+                folder = apisession.getFolder(folder)
+            objects = folder.containedObjects or []
+        # an object can be in several folders
+        unique = dict((o.selfUrl, o) for o in objects)
+        return self.addObjects(apisession, unique.values(), workers=workers)
+
+    def addListing(self, apisession, resource='files', workers=8):
+        """
+        index a paginated file listing. listed files without hash are fetched concurrently,
+        the files that could not be read are in failed
+
+        :param VSDConnecter apisession: the API session
+        :param str resource: the listing, eg. files
+        :param int workers: concurrent requests
+        :return: number of files added
+        :rtype: int
+        """
+
+        deadline = apisession._deadline()
+
+        def one(item):
+            try:
+                with apisession.deadline(deadline):
+                    f = vsdModels.Files(**item) if item.get('fileHashCode') else apisession.getFile(item['selfUrl'])
+            except RequestException as err:
+                self._fail(item.get('selfUrl'), 'file not indexed: {0}'.format(err))
+                return 0
+            self.add(f)
+            with self._lock:
+                self.failed.pop(item.get('selfUrl'), None)
+            return 1
+
+        with ThreadPoolExecutor(max(1, workers)) as pool:
+            return sum(pool.map(one, apisession.iterateAllPaginated(resource)))
+
+    def __str__(self):
+        return '{0} hashes of {1} objects, {2} uploads avoided, {3:.1f} MB'.format(
+            len(self.hashes), len(self.objects), self.hits, self.bytesAvoided / 1e6)
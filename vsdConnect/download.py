@@ -0,0 +1,1275 @@
+#!/usr/bin/python
+"""
+=======
+INFOS
+=======
+* python version: 3.5
+* connectVSD 0.8.1
+* module: download
+
+========
+CHANGES
+========
+* download engine for files and object ZIPs: large reused buffers, preallocation, throughput
+* parallel HTTP range downloads with adaptive segment sizes
+* resumable downloads: .part file with a checkpoint of the completed ranges
+* SHA-1 verification while downloading
+* downloads into memory: bytearray, memoryview, file object or spooled temporary file
+* extraction of ZIP members while downloading, only the selected members with range support
+* files with a known SHA-1 are taken from the blob store
+
+"""
+
+import bisect
+import hashlib
+import logging
+import math
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pathlib import Path
+
+import requests
+from requests.packages import urllib3
+
+from vsdConnect.blobstore import createBlobStore
+from vsdConnect.codec import getCodec
+from vsdConnect.unzip import (TAIL_BYTES, MemberHandler, ZipStreamParser, centralDirectory,
+                              endOfCentralDirectory, endOfCentralDirectory64)
+
+logger = logging.getLogger(__name__)
+
+
+class IncompleteDownload(requests.exceptions.ConnectionError):
+    """the connection closed before all bytes announced by Content-Length arrived"""
+
+    def __init__(self, *args, **kwargs):
+        #: bytes received before the connection was lost
+        self.bytes = kwargs.pop('bytes', 0)
+        super(IncompleteDownload, self).__init__(*args, **kwargs)
+
+
+class ChecksumMismatch(requests.exceptions.RequestException):
+    """the downloaded file does not match the expected hash"""
+
+    def __init__(self, *args, **kwargs):
+        #: accepted hex digests
+        self.expected = kwargs.pop('expected', None)
+        #: hex digest of the downloaded file
+        self.actual = kwargs.pop('actual', None)
+        super(ChecksumMismatch, self).__init__(*args, **kwargs)
+
+
+_CONTENT_RANGE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+)')
+
+
+def contentRange(res):
+    """
+    parse the Content-Range of a 206 response
+
+    :return: (first, last, total) byte or None
+    :rtype: tuple of int
+    """
+
+    if res.status_code != 206:
+        return None
+    m = _CONTENT_RANGE.match(res.headers.get('Content-Range', ''))
+    if m is None:
+        return None
+    return tuple(int(x) for x in m.groups())
+
+
+class DownloadResult(object):
+    """
+    result of a download
+
+    :param str url: the downloaded url
+    :param Path fp: the written file
+    """
+
+    def __init__(self, url, fp=None):
+        self.url = url
+        self.fp = fp
+        self.status_code = None
+        self.size = None
+        self.bytes = 0
+        self.seconds = 0.0
+        self.segments = 1
+        self.workers = 1
+        #: bytes already present from an interrupted download
+        self.resumed = 0
+        #: SHA-1 of the file (uppercase hex) if it was verified
+        self.checksum = None
+        #: the body of an in memory download (see DownloadEngine.fetchInto)
+        self.data = None
+        #: names of the extracted ZIP members (see DownloadEngine.extract)
+        self.members = None
+        #: taken from the blob store, nothing was downloaded
+        self.cached = False
+
+    @property
+    def filename(self):
+        return None if self.fp is None else self.fp.name
+
+    @property
+    def throughput(self):
+        """
+        :return: bytes per second
+        :rtype: float
+        """
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return '{0}: {1:.1f} MB in {2:.2f}s ({3:.1f} MB/s, {4} segments, {5} connections)'.format(
+            self.filename or self.url, self.bytes / 1e6, self.seconds, self.throughput / 1e6,
+            self.segments, self.workers)
+
+
+def preallocate(f, size):
+    """
+    reserve the disk space of a file, so it is written into one contiguous allocation.
+    falls back to extending the file if the filesystem does not support fallocate
+
+    :param file f: file opened for writing
+    :param int size: size in bytes
+    """
+
+    if size <= 0:
+        return
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+            return
+        except OSError:
+            pass
+    f.truncate(size)
+
+
+class StreamHash(object):
+    """
+    hash of a file computed while it is written, also when segments arrive out of order.
+    bytes written at the hashed position are hashed from memory. bytes written ahead of it
+    (other segments, resumed ranges) are read back once the hashed position reaches them,
+    shortly after they were flushed and usually still in the page cache
+
+    :param Path path: the written file, None if it is written sequentially
+    :param str algorithm: hashlib algorithm
+    """
+
+    def __init__(self, path=None, algorithm='sha1'):
+        self.path = Path(path) if path is not None else None
+        self.algorithm = algorithm
+        self._lock = threading.Lock()
+        self._buf = None
+        self.reset()
+
+    def reset(self):
+        """
+        start again, eg. when the file is downloaded from byte zero
+        """
+        with self._lock:
+            self.hasher = hashlib.new(self.algorithm)
+            #: bytes hashed
+            self.pos = 0
+            #: bytes read back from the file
+            self.readBack = 0
+            self._ahead = list()
+
+    def update(self, offset, view):
+        """
+        bytes written at offset, hashed if they continue the hashed part
+        """
+        with self._lock:
+            if offset == self.pos:
+                self.hasher.update(view)
+                self.pos += len(view)
+
+    def flushed(self, start, end):
+        """
+        the range [start, end) is flushed to the file, hash it if the hashed part reached it
+        """
+        with self._lock:
+            if end > self.pos:
+                merged = list()
+                for a, b in sorted(self._ahead + [[max(start, self.pos), end]]):
+                    if merged and a <= merged[-1][1]:
+                        merged[-1][1] = max(merged[-1][1], b)
+                    else:
+                        merged.append([a, b])
+                self._ahead = merged
+            # the hashed part may have reached ranges flushed before
+            while self._ahead and self._ahead[0][0] <= self.pos:
+                end = self._ahead.pop(0)[1]
+                if end > self.pos:
+                    self._readBack(end)
+
+    def _readBack(self, end):
+        if self.path is None:
+            raise IOError('bytes {0} to {1} are not hashed and cannot be read back without a path'.format(
+                self.pos, end))
+        if self._buf is None:
+            self._buf = memoryview(bytearray(1024 * 1024))
+        with self.path.open('rb') as f:
+            f.seek(self.pos)
+            while self.pos < end:
+                n = f.readinto(self._buf[:min(len(self._buf), end - self.pos)])
+                if not n:
+                    raise IOError('{0}: file shorter than {1} bytes'.format(self.path, end))
+                self.hasher.update(self._buf[:n])
+                self.pos += n
+                self.readBack += n
+
+    def hexdigest(self, size):
+        """
+        :param int size: size of the file, bytes not hashed yet are read back
+        :return: the hash of the complete file, uppercase as fileHashCode
+        :rtype: str
+        """
+        with self._lock:
+            if self.pos < size:
+                self._readBack(size)
+            self._ahead = list()
+            return self.hasher.hexdigest().upper()
+
+
+class Checkpoint(object):
+    """
+    sidecar of a .part file recording the byte ranges already written, so an interrupted download
+    continues where it stopped, also after a restart of the process. only bytes flushed to the
+    .part file are recorded
+
+    :param Path path: the sidecar file
+    :param str url: the downloaded url
+    :param int size: size of the complete file
+    :param str validator: ETag or Last-Modified of the file, a changed file is downloaded again
+    :param list done: completed [start, end) ranges
+    """
+
+    def __init__(self, path, url, size, validator=None, done=None):
+        self.path = Path(path)
+        self.url = url
+        self.size = size
+        self.validator = validator
+        self.done = [list(r) for r in done or []]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, url):
+        """
+        :return: the checkpoint of url stored in path or None
+        :rtype: Checkpoint
+        """
+        try:
+            data = getCodec().loads(Path(path).read_bytes())
+        except (IOError, OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get('url') != url or data.get('size') is None:
+            return None
+        return cls(path, url, data['size'], data.get('validator'), data.get('done'))
+
+    def add(self, start, end):
+        """
+        record the range [start, end) as written
+        """
+        if end <= start:
+            return
+        with self._lock:
+            merged = list()
+            for a, b in sorted(self.done + [[start, end]]):
+                if merged and a <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], b)
+                else:
+                    merged.append([a, b])
+            self.done = merged
+
+    def completed(self):
+        """
+        :return: bytes written
+        :rtype: int
+        """
+        with self._lock:
+            return sum(b - a for a, b in self.done)
+
+    def missing(self):
+        """
+        :return: the [start, end) ranges still to download
+        :rtype: list of tuple
+        """
+        gaps = list()
+        pos = 0
+        with self._lock:
+            for a, b in self.done:
+                if a > pos:
+                    gaps.append((pos, a))
+                pos = max(pos, b)
+        if pos < self.size:
+            gaps.append((pos, self.size))
+        return gaps
+
+    def save(self):
+        """
+        write the sidecar atomically
+        """
+        with self._lock:
+            data = dict(url=self.url, size=self.size, validator=self.validator, done=self.done)
+            tmp = self.path.with_name(self.path.name + '.tmp')
+            tmp.write_bytes(getCodec().dumpb(data))
+            os.replace(str(tmp), str(self.path))
+
+    def remove(self):
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+
+class DownloadEngine(object):
+    """
+    downloads files and object ZIPs of a connecter. the body is read with readinto() into a large
+    buffer that is reused by the thread, so there is no per chunk allocation and the Python overhead
+    per byte stays negligible with multi-GB files.
+
+    if the server supports byte ranges, large files are split into segments that are fetched over
+    maxWorkers connections and written at their offset. segments are sized so each takes about
+    segmentSeconds at the measured rate. without range support the file is read in one stream.
+
+    with range support the file is written to <name>.part and the completed ranges to
+    <name>.part.json. a failed download called again resumes from there, the .part file is
+    renamed to the target once complete
+
+    with a blob store, downloads with a checksum are looked up in the store first and verified
+    downloads are added to it
+
+    :param VSDConnecter apisession: the API session
+    :param int bufsize: size of the read buffer in bytes
+    :param int maxWorkers: parallel connections per download, 1 disables range requests
+    :param store: blob store of downloaded files, a directory or a blobstore.BlobStore
+    """
+
+    #: bytes read with onlyHeader, enough for the header of raw/header image formats
+    headerBytes = 4096
+    #: smallest segment, also the size of the first request
+    minSegment = 8 * 1024 * 1024
+    #: largest segment
+    maxSegment = 256 * 1024 * 1024
+    #: target duration of a segment at the measured rate
+    segmentSeconds = 4.0
+    #: attempts to complete a segment after the connection was lost
+    segmentAttempts = 5
+    #: the checkpoint of a stream is saved after this many bytes
+    checkpointBytes = 16 * 1024 * 1024
+    #: downloads of a file that does not match its checksum
+    verifyAttempts = 2
+    #: in memory downloads larger than this go to a spooled temporary file
+    spoolBytes = 256 * 1024 * 1024
+
+    def __init__(self, apisession, bufsize=1024 * 1024, maxWorkers=4, store=None):
+        self.apisession = apisession
+        self.bufsize = bufsize
+        self.maxWorkers = maxWorkers
+        self.store = createBlobStore(store)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.totalBytes = 0
+        self.totalSeconds = 0.0
+
+    def _buffer(self):
+        # the read buffer of the current thread
+        buf = getattr(self._local, 'buf', None)
+        if buf is None or len(buf) != self.bufsize:
+            buf = memoryview(bytearray(self.bufsize))
+            self._local.buf = buf
+        return buf
+
+    @property
+    def throughput(self):
+        """
+        :return: average bytes per second of all downloads
+        :rtype: float
+        """
+        return self.totalBytes / self.totalSeconds if self.totalSeconds else 0.0
+
+    def _open(self, url, headers=None, timeout=None):
+        """
+        start the GET request, the body is not read yet. compression is disabled, so the body is
+        the file and Content-Length its size
+
+        :return: the streamed response
+        """
+
+        hdrs = {'Accept-Encoding': 'identity'}
+        if headers:
+            hdrs.update(headers)
+        return self.apisession._requestsAttempts('GET', url, headers=hdrs, stream=True, timeout=timeout)
+
+    def _copy(self, res, write, limit=None, progress=None, into=None):
+        """
+        copy the body of a response
+
+        :param res: the streamed response
+        :param write: function writing a memoryview
+        :param int limit: stop after limit bytes
+        :param progress: function called with the number of bytes of each write
+        :param memoryview into: read the body directly into this view instead of calling write
+        :return: bytes copied
+        :rtype: int
+        :raises: IncompleteDownload with the bytes copied until the connection was lost
+        """
+
+        deadline = self.apisession._deadline()
+        done = 0
+
+        if into is not None:
+            limit = len(into) if limit is None else min(limit, len(into))
+
+            def write(view):
+                into[done:done + len(view)] = view
+
+        if res.headers.get('Content-Encoding', 'identity') != 'identity':
+            # the server compressed anyway: decode while reading
+            for chunk in res.iter_content(self.bufsize):
+                if limit is not None:
+                    chunk = chunk[:limit - done]
+                write(memoryview(chunk))
+                done += len(chunk)
+                if progress:
+                    progress(len(chunk))
+                if deadline is not None:
+                    deadline.check()
+                if limit is not None and done >= limit:
+                    break
+            return done
+
+        buf = self._buffer()
+        raw = res.raw
+        while True:
+            if into is not None:
+                # chunks of bufsize, so progress and the deadline are checked while reading
+                view = into[done:min(limit, done + self.bufsize)]
+            else:
+                view = buf if limit is None else buf[:min(len(buf), limit - done)]
+            if not len(view):
+                break
+            try:
+                n = raw.readinto(view)
+            except (urllib3.exceptions.HTTPError, requests.exceptions.ConnectionError, OSError) as err:
+                raise IncompleteDownload('{0}: connection lost after {1} bytes: {2}'.format(res.url, done, err),
+                                         bytes=done)
+            if not n:
+                break
+            if into is None:
+                write(view[:n])
+            done += n
+            if progress:
+                progress(n)
+            if deadline is not None:
+                deadline.check()
+        return done
+
+    def _segmentSize(self, rate, remaining, workers):
+        """
+        size of the next segment: about segmentSeconds at the measured rate per connection,
+        the tail is split evenly so all connections finish together
+
+        :param float rate: bytes per second of one connection, None if not measured yet
+        :param int remaining: bytes not assigned yet
+        :param int workers: number of connections
+        :rtype: int
+        """
+
+        size = self.minSegment if rate is None else int(rate * self.segmentSeconds)
+        size = max(self.minSegment, min(self.maxSegment, size))
+        size = min(size, max(self.minSegment, int(math.ceil(remaining / float(workers)))))
+        return min(size, remaining)
+
+    def _copyRange(self, res, f, start, checkpoint=None, progress=None, digest=None):
+        """
+        copy the body of a response into the file f at offset start. the written range is flushed
+        and recorded in the checkpoint and the digest every checkpointBytes and when the copy stops
+
+        :return: bytes copied
+        :rtype: int
+        :raises: IncompleteDownload
+        """
+
+        f.seek(start)
+        pos = [start]
+        saved = [start]
+
+        tracked = checkpoint is not None or digest is not None
+
+        def record():
+            f.flush()
+            if checkpoint is not None:
+                checkpoint.add(saved[0], pos[0])
+                checkpoint.save()
+            if digest is not None:
+                digest.flushed(saved[0], pos[0])
+            saved[0] = pos[0]
+
+        def write(view):
+            f.write(view)
+            if digest is not None:
+                digest.update(pos[0], view)
+            pos[0] += len(view)
+            if tracked and pos[0] - saved[0] >= self.checkpointBytes:
+                record()
+
+        try:
+            self._copy(res, write, progress=progress)
+        finally:
+            if tracked and pos[0] > saved[0]:
+                record()
+        return pos[0] - start
+
+    def _fetchSegment(self, url, f, start, end, timeout=None, progress=None, checkpoint=None, digest=None):
+        """
+        download the bytes [start, end) into the file f at their offset. a lost connection
+        continues with a new range request from the last byte received
+
+        :param file f: target file opened for writing, a memoryview of the whole file or a function
+            writing the bytes in order
+        :param Checkpoint checkpoint: records the written bytes
+        :param StreamHash digest: hashes the written bytes
+        :raises: RequestException
+        """
+
+        headers = {'Range': 'bytes={0}-{1}'}
+        if checkpoint is not None and checkpoint.validator:
+            headers['If-Range'] = checkpoint.validator
+        for attempt in range(self.segmentAttempts):
+            headers['Range'] = 'bytes={0}-{1}'.format(start, end - 1)
+            res = self._open(url, headers, timeout)
+            try:
+                span = contentRange(res)
+                if span is None or span[0] != start:
+                    raise requests.exceptions.RequestException(
+                        '{0}: range request ignored or file changed ({1})'.format(url, res.status_code))
+                if isinstance(f, memoryview):
+                    start += self._copy(res, None, progress=progress, into=f[start:end])
+                elif callable(f):
+                    start += self._copy(res, f, progress=progress)
+                else:
+                    start += self._copyRange(res, f, start, checkpoint, progress, digest)
+            except IncompleteDownload as err:
+                start += err.bytes
+                logger.info('segment of %s interrupted (%s/%s): %s', url, attempt + 1, self.segmentAttempts, err)
+            finally:
+                res.close()
+            if start >= end:
+                return
+        raise IncompleteDownload('{0}: segment incomplete after {1} attempts'.format(url, self.segmentAttempts))
+
+    def _fetchRanges(self, url, fp, gaps, timeout=None, progress=None, checkpoint=None, digest=None):
+        """
+        download the missing [start, end) ranges of the preallocated file fp over parallel connections
+
+        :param fp: Path of the file, or a memoryview of the whole file
+        :param list gaps: the missing ranges
+        :return: (segments, workers)
+        :rtype: tuple of int
+        """
+
+        deadline = self.apisession._deadline()
+        lock = threading.Lock()
+        gaps = [tuple(g) for g in gaps if g[1] > g[0]]
+        remaining = sum(b - a for a, b in gaps)
+        state = dict(remaining=remaining, rate=None, segments=0, failed=False)
+        workers = min(self.maxWorkers, max(1, int(math.ceil(remaining / float(self.minSegment)))))
+
+        def nextSegment():
+            with lock:
+                if not gaps or state['failed']:
+                    return None
+                start, stop = gaps[0]
+                end = min(stop, start + self._segmentSize(state['rate'], state['remaining'], workers))
+                if end >= stop:
+                    gaps.pop(0)
+                else:
+                    gaps[0] = (end, stop)
+                state['remaining'] -= end - start
+                state['segments'] += 1
+                return start, end
+
+        def segments(f):
+            while True:
+                segment = nextSegment()
+                if segment is None:
+                    return
+                begin = time.perf_counter()
+                try:
+                    self._fetchSegment(url, f, segment[0], segment[1], timeout, progress, checkpoint, digest)
+                except Exception:
+                    state['failed'] = True
+                    raise
+                rate = (segment[1] - segment[0]) / max(time.perf_counter() - begin, 1e-6)
+                with lock:
+                    # moving average of the rate per connection
+                    state['rate'] = rate if state['rate'] is None else 0.7 * state['rate'] + 0.3 * rate
+
+        def work():
+            # worker threads do not inherit the deadline of the caller
+            with self.apisession.deadline(deadline):
+                if isinstance(fp, memoryview):
+                    segments(fp)
+                else:
+                    with fp.open('r+b') as f:
+                        segments(f)
+
+        with ThreadPoolExecutor(workers) as pool:
+            futures = [pool.submit(work) for _ in range(workers)]
+            for future in futures:
+                future.result()
+        return state['segments'], workers
+
+    def _fetchHeader(self, url, fp, timeout=None, progress=None):
+        """
+        download only the first headerBytes of url into fp
+        """
+
+        result = DownloadResult(url, fp)
+        res = self._open(url, timeout=timeout)
+        try:
+            result.status_code = res.status_code
+            with fp.open('wb') as f:
+                result.bytes = self._copy(res, f.write, limit=self.headerBytes, progress=progress)
+        finally:
+            res.close()
+        return result
+
+    def _fetchStream(self, res, part, result, progress=None, digest=None):
+        """
+        write the complete body of a 200 response into part. without range support there is no resume
+        """
+
+        if digest is not None:
+            digest.reset()
+
+        length = res.headers.get('Content-Length')
+        if length is not None and res.headers.get('Content-Encoding', 'identity') == 'identity':
+            result.size = int(length)
+        with part.open('wb') as f:
+            if result.size:
+                preallocate(f, result.size)
+            pos = [0]
+
+            def write(view):
+                f.write(view)
+                if digest is not None:
+                    digest.update(pos[0], view)
+                pos[0] += len(view)
+
+            received = self._copy(res, write, progress=progress)
+            if result.size is not None and received != result.size:
+                raise IncompleteDownload('{0}: received {1} of {2} bytes'.format(
+                    result.url, received, result.size), bytes=received)
+            f.truncate(received)
+        result.size = received
+
+    def fetch(self, url, fp, onlyHeader=False, timeout=None, progress=None, resume=True, checksum=None):
+        """
+        download url into the file fp.
+
+        the first request asks for a range: the first minSegment bytes or, when resuming, the
+        first missing range. if the server answers with 206 the rest is fetched in parallel
+        segments, otherwise the body is read in one stream.
+
+        with a checksum the file is hashed (SHA-1) while it is written. a file that does not match
+        is downloaded again, up to verifyAttempts times
+
+        :param str url: full url
+        :param Path fp: target file
+        :param bool onlyHeader: get only the first bytes, for file types with header/raw
+        :param timeout: timeout of the request, default is the connecter timeout
+        :param progress: function called with the number of bytes written so far
+        :param bool resume: continue an interrupted download of fp, False starts from byte zero
+        :param checksum: expected SHA-1 hex digest (eg. fileHashCode) or list of accepted digests,
+            the file is taken from the blob store if it has one of them
+        :return: the download result
+        :rtype: DownloadResult
+        :raises: RequestException, the .part file is kept for resuming. ChecksumMismatch
+        """
+
+        fp = Path(fp)
+        start = time.perf_counter()
+
+        count, written = self._counter(progress)
+        expected = self._expected(checksum)
+
+        if onlyHeader:
+            result = self._fetchHeader(url, fp, timeout, count)
+        else:
+            result = self._fromStore(url, fp, expected)
+        if result is None:
+            result = DownloadResult(url, fp)
+            part = fp.with_name(fp.name + '.part')
+            sidecar = fp.with_name(fp.name + '.part.json')
+            digest = StreamHash(part) if expected else None
+
+            for attempt in range(self.verifyAttempts if expected else 1):
+                checkpoint = None
+                if resume and part.is_file():
+                    checkpoint = Checkpoint.load(sidecar, url)
+                    if checkpoint is not None and part.stat().st_size != checkpoint.size:
+                        checkpoint = None
+                if checkpoint is None:
+                    self._discard(part, sidecar)
+                else:
+                    result.resumed = checkpoint.completed()
+                    logger.info('resuming %s at %s of %s bytes', url, result.resumed, checkpoint.size)
+
+                if digest is not None:
+                    digest.reset()
+                self._fetchPart(url, part, sidecar, checkpoint, result, timeout, count, digest)
+                if digest is None:
+                    break
+                result.checksum = digest.hexdigest(result.size)
+                if result.checksum in expected:
+                    logger.debug('%s: SHA-1 verified, %s bytes read back', url, digest.readBack)
+                    break
+                # a corrupt part file is not resumed
+                self._discard(part, sidecar)
+                err = ChecksumMismatch('{0}: SHA-1 {1} does not match {2} (attempt {3}/{4})'.format(
+                    url, result.checksum, ', '.join(sorted(expected)), attempt + 1, self.verifyAttempts),
+                    expected=expected, actual=result.checksum)
+                logger.warning('%s', err)
+            else:
+                raise err
+
+            os.replace(str(part), str(fp))
+            self._discard(sidecar)
+            if self.store is not None and result.checksum:
+                self._toStore(result.checksum, fp)
+
+        result.bytes = written[0]
+        result.seconds = time.perf_counter() - start
+        with self._lock:
+            self.totalBytes += result.bytes
+            self.totalSeconds += result.seconds
+        logger.info('downloaded %s', result)
+        return result
+
+    def _fromStore(self, url, fp, expected):
+        """
+        place the file from the blob store
+
+        :return: the result or None if the store does not have it
+        :rtype: DownloadResult
+        """
+
+        if self.store is None:
+            return None
+        for sha1 in sorted(expected):
+            if self.store.get(sha1, fp) is not None:
+                result = DownloadResult(url, fp)
+                result.cached = True
+                result.checksum = sha1
+                result.size = fp.stat().st_size
+                return result
+        return None
+
+    def _toStore(self, sha1, fp=None, data=None):
+        # a full store or a read only file system does not fail the download
+        try:
+            if data is not None:
+                self.store.write(sha1, data)
+            else:
+                self.store.add(sha1, fp)
+        except (OSError, IOError) as err:
+            logger.warning('%s not added to the blob store: %s', fp or sha1, err)
+
+    def _counter(self, progress):
+        # progress of the segments: a function counting bytes and the list holding the total
+        lock = threading.Lock()
+        written = [0]
+
+        def count(n):
+            with lock:
+                written[0] += n
+                done = written[0]
+            if progress:
+                progress(done)
+
+        return count, written
+
+    def _expected(self, checksum):
+        # the accepted SHA-1 digests in upper case
+        if isinstance(checksum, str):
+            checksum = [checksum]
+        return set(c.upper() for c in checksum or [] if c)
+
+    def fetchInto(self, url, buffer=None, timeout=None, progress=None, checksum=None):
+        """
+        download url into memory, without a file on disk.
+
+        a bytearray is resized to the file and a memoryview must be large enough, both are filled
+        in place: range segments are read with readinto() at their offset over maxWorkers
+        connections, there is no intermediate copy. a file object (eg. BytesIO) receives the body
+        in one stream. without buffer the body goes to a new bytearray, or to a SpooledTemporaryFile
+        if it is larger than spoolBytes or its size is unknown
+
+        >> data = apisession.downloader.fetchInto(url).data
+        >> ds = pydicom.dcmread(io.BytesIO(data))
+
+        :param str url: full url
+        :param buffer: bytearray, writable memoryview, writable file object or None
+        :param timeout: timeout of the request, default is the connecter timeout
+        :param progress: function called with the number of bytes written so far
+        :param checksum: expected SHA-1 hex digest (eg. fileHashCode) or list of accepted digests,
+            the body is read from the blob store if it has one of them
+        :return: the download result, result.data is the bytearray, the filled part of the memoryview
+            or the file object (a new spooled file is at position 0)
+        :rtype: DownloadResult
+        :raises: RequestException, ValueError if the memoryview is too small, ChecksumMismatch
+        """
+
+        start = time.perf_counter()
+        count, written = self._counter(progress)
+        expected = self._expected(checksum)
+        if isinstance(buffer, memoryview):
+            if buffer.readonly:
+                raise ValueError('the memoryview is read only')
+            # bytes, also for views of eg. numpy arrays
+            buffer = buffer.cast('B')
+
+        attempts = self.verifyAttempts if expected else 1
+        origin = None
+        if hasattr(buffer, 'write'):
+            try:
+                origin = buffer.tell()
+            except (AttributeError, OSError):
+                # the body cannot be written again
+                attempts = 1
+
+        result = DownloadResult(url)
+        if not self._readStore(url, buffer, expected, result):
+            for attempt in range(attempts):
+                if attempt and origin is not None:
+                    buffer.seek(origin)
+                    buffer.truncate()
+                hasher = self._fetchMemory(url, buffer, result, timeout, count, bool(expected))
+                if not expected:
+                    break
+                result.checksum = hasher.hexdigest().upper()
+                if result.checksum in expected:
+                    if self.store is not None and not hasattr(result.data, 'write'):
+                        self._toStore(result.checksum, data=result.data)
+                    break
+                err = ChecksumMismatch('{0}: SHA-1 {1} does not match {2} (attempt {3}/{4})'.format(
+                    url, result.checksum, ', '.join(sorted(expected)), attempt + 1, attempts),
+                    expected=expected, actual=result.checksum)
+                logger.warning('%s', err)
+            else:
+                raise err
+
+        result.bytes = written[0]
+        result.seconds = time.perf_counter() - start
+        with self._lock:
+            self.totalBytes += result.bytes
+            self.totalSeconds += result.seconds
+        logger.info('downloaded %s', result)
+        return result
+
+    def _fetchMemory(self, url, buffer, result, timeout=None, progress=None, hashing=False):
+        """
+        one in memory download, see fetchInto. sets result.data
+
+        :return: the hash of the body if hashing
+        """
+
+        stream = hasattr(buffer, 'write')
+        # a range request learns the size and whether segments can be fetched in place
+        end = self.minSegment - 1 if self.maxWorkers > 1 and not stream else ''
+        headers = {'Range': 'bytes=0-{0}'.format(end)}
+        try:
+            res = self._open(url, headers, timeout=timeout)
+        except requests.exceptions.HTTPError as err:
+            if err.response is None or err.response.status_code != 416:
+                raise
+            err.response.close()
+            # empty file
+            res = self._open(url, timeout=timeout)
+
+        try:
+            result.status_code = res.status_code
+            span = contentRange(res)
+            if res.status_code == 206 and (span is None or span[0] != 0):
+                res.close()
+                res = self._open(url, timeout=timeout)
+                span = None
+            size = None
+            if span is not None:
+                size = span[2]
+            elif res.headers.get('Content-Encoding', 'identity') == 'identity' and 'Content-Length' in res.headers:
+                size = int(res.headers['Content-Length'])
+            result.size = size
+
+            buffer = self._memoryTarget(url, buffer, size)
+            stream = hasattr(buffer, 'write')
+            if stream or size is None:
+                return self._streamMemory(url, res, buffer, result, span, timeout, progress, hashing)
+
+            view = memoryview(buffer)[:size]
+            got = 0
+            if span is not None:
+                try:
+                    got = self._copy(res, None, progress=progress, into=view[:span[1] + 1])
+                except IncompleteDownload as err:
+                    # the missing bytes are fetched below
+                    got = err.bytes
+                    logger.info('first segment of %s interrupted: %s', url, err)
+            else:
+                got = self._copy(res, None, progress=progress, into=view)
+                if got != size:
+                    raise IncompleteDownload('{0}: received {1} of {2} bytes'.format(url, got, size), bytes=got)
+        finally:
+            res.close()
+
+        if got < size:
+            result.segments, result.workers = self._fetchRanges(url, view, [(got, size)], timeout, progress)
+            result.segments += 1
+        result.data = buffer if isinstance(buffer, bytearray) else view
+        if hashing:
+            # the body is in memory, hashing it costs no I/O
+            return hashlib.sha1(view)
+        return None
+
+    def _memoryTarget(self, url, buffer, size):
+        """
+        prepare the target of an in memory download
+
+        :param int size: size of the body, None if unknown
+        :return: the buffer: a bytearray of size bytes, a memoryview of at least size bytes or a file object
+        """
+
+        if buffer is None:
+            if size is not None and size <= self.spoolBytes:
+                return bytearray(size)
+            return tempfile.SpooledTemporaryFile(max_size=self.spoolBytes)
+        if isinstance(buffer, bytearray) and size is not None:
+            # resized in place, fails if the caller holds a memoryview of it
+            if len(buffer) > size:
+                del buffer[size:]
+            else:
+                buffer.extend(bytes(size - len(buffer)))
+        elif isinstance(buffer, memoryview) and size is not None and len(buffer) < size:
+            raise ValueError('{0}: memoryview of {1} bytes, the file has {2}'.format(url, len(buffer), size))
+        return buffer
+
+    def _readStore(self, url, buffer, expected, result):
+        """
+        fill buffer from the blob store, see fetchInto
+
+        :return: True if the store has the file
+        :rtype: bool
+        """
+
+        if self.store is None:
+            return False
+        for sha1 in sorted(expected):
+            f = self.store.open(sha1)
+            if f is None:
+                continue
+            with f:
+                size = os.fstat(f.fileno()).st_size
+                buffer = self._memoryTarget(url, buffer, size)
+                if hasattr(buffer, 'write'):
+                    shutil.copyfileobj(f, buffer, self.bufsize)
+                    result.data = buffer
+                    if isinstance(buffer, tempfile.SpooledTemporaryFile):
+                        buffer.seek(0)
+                else:
+                    view = memoryview(buffer)[:size]
+                    while f.readinto(view[f.tell():]):
+                        pass
+                    result.data = buffer if isinstance(buffer, bytearray) else view
+            result.size = size
+            result.checksum = sha1
+            result.cached = True
+            return True
+        return False
+
+    def _streamMemory(self, url, res, buffer, result, span=None, timeout=None, progress=None, hashing=False):
+        """
+        write the body of res in order into buffer, for file objects and bodies of unknown size.
+        with range support a lost connection continues with a range request
+
+        :param tuple span: Content-Range of res
+        :return: the hash of the body if hashing
+        """
+
+        hasher = hashlib.sha1() if hashing else None
+        if isinstance(buffer, memoryview):
+            # the size is not known in advance
+            filled = [0]
+
+            def append(view):
+                end = filled[0] + len(view)
+                if end > len(buffer):
+                    raise ValueError('{0}: the file is larger than the memoryview of {1} bytes'.format(
+                        url, len(buffer)))
+                buffer[filled[0]:end] = view
+                filled[0] = end
+        elif isinstance(buffer, bytearray):
+            del buffer[:]
+            append = buffer.extend
+        else:
+            append = buffer.write
+
+        def write(view):
+            append(view)
+            if hasher is not None:
+                hasher.update(view)
+
+        try:
+            received = self._copy(res, write, progress=progress)
+        except IncompleteDownload as err:
+            if span is None:
+                raise
+            received = err.bytes
+            logger.info('download of %s interrupted: %s', url, err)
+        res.close()
+        if span is not None and received < result.size:
+            self._fetchSegment(url, write, received, result.size, timeout, progress)
+            received = result.size
+        result.data = buffer[:received] if isinstance(buffer, memoryview) else buffer
+        if isinstance(buffer, tempfile.SpooledTemporaryFile):
+            buffer.seek(0)
+        if result.size is not None and received != result.size:
+            raise IncompleteDownload('{0}: received {1} of {2} bytes'.format(
+                result.url, received, result.size), bytes=received)
+        result.size = received
+        return hasher
+
+    def extract(self, url, target=None, callback=None, members=None, timeout=None, progress=None):
+        """
+        download a ZIP file and extract its members while the bytes arrive, the .zip is not stored.
+
+        the first request asks for the end of the file. with range support the central directory
+        is read from there and only the spans of the selected members are fetched, over maxWorkers
+        connections. otherwise the whole file is streamed through the parser and members that are
+        not selected are skipped without decompressing them
+
+        :param str url: full url
+        :param Path target: directory to extract to
+        :param callback: function called with the name and the data (bytearray) of each member instead
+            of writing files, from the download threads
+        :param members: None (all), a function name -> bool or a list of names and glob patterns
+        :param timeout: timeout of the requests, default is the connecter timeout
+        :param progress: function called with the number of bytes received so far
+        :return: the download result, result.members are the names of the extracted members
+        :rtype: DownloadResult
+        :raises: RequestException, BadZipFile
+        """
+
+        start = time.perf_counter()
+        count, written = self._counter(progress)
+        handler = MemberHandler(target, callback, members)
+        result = DownloadResult(url, None if target is None else Path(target))
+
+        res = self._open(url, {'Range': 'bytes=-{0}'.format(TAIL_BYTES)}, timeout=timeout)
+        try:
+            result.status_code = res.status_code
+            span = contentRange(res)
+            if span is None:
+                if res.status_code == 206:
+                    res.close()
+                    res = self._open(url, timeout=timeout)
+                # no range support: the whole file through the parser
+                parser = ZipStreamParser(handler)
+                result.size = self._copy(res, parser.feed, progress=count)
+                parser.close()
+            else:
+                result.size = span[2]
+                tail = bytearray(span[1] - span[0] + 1)
+                try:
+                    got = self._copy(res, None, progress=count, into=memoryview(tail))
+                except IncompleteDownload as err:
+                    got = err.bytes
+        finally:
+            res.close()
+
+        if span is not None:
+            if got < len(tail):
+                view = memoryview(tail)[got:]
+                pos = [0]
+
+                def write(data):
+                    view[pos[0]:pos[0] + len(data)] = data
+                    pos[0] += len(data)
+
+                self._fetchSegment(url, write, span[0] + got, result.size, timeout, count)
+            result.segments, result.workers = self._extractRanges(
+                url, handler, tail, span[0], timeout, count)
+
+        result.members = handler.members
+        result.bytes = written[0]
+        result.seconds = time.perf_counter() - start
+        with self._lock:
+            self.totalBytes += result.bytes
+            self.totalSeconds += result.seconds
+        logger.info('extracted %s members of %s', len(result.members), result)
+        return result
+
+    def _fetchBytes(self, url, start, end, timeout=None):
+        """
+        :return: the bytes [start, end) of url
+        :rtype: bytes
+        """
+
+        res = self._open(url, {'Range': 'bytes={0}-{1}'.format(start, end - 1)}, timeout=timeout)
+        try:
+            span = contentRange(res)
+            if span is None or span[0] != start:
+                raise requests.exceptions.RequestException(
+                    '{0}: range request ignored or file changed ({1})'.format(url, res.status_code))
+            return res.content
+        finally:
+            res.close()
+
+    def _extractRanges(self, url, handler, tail, tailOffset, timeout=None, progress=None):
+        """
+        extract the selected members of a ZIP file on a server with range support
+
+        :param bytearray tail: the last bytes of the file
+        :param int tailOffset: offset of tail in the file
+        :return: (segments, workers)
+        :rtype: tuple of int
+        """
+
+        cdOffset, cdSize = endOfCentralDirectory(tail, tailOffset)
+        if cdOffset is None:
+            # cdSize is the offset of the zip64 end of central directory record
+            cdOffset, cdSize = endOfCentralDirectory64(self._fetchBytes(url, cdSize, cdSize + 56, timeout))
+        if cdOffset >= tailOffset:
+            directory = tail[cdOffset - tailOffset:cdOffset - tailOffset + cdSize]
+        else:
+            directory = self._fetchBytes(url, cdOffset, cdOffset + cdSize, timeout)
+        entries = centralDirectory(directory)
+        known = dict((m.name, m) for m in entries)
+
+        # a member spans from its local header to the next one (or the central directory).
+        # adjacent members are fetched together, up to an even share of the connections
+        ends = sorted(set(m.offset for m in entries) | {cdOffset})
+        selected = list()
+        for m in sorted(entries, key=lambda m: m.offset):
+            if handler.accept(m.name):
+                selected.append((m.offset, ends[bisect.bisect_right(ends, m.offset)]))
+        total = sum(b - a for a, b in selected)
+        share = max(self.minSegment, int(math.ceil(total / float(max(1, self.maxWorkers)))))
+        spans = list()
+        for a, b in selected:
+            if spans and spans[-1][1] == a and b - spans[-1][0] <= share:
+                spans[-1][1] = b
+            else:
+                spans.append([a, b])
+        if not spans:
+            return 0, 0
+
+        deadline = self.apisession._deadline()
+
+        def extractSpan(span):
+            start, end = span
+            parser = ZipStreamParser(handler, known)
+            if start >= tailOffset:
+                # already received with the end of the file
+                parser.feed(memoryview(tail)[start - tailOffset:end - tailOffset])
+            else:
+                # worker threads do not inherit the deadline of the caller
+                with self.apisession.deadline(deadline):
+                    self._fetchSegment(url, parser.feed, start, end, timeout, progress)
+            parser.close()
+
+        workers = min(self.maxWorkers, len(spans))
+        with ThreadPoolExecutor(workers) as pool:
+            for future in [pool.submit(extractSpan, span) for span in spans]:
+                future.result()
+        return len(spans), workers
+
+    def _discard(self, *paths):
+        for path in paths:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def _fetchPart(self, url, part, sidecar, checkpoint, result, timeout=None, progress=None, digest=None):
+        """
+        download or complete the .part file of a download
+        """
+
+        if checkpoint is not None:
+            gaps = checkpoint.missing()
+            if not gaps:
+                result.size = checkpoint.size
+                return
+            first, stop = gaps[0]
+        else:
+            first, stop = 0, None
+
+        # the first request asks for a range to learn the size and whether ranges are supported
+        end = None if stop is None else stop - 1
+        if self.maxWorkers > 1:
+            end = first + self.minSegment - 1 if end is None else min(end, first + self.minSegment - 1)
+        headers = {'Range': 'bytes={0}-{1}'.format(first, '' if end is None else end)}
+        if checkpoint is not None and checkpoint.validator:
+            headers['If-Range'] = checkpoint.validator
+
+        try:
+            res = self._open(url, headers, timeout=timeout)
+        except requests.exceptions.HTTPError as err:
+            if err.response is None or err.response.status_code != 416:
+                raise
+            err.response.close()
+            # empty file, or changed since the checkpoint: start over without range
+            self._discard(part, sidecar)
+            res = self._open(url, timeout=timeout)
+
+        try:
+            result.status_code = res.status_code
+            span = contentRange(res)
+            if span is None or span[0] != first or (checkpoint is not None and span[2] != checkpoint.size):
+                # no range support or the file changed: the whole body in one stream
+                if checkpoint is not None:
+                    logger.info('%s changed or ranges unsupported, downloading again', url)
+                    self._discard(part, sidecar)
+                    checkpoint = None
+                if res.status_code == 206:
+                    res.close()
+                    res = self._open(url, timeout=timeout)
+                self._fetchStream(res, part, result, progress, digest)
+                return
+
+            result.size = span[2]
+            if checkpoint is not None and digest is not None:
+                # the resumed ranges are hashed from the file when the hashed part reaches them
+                for a, b in checkpoint.done:
+                    digest.flushed(a, b)
+            if checkpoint is None:
+                validator = res.headers.get('ETag') or res.headers.get('Last-Modified')
+                checkpoint = Checkpoint(sidecar, url, result.size, validator)
+                with part.open('wb') as f:
+                    preallocate(f, result.size)
+                checkpoint.save()
+            with part.open('r+b') as f:
+                try:
+                    self._copyRange(res, f, first, checkpoint, progress, digest)
+                except IncompleteDownload as err:
+                    # the missing bytes are fetched below
+                    logger.info('first segment of %s interrupted: %s', url, err)
+        finally:
+            res.close()
+
+        gaps = checkpoint.missing()
+        if gaps:
+            result.segments, result.workers = self._fetchRanges(
+                url, part, gaps, timeout, progress, checkpoint, digest)
+            result.segments += 1
+        if checkpoint.missing():
+            raise IncompleteDownload('{0}: incomplete, {1} of {2} bytes'.format(
+                url, checkpoint.completed(), checkpoint.size))
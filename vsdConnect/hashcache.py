@@ -0,0 +1,199 @@
+#!/usr/bin/python
+"""
+=======
+INFOS
+=======
+* python version: 3.5
+* connectVSD 0.8.1
+* module: hashcache
+
+========
+CHANGES
+========
+* persistent cache of the SHA-1 of local files
+
+"""
+
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from pathlib import Path
+
+from vsdConnect.hashing import mmapSha1, BulkHasher
+
+logger = logging.getLogger(__name__)
+
+
+class HashCache(object):
+    """
+    persistent cache of the SHA-1 of local files, an sqlite database. an entry is keyed by the absolute
+    path and valid while inode, size and mtime of the file are unchanged, a modified or replaced file
+    is hashed again. files of the same content at several paths are hashed once per path
+
+    :param Path path: the database file, None keeps the cache in memory
+    :param int commitEvery: new hashes are written to disk after this many, and with flush or close
+    :param float commitSeconds: new hashes are written to disk at the latest after this many seconds.
+        a single file hashed with sha1 is written at once, pending hashes are written at exit
+    """
+
+    def __init__(self, path=None, commitEvery=1000, commitSeconds=5.0):
+        self.path = Path(path) if path is not None else None
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.commitEvery = commitEvery
+        self.commitSeconds = commitSeconds
+        self._db = sqlite3.connect(str(self.path) if self.path is not None else ':memory:', check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS hashes (path TEXT PRIMARY KEY, inode INTEGER, size INTEGER, '
+                         'mtime_ns INTEGER, sha1 TEXT)')
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._committed = time.time()
+        self.hits = 0
+        self.misses = 0
+        if self.path is not None:
+            atexit.register(self.flush)
+
+    @staticmethod
+    def _key(fp):
+        return os.path.abspath(str(fp))
+
+    def get(self, fp, st=None):
+        """
+        :param Path fp: the local file
+        :param os.stat_result st: stat of the file, taken if None
+        :return: the cached SHA-1 (uppercase hex) if the file is unchanged, else None
+        :rtype: str
+        """
+        st = st or os.stat(str(fp))
+        with self._lock:
+            row = self._db.execute('SELECT inode, size, mtime_ns, sha1 FROM hashes WHERE path = ?',
+                                   (self._key(fp),)).fetchone()
+        if row is not None and tuple(row[:3]) == (st.st_ino, st.st_size, st.st_mtime_ns):
+            return row[3]
+        return None
+
+    def put(self, fp, st, sha1):
+        """
+        record the SHA-1 of a file
+
+        :param Path fp: the local file
+        :param os.stat_result st: stat of the file taken before it was hashed
+        :param str sha1: its SHA-1
+        """
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)',
+                             (self._key(fp), st.st_ino, st.st_size, st.st_mtime_ns, sha1.upper()))
+            self._pending += 1
+            if self._pending >= self.commitEvery or time.time() - self._committed >= self.commitSeconds:
+                self._commit()
+
+    def _commit(self):
+        self._db.commit()
+        self._pending = 0
+        self._committed = time.time()
+
+    def sha1(self, fp):
+        """
+        :param Path fp: the local file
+        :return: SHA-1 of the file (uppercase hex), from the cache or hashed and cached
+        :rtype: str
+        """
+        st = os.stat(str(fp))
+        sha1 = self.get(fp, st)
+        if sha1 is not None:
+            with self._lock:
+                self.hits += 1
+            return sha1
+        sha1 = mmapSha1(fp)
+        # a file changed while it was hashed is not cached
+        if os.stat(str(fp)).st_mtime_ns == st.st_mtime_ns:
+            self.put(fp, st, sha1)
+            self.flush()
+        with self._lock:
+            self.misses += 1
+        return sha1
+
+    def warm(self, directory, workers=4):
+        """
+        hash the files of a directory tree that are not in the cache, eg. before a reconciliation
+
+        :param Path directory: the directory
+        :param int workers: files hashed concurrently
+        :return: number of files in the tree and number hashed
+        :rtype: (int, int)
+        """
+        hasher = BulkHasher(workers, cache=self)
+        for fp, sha1 in hasher.hash(directory):
+            pass
+        hashed = hasher.files - hasher.hits
+        with self._lock:
+            self.hits += hasher.hits
+            self.misses += hashed
+        logger.info('%s', hasher)
+        return hasher.files + len(hasher.failed), hashed
+
+    def prune(self):
+        """
+        remove the entries of files that no longer exist or changed
+
+        :return: number of entries removed
+        :rtype: int
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT path, inode, size, mtime_ns FROM hashes').fetchall()
+        stale = list()
+        for path, inode, size, mtime_ns in rows:
+            try:
+                st = os.stat(path)
+            except OSError:
+                stale.append((path,))
+                continue
+            if (st.st_ino, st.st_size, st.st_mtime_ns) != (inode, size, mtime_ns):
+                stale.append((path,))
+        with self._lock:
+            self._db.executemany('DELETE FROM hashes WHERE path = ?', stale)
+            self._commit()
+        return len(stale)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM hashes').fetchone()[0]
+
+    def flush(self):
+        """
+        write the new hashes to disk
+        """
+        with self._lock:
+            if self._db is not None and self._pending:
+                self._commit()
+
+    def close(self):
+        """
+        write the new hashes to disk and close the database
+        """
+        self.flush()
+        with self._lock:
+            self._db.close()
+            self._db = None
+        if self.path is not None:
+            atexit.unregister(self.flush)
+
+    def __str__(self):
+        return '{0} hashes cached, {1} hits, {2} misses'.format(len(self), self.hits, self.misses)
+
+
+def createHashCache(cache):
+    """
+    :param cache: None, a database file or a HashCache
+    :return: the hash cache or None
+    :rtype: HashCache
+    """
+
+    if cache is None or isinstance(cache, HashCache):
+        return cache
+    return HashCache(cache)
@@ -0,0 +1,198 @@
+#!/usr/bin/python
+"""
+=======
+INFOS
+=======
+* python version: 3.5
+* connectVSD 0.8.1
+* module: hashing
+
+========
+CHANGES
+========
+* parallel hashing of many local files with memory mapped reads
+
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import PurePath
+
+logger = logging.getLogger(__name__)
+
+#: bytes passed to the hasher at once
+BUFSIZE = 16 * 1024 * 1024
+
+
+def mmapSha1(fp, bufsize=BUFSIZE):
+    """
+    SHA-1 of a local file read through a memory map, without copies into Python buffers.
+    hashlib releases the GIL on large blocks, threads hash in parallel
+
+    :param Path fp: the file
+    :param int bufsize: bytes hashed at once
+    :return: the hash (uppercase hex, like fileHashCode)
+    :rtype: str
+    """
+    hasher = hashlib.sha1()
+    with open(str(fp), 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            # empty files cannot be mapped
+            return hasher.hexdigest().upper()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, 'madvise'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(mm)
+            try:
+                for offset in range(0, size, bufsize):
+                    hasher.update(view[offset:offset + bufsize])
+            finally:
+                view.release()
+    return hasher.hexdigest().upper()
+
+
+def _hash(fp, bufsize):
+    # runs in the worker threads or processes
+    try:
+        return fp, mmapSha1(fp, bufsize), None
+    except (IOError, OSError, ValueError) as err:
+        return fp, None, err
+
+
+class BulkHasher(object):
+    """
+    hashes many local files with a pool of threads (or processes) and yields the results as they
+    complete. the largest files are started first, so a big file does not run alone at the end.
+    with a HashCache, unchanged files are taken from the cache and the new hashes are added to it
+
+    :param int workers: files hashed concurrently, default is the number of CPUs
+    :param bool processes: a process pool instead of threads, eg. if hashlib does not release the GIL
+    :param int bufsize: bytes hashed at once
+    :param HashCache cache: cache of the hashes, None hashes every file
+    """
+
+    def __init__(self, workers=None, processes=False, bufsize=BUFSIZE, cache=None):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.processes = processes
+        self.bufsize = bufsize
+        self.cache = cache
+        self.files = 0
+        self.bytes = 0
+        self.hits = 0
+        self.seconds = 0.0
+        #: (path, error) of the files not hashed
+        self.failed = list()
+
+    @staticmethod
+    def _paths(paths):
+        if isinstance(paths, (str, PurePath)):
+            if not os.path.isdir(str(paths)):
+                # a single file
+                yield str(paths)
+                return
+            for root, dirs, names in os.walk(str(paths)):
+                for name in names:
+                    yield os.path.join(root, name)
+        else:
+            for fp in paths:
+                yield str(fp)
+
+    def _stat(self, paths):
+        """
+        :return: (path, stat) of the files, largest first, a file given twice only once
+        :rtype: list
+        """
+        todo = list()
+        seen = set()
+        for fp in self._paths(paths):
+            key = os.path.normpath(fp)
+            if key in seen:
+                continue
+            seen.add(key)
+            try:
+                todo.append((fp, os.stat(fp)))
+            except OSError as err:
+                self._failed(fp, err)
+        todo.sort(key=lambda item: -item[1].st_size)
+        return todo
+
+    def _failed(self, fp, err):
+        logger.info('%s not hashed: %s', fp, err)
+        self.failed.append((fp, err))
+
+    def hash(self, paths):
+        """
+        generator of the SHA-1 of local files, in the order of completion
+
+        :param paths: a directory (all files below), a file or an iterable of files
+        :return: (path, SHA-1) per file, once per file, the failed files are in failed
+        :rtype: iterator of (str, str)
+        """
+
+        start = time.time()
+        todo = self._stat(paths)
+        sizes = dict()
+        queue = list()
+        for fp, st in todo:
+            sha1 = self.cache.get(fp, st) if self.cache is not None else None
+            if sha1 is not None:
+                self.hits += 1
+                self.files += 1
+                yield fp, sha1
+            else:
+                sizes[fp] = st
+                queue.append(fp)
+
+        executor = ProcessPoolExecutor if self.processes else ThreadPoolExecutor
+        with executor(self.workers) as pool:
+            # a bounded window of submitted files keeps memory flat for millions of files
+            pending = set()
+            queue.reverse()
+            try:
+                while queue or pending:
+                    while queue and len(pending) < self.workers * 4:
+                        pending.add(pool.submit(_hash, queue.pop(), self.bufsize))
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        fp, sha1, err = future.result()
+                        if err is not None:
+                            self._failed(fp, err)
+                            continue
+                        st = sizes.pop(fp)
+                        if self.cache is not None and self._unchanged(fp, st):
+                            self.cache.put(fp, st, sha1)
+                        self.files += 1
+                        self.bytes += st.st_size
+                        yield fp, sha1
+            finally:
+                for future in pending:
+                    future.cancel()
+                self.seconds += time.time() - start
+                if self.cache is not None:
+                    self.cache.flush()
+
+    @staticmethod
+    def _unchanged(fp, st):
+        # a file changed while it was hashed is not cached
+        try:
+            return os.stat(fp).st_mtime_ns == st.st_mtime_ns
+        except OSError:
+            return False
+
+    @property
+    def throughput(self):
+        """
+        :return: hashed bytes per second
+        :rtype: float
+        """
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return '{0} files, {1:.1f} MB hashed in {2:.2f}s ({3:.1f} MB/s), {4} from cache, {5} failed'.format(
+            self.files, self.bytes / 1e6, self.seconds, self.throughput / 1e6, self.hits, len(self.failed))
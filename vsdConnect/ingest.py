@@ -0,0 +1,421 @@
+#!/usr/bin/python
+"""
+=======
+INFOS
+=======
+* python version: 3.5
+* connectVSD 0.8.1
+* module: ingest
+
+========
+CHANGES
+========
+* ingestion of a local directory tree: folders, uploads and folder membership
+* files already on the server (HashIndex) are linked instead of uploaded
+
+"""
+
+import logging
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from requests.exceptions import RequestException
+
+import vsdConnect.models as vsdModels
+from vsdConnect.codec import getCodec
+from vsdConnect.upload import ChunkedUpload
+
+logger = logging.getLogger(__name__)
+
+
+class IngestState(object):
+    """
+    progress of an ingestion stored in stateDir/ingest.json: the remote folder of every local
+    directory and per local file its size, mtime, the uploaded object and file and if the object
+    was added to its folder. an interrupted ingestion started again continues from there
+
+    :param Path path: the state file
+    :param str root: selfUrl of the remote root folder
+    """
+
+    def __init__(self, path, root):
+        self.path = Path(path)
+        self.root = root
+        #: relative directory -> selfUrl of the folder
+        self.folders = dict()
+        #: relative file -> dict(size, mtime_ns, object, file, folder, linked)
+        self.files = dict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, root):
+        """
+        :return: the state stored in path for the remote root, a new state otherwise
+        :rtype: IngestState
+        """
+        state = cls(path, root)
+        try:
+            data = getCodec().loads(Path(path).read_bytes())
+        except (IOError, OSError, ValueError):
+            return state
+        if isinstance(data, dict) and data.get('root') == root:
+            state.folders = data.get('folders') or dict()
+            state.files = data.get('files') or dict()
+        return state
+
+    def uploaded(self, rel, st):
+        """
+        :param os.stat_result st: the local file
+        :return: the entry of an unchanged file that was uploaded, else None
+        :rtype: dict
+        """
+        with self._lock:
+            entry = self.files.get(rel)
+        if entry and entry.get('size') == st.st_size and entry.get('mtime_ns') == st.st_mtime_ns:
+            return entry
+        return None
+
+    def setFile(self, rel, st, obj, f, folder):
+        with self._lock:
+            self.files[rel] = dict(size=st.st_size, mtime_ns=st.st_mtime_ns, object=obj, file=f, folder=folder,
+                                   linked=False)
+
+    def setLinked(self, rels):
+        with self._lock:
+            for rel in rels:
+                self.files[rel]['linked'] = True
+
+    def save(self):
+        """
+        write the state atomically
+        """
+        with self._lock:
+            data = dict(root=self.root, folders=self.folders, files=self.files)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + '.tmp')
+            tmp.write_bytes(getCodec().dumpb(data))
+            os.replace(str(tmp), str(self.path))
+
+
+class IngestResult(object):
+    """
+    counts and timing per stage of an ingestion
+    """
+
+    stages = ('scan', 'folders', 'upload', 'link')
+
+    def __init__(self, localDir):
+        self.localDir = localDir
+        #: per stage: items processed, bytes and seconds
+        self.items = dict((s, 0) for s in self.stages)
+        self.bytes = dict((s, 0) for s in self.stages)
+        self.seconds = dict((s, 0.0) for s in self.stages)
+        #: per stage: requests sent
+        self.requests = dict((s, 0) for s in self.stages)
+        #: files not uploaded again, they were uploaded by an interrupted run
+        self.resumed = 0
+        #: files on the server already, linked instead of uploaded, and their bytes
+        self.deduplicated = 0
+        self.bytesAvoided = 0
+        self.foldersCreated = 0
+        #: (relative path, error) of the failed files and folders
+        self.failed = list()
+
+    def throughput(self, stage):
+        """
+        :return: items and bytes per second of a stage
+        :rtype: tuple
+        """
+        seconds = self.seconds[stage]
+        if not seconds:
+            return 0.0, 0.0
+        return self.items[stage] / seconds, self.bytes[stage] / seconds
+
+    def __str__(self):
+        lines = ['{0}: {1} folders created, {2} files resumed, {3} deduplicated ({4:.1f} MB avoided), {5} failed'.format(
+            self.localDir, self.foldersCreated, self.resumed, self.deduplicated, self.bytesAvoided / 1e6,
+            len(self.failed)),
+            '{0:8s} {1:>8s} {2:>10s} {3:>8s} {4:>8s} {5:>8s} {6:>8s}'.format(
+                'stage', 'items', 'MB', 'requests', 'seconds', 'items/s', 'MB/s')]
+        for s in self.stages:
+            items, rate = self.throughput(s)
+            lines.append('{0:8s} {1:8d} {2:10.1f} {3:8d} {4:8.2f} {5:8.1f} {6:8.1f}'.format(
+                s, self.items[s], self.bytes[s] / 1e6, self.requests[s], self.seconds[s], items, rate / 1e6))
+        return '\n'.join(lines)
+
+
+class Ingest(object):
+    """
+    ingests a local directory tree into a folder of the VSD: the sub directories are created as folders
+    (existing folders of the same name are used), the files are uploaded by a pool of workers and the
+    objects are added to the folder of their directory, with one update per folder.
+
+    the existing remote folders are read with one paged listing, the missing ones are created once
+    per directory, level by level and concurrently within a level. files of chunkThreshold and more are uploaded in chunks (see ChunkedUpload).
+    the progress is stored in stateDir (see IngestState), an interrupted ingestion started again
+    does not upload the files again and only adds the missing objects to their folders.
+    hidden files and directories (.name) are skipped
+
+    :param VSDConnecter apisession: the API session
+    :param Path localDir: the local directory, its content is ingested into the remote root
+    :param int workers: concurrent uploads and folder requests
+    :param int chunkThreshold: size in bytes from which files are uploaded in chunks
+    :param Path stateDir: directory of the ingestion state and the upload manifests,
+        default is localDir/.vsdingest
+    :param int saveEvery: the state is saved after this many uploads, so an interrupted run keeps it
+    :param HashIndex index: hashes of the files on the server. a file already there is not uploaded,
+        its object is added to the folder. the uploaded files are added to the index
+    """
+
+    stateName = 'ingest.json'
+
+    def __init__(self, apisession, localDir, workers=4, chunkThreshold=500 * 1024 * 1024, stateDir=None,
+                 saveEvery=100, index=None):
+        self.api = apisession
+        self.localDir = Path(localDir)
+        self.workers = max(1, workers)
+        self.chunkThreshold = chunkThreshold
+        self.stateDir = Path(stateDir) if stateDir is not None else self.localDir / '.vsdingest'
+        self.saveEvery = saveEvery
+        self.index = index
+        self.state = None
+        self.result = None
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def _count(self, stage, items=0, nbytes=0, requests=0):
+        with self._lock:
+            self.result.items[stage] += items
+            self.result.bytes[stage] += nbytes
+            self.result.requests[stage] += requests
+
+    def _fail(self, what, err):
+        logger.error('ingest of %s failed: %s', what, err)
+        with self._lock:
+            self.result.failed.append((str(what), str(err)))
+
+    def _recorded(self):
+        # save the state every saveEvery uploads
+        with self._lock:
+            self._pending += 1
+            if self._pending < self.saveEvery:
+                return
+            self._pending = 0
+        self.state.save()
+
+    def _map(self, pool, fn, items):
+        """
+        fn applied to the items in the pool, within the deadline of the caller
+        """
+        deadline = self.api._deadline()
+
+        def call(item):
+            with self.api.deadline(deadline):
+                return fn(item)
+
+        return list(pool.map(call, items))
+
+    def _scan(self):
+        """
+        :return: the relative directories and the relative files with their stat
+        :rtype: (list, list)
+        """
+        dirs = list()
+        files = list()
+        for root, dirnames, filenames in os.walk(str(self.localDir)):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+            rel = Path(root).relative_to(self.localDir)
+            for d in dirnames:
+                dirs.append((rel / d).as_posix())
+            for name in sorted(filenames):
+                if name.startswith('.'):
+                    continue
+                st = os.stat(os.path.join(root, name))
+                files.append(((rel / name).as_posix(), st))
+                self._count('scan', 1, st.st_size)
+        return dirs, files
+
+    def _folderTree(self):
+        """
+        the child folders of every folder, read with one paged listing of the folders
+
+        :return: selfUrl of a folder -> name -> selfUrl of its child folders
+        :rtype: dict
+        """
+        tree = dict()
+        resource = 'folders'
+        while resource:
+            page = vsdModels.Pagination(**self.api.getRequest(resource))
+            self._count('folders', requests=1)
+            for item in page.items:
+                parent = (item.get('parentFolder') or {}).get('selfUrl')
+                if parent is not None:
+                    tree.setdefault(parent, dict())[item.get('name')] = item.get('selfUrl')
+            resource = page.nextPageUrl
+        return tree
+
+    def _createFolders(self, dirs, pool):
+        """
+        look up or create the folder of every directory, a level after the other
+        """
+        memo = self.state.folders
+        memo['.'] = self.state.root
+        levels = dict()
+        for d in dirs:
+            if d not in memo:
+                levels.setdefault(d.count('/'), list()).append(d)
+
+        # folders created by this run have no children yet, the listing is read once
+        tree = self._folderTree() if levels else dict()
+        for depth in sorted(levels):
+            todo = levels[depth]
+
+            def ensure(d):
+                parent, name = d.rsplit('/', 1) if '/' in d else ('.', d)
+                if parent not in memo:
+                    # the parent failed
+                    return
+                existing = tree.get(memo[parent], dict()).get(name)
+                if existing is not None:
+                    memo[d] = existing
+                    self._count('folders', 1)
+                    return
+                folder = vsdModels.Folder(name=name, parentFolder=vsdModels.APIBase(selfUrl=memo[parent]))
+                try:
+                    res = self.api.postRequest('folders', folder.to_struct())
+                except (RequestException, ValueError) as err:
+                    self._fail(d, err)
+                    return
+                created = vsdModels.Folder(**res).selfUrl if isinstance(res, dict) else None
+                if created is None:
+                    # _post does not raise on an error status
+                    self._fail(d, 'folder not created: {0}'.format(res))
+                    return
+                memo[d] = created
+                self._count('folders', 1, requests=1)
+                with self._lock:
+                    self.result.foldersCreated += 1
+
+            self._map(pool, ensure, todo)
+
+    def _upload(self, rel, st):
+        """
+        upload a file and record its object
+        """
+        fp = self.localDir / rel
+        folder = self.state.folders.get(rel.rsplit('/', 1)[0] if '/' in rel else '.')
+        if folder is None:
+            return
+        try:
+            sha1 = None
+            if self.index is not None:
+                sha1 = self.api.localSha1(fp)
+                entry = self.index.find(sha1, st.st_size)
+                if entry is not None and entry.get('object'):
+                    self.state.setFile(rel, st, entry['object'], entry['file'], folder)
+                    with self._lock:
+                        self.result.deduplicated += 1
+                        self.result.bytesAvoided += st.st_size
+                    self._recorded()
+                    return
+            if st.st_size >= self.chunkThreshold:
+                result = ChunkedUpload(self.api, fp, stateDir=self.stateDir).run()
+                res = result.response
+                self._count('upload', requests=result.chunks + 1)
+            else:
+                res = self.api._uploadFile(fp)
+                self._count('upload', requests=1)
+        except (RequestException, IOError, OSError, ValueError) as err:
+            # ValueError: an error page that is not JSON
+            self._fail(rel, err)
+            return
+        if not isinstance(res, dict) or 'relatedObject' not in res:
+            # _post does not raise on an error status
+            self._fail(rel, 'upload failed: {0}'.format(res))
+            return
+        self.state.setFile(rel, st, res['relatedObject']['selfUrl'], res['file']['selfUrl'], folder)
+        if sha1 is not None:
+            self.index.put(sha1, res['file']['selfUrl'], res['relatedObject']['selfUrl'], st.st_size)
+        self._count('upload', 1, st.st_size)
+        self._recorded()
+
+    def _link(self, folder, entries):
+        """
+        add the objects to a folder with one update
+
+        :param str folder: selfUrl of the folder
+        :param list entries: relative path and object selfUrl of the files
+        """
+        try:
+            target = self.api.getFolder(folder)
+            before = len(target.containedObjects or [])
+            objects = self.api._changedFolderObjects(target, add=[obj for rel, obj in entries])
+            added = len(objects) - before if objects is not None else 0
+            requests = 1
+            if objects is not None:
+                if self.api._putFolderObjects(target, objects) is None:
+                    raise RequestException('update of folder {0} failed'.format(folder))
+                requests += 1
+        except RequestException as err:
+            self._fail(folder, err)
+            return
+        self.state.setLinked(rel for rel, obj in entries)
+        self._count('link', added, requests=requests)
+
+    def run(self, remoteRoot):
+        """
+        ingest the local directory
+
+        :param remoteRoot: Folder, selfUrl or ID of the remote root folder
+        :return: counts and timing per stage, the failed files in result.failed
+        :rtype: IngestResult
+        """
+
+        self.result = result = IngestResult(self.localDir)
+        if not isinstance(remoteRoot, vsdModels.Folder):
+            remoteRoot = self.api.getFolder(remoteRoot)
+        self.state = IngestState.load(self.stateDir / self.stateName, remoteRoot.selfUrl)
+
+        start = time.time()
+        dirs, files = self._scan()
+        result.seconds['scan'] = time.time() - start
+
+        try:
+            with ThreadPoolExecutor(self.workers) as pool:
+                start = time.time()
+                self._createFolders(dirs, pool)
+                self.state.save()
+                result.seconds['folders'] = time.time() - start
+
+                start = time.time()
+                todo = list()
+                for rel, st in files:
+                    if self.state.uploaded(rel, st) is not None:
+                        result.resumed += 1
+                    else:
+                        todo.append((rel, st))
+                # large files first, so they do not run alone at the end
+                todo.sort(key=lambda item: -item[1].st_size)
+                self._map(pool, lambda item: self._upload(*item), todo)
+                result.seconds['upload'] = time.time() - start
+                self.state.save()
+
+                start = time.time()
+                batches = dict()
+                for rel, st in files:
+                    entry = self.state.uploaded(rel, st)
+                    if entry is not None and not entry.get('linked'):
+                        batches.setdefault(entry['folder'], list()).append((rel, entry['object']))
+                self._map(pool, lambda item: self._link(*item), batches.items())
+                result.seconds['link'] = time.time() - start
+        finally:
+            self.state.save()
+            if self.index is not None:
+                self.index.save()
+
+        logger.info('%s', result)
+        return result
@@ -0,0 +1,337 @@
+#!/usr/bin/python
+"""
+=======
+INFOS
+=======
+* python version: 3.5
+* connectVSD 0.8.1
+* module: mirror
+
+========
+CHANGES
+========
+* mirror of a folder tree to a local directory with a manifest
+
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from requests.exceptions import RequestException
+
+from vsdConnect.codec import getCodec
+
+logger = logging.getLogger(__name__)
+
+_unsafe = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+
+def safeName(name, default):
+    """
+    :return: name usable as a file or directory name on all platforms
+    :rtype: str
+    """
+    name = _unsafe.sub('_', name or '').strip(' .')
+    return name or default
+
+
+class MirrorManifest(object):
+    """
+    record of the files of a mirror: relative path -> url, SHA-1, size and mtime of the local file.
+    a file whose size and mtime are unchanged since it was recorded is not hashed again
+
+    :param Path root: the mirror directory, the manifest is root/.vsdmirror.json
+    """
+
+    name = '.vsdmirror.json'
+
+    def __init__(self, root):
+        self.path = Path(root, self.name)
+        self.folder = None
+        self.files = dict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, root):
+        """
+        :return: the manifest of root, empty if there is none or it is unreadable
+        :rtype: MirrorManifest
+        """
+        manifest = cls(root)
+        try:
+            data = getCodec().loads(manifest.path.read_bytes())
+        except (IOError, OSError, ValueError):
+            return manifest
+        if isinstance(data, dict) and isinstance(data.get('files'), dict):
+            manifest.folder = data.get('folder')
+            manifest.files = data['files']
+        return manifest
+
+    def get(self, rel):
+        with self._lock:
+            return self.files.get(rel)
+
+    def set(self, rel, url, sha1, fp):
+        """
+        record a local file
+        """
+        st = os.stat(str(fp))
+        with self._lock:
+            self.files[rel] = dict(url=url, sha1=sha1, size=st.st_size, mtime_ns=st.st_mtime_ns)
+
+    def pop(self, rel):
+        with self._lock:
+            return self.files.pop(rel, None)
+
+    def unchanged(self, rel, st):
+        """
+        :param os.stat_result st: the local file
+        :return: the entry of the file if it was not modified since it was recorded, else None
+        :rtype: dict
+        """
+        entry = self.get(rel)
+        if entry and entry.get('size') == st.st_size and entry.get('mtime_ns') == st.st_mtime_ns:
+            return entry
+        return None
+
+    def save(self):
+        """
+        write the manifest atomically
+        """
+        with self._lock:
+            data = dict(folder=self.folder, files=self.files)
+            tmp = self.path.with_name(self.path.name + '.tmp')
+            tmp.write_bytes(getCodec().dumpb(data))
+            os.replace(str(tmp), str(self.path))
+
+
+class MirrorResult(object):
+    """
+    result of a mirror run
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.folders = 0
+        self.objects = 0
+        self.files = 0
+        #: files transferred (from the network or the blob store)
+        self.downloaded = 0
+        #: files already present with matching size and hash
+        self.skipped = 0
+        #: files in the manifest that are no longer in the folder
+        self.removed = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        #: (path or url, error) of the failed objects and files
+        self.failed = list()
+
+    def __str__(self):
+        return ('{0}: {1} folders, {2} objects, {3} files ({4} downloaded, {5} skipped, {6} removed, '
+                '{7} failed), {8:.1f} MB in {9:.2f}s').format(
+            self.target, self.folders, self.objects, self.files, self.downloaded, self.skipped,
+            self.removed, len(self.failed), self.bytes / 1e6, self.seconds)
+
+
+class FolderMirror(object):
+    """
+    mirrors a folder tree of the VSD to a local directory: each folder becomes a directory, each
+    object a directory <id>_<name> with its files. the files of the objects are downloaded by a
+    pool of workers, large files in addition use the range downloads of the download engine.
+
+    files already present with the size and the SHA-1 of the VSD file are skipped. the manifest
+    target/.vsdmirror.json records the hash, size and mtime of every mirrored file, so a rerun only
+    hashes files modified locally and only transfers what changed
+
+    :param VSDConnecter apisession: the API session
+    :param Path target: the mirror directory
+    :param int workers: objects processed concurrently
+    :param int saveEvery: the manifest is saved after this many files, so an interrupted run keeps its state
+    """
+
+    def __init__(self, apisession, target, workers=4, saveEvery=100):
+        self.api = apisession
+        self.target = Path(target)
+        self.workers = max(1, workers)
+        self.saveEvery = saveEvery
+        self.manifest = None
+        self.result = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._incomplete = False
+
+    def _rel(self, fp):
+        return fp.relative_to(self.target).as_posix()
+
+    def _count(self, **kwargs):
+        with self._lock:
+            for key, value in kwargs.items():
+                setattr(self.result, key, getattr(self.result, key) + value)
+
+    def _fail(self, what, err):
+        logger.error('mirror of %s failed: %s', what, err)
+        with self._lock:
+            self.result.failed.append((str(what), str(err)))
+
+    def _recorded(self):
+        # save the manifest every saveEvery files
+        with self._lock:
+            self._pending += 1
+            if self._pending < self.saveEvery:
+                return
+            self._pending = 0
+        self.manifest.save()
+
+    def _walk(self, folder):
+        """
+        create the directories of the folder tree
+
+        :return: (directory, containedObjects) per folder
+        :rtype: generator
+        """
+        # selfUrl of a folder -> directory of its parent
+        parents = dict()
+        used = set()
+        for folderObject, childFolders, containedObjects in self.api.walkFolder(folder):
+            d = self.target
+            if folderObject.selfUrl != folder.selfUrl:
+                d = parents.get(folderObject.selfUrl, self.target)
+                d = d / safeName(folderObject.name, 'Folder_{0}'.format(folderObject.id))
+                if d in used:
+                    # sibling folders with the same name
+                    d = d.with_name('{0}_{1}'.format(d.name, folderObject.id))
+                used.add(d)
+            d.mkdir(parents=True, exist_ok=True)
+            for child in childFolders:
+                parents[child.selfUrl] = d
+            self._count(folders=1)
+            yield d, containedObjects
+
+    def _current(self, rel, fp, f, expected):
+        """
+        :return: if the local file matches the VSD file
+        :rtype: bool
+        """
+        try:
+            st = fp.stat()
+        except OSError:
+            return False
+        if f.size is not None and st.st_size != f.size:
+            return False
+        entry = self.manifest.unchanged(rel, st)
+        if entry is not None and entry.get('url') == f.selfUrl:
+            # files without hash code are compared by size and mtime only
+            if not expected or entry.get('sha1') in expected:
+                return True
+        if not expected:
+            return False
+        sha1 = self.api.localSha1(fp)
+        if sha1 not in expected:
+            return False
+        self.manifest.set(rel, f.selfUrl, sha1, fp)
+        return True
+
+    def _mirrorObject(self, item, d, deadline):
+        """
+        download the files of an object into a directory of d, within the deadline of the caller
+        """
+        with self.api.deadline(deadline):
+            return self._mirrorFiles(item, d)
+
+    def _mirrorFiles(self, item, d):
+        try:
+            obj = self.api.getObject(item.selfUrl)
+            files = self.api.getObjectFiles(obj)
+        except RequestException as err:
+            # the files of the object are unknown, nothing is pruned
+            self._incomplete = True
+            self._fail(item.selfUrl, err)
+            return set()
+
+        od = d / safeName('{0}_{1}'.format(obj.id, obj.name or ''), str(obj.id))
+        od.mkdir(parents=True, exist_ok=True)
+        self._count(objects=1, files=len(files))
+
+        seen = set()
+        names = set()
+        for f in files:
+            name = safeName(f.originalFileName, 'File_{0}'.format(f.id))
+            if name in names:
+                name = 'File_{0}_{1}'.format(f.id, name)
+            names.add(name)
+            fp = od / name
+            rel = self._rel(fp)
+            seen.add(rel)
+            expected = set(h.upper() for h in (f.fileHashCode, f.anonymizedFileHashCode) if h)
+            try:
+                if self._current(rel, fp, f, expected):
+                    self._count(skipped=1)
+                    continue
+                res = self.api.downloader.fetch(self.api.fullUrl(f.downloadUrl), fp,
+                                                checksum=list(expected) or None)
+                self.manifest.set(rel, f.selfUrl, res.checksum, fp)
+                self._count(downloaded=1, bytes=res.bytes)
+            except (RequestException, OSError) as err:
+                self._fail(rel, err)
+                continue
+            self._recorded()
+        return seen
+
+    def _prune(self, seen, delete):
+        # manifest entries of files no longer in the folder
+        for rel in sorted(set(self.manifest.files) - seen):
+            self.manifest.pop(rel)
+            self._count(removed=1)
+            if delete:
+                try:
+                    Path(self.target, rel).unlink()
+                except OSError as err:
+                    logger.info('%s not removed: %s', rel, err)
+
+    def run(self, folder, delete=False):
+        """
+        mirror the folder tree
+
+        :param folder: Folder, selfUrl or ID of the top folder
+        :param bool delete: remove local files that are no longer in the folder,
+            by default they are only dropped from the manifest
+        :return: the counts of the run
+        :rtype: MirrorResult
+        """
+
+        start = time.time()
+        self.target.mkdir(parents=True, exist_ok=True)
+        self.result = MirrorResult(self.target)
+        self.manifest = MirrorManifest.load(self.target)
+        if not hasattr(folder, 'childFolders'):
+            folder = self.api.getFolder(folder)
+        if self.manifest.folder not in (None, folder.selfUrl):
+            logger.warning('%s is a mirror of %s, not of %s', self.target, self.manifest.folder, folder.selfUrl)
+        self.manifest.folder = folder.selfUrl
+
+        seen = set()
+        self._incomplete = False
+        deadline = self.api._deadline()
+        try:
+            with ThreadPoolExecutor(self.workers) as pool:
+                futures = list()
+                for d, containedObjects in self._walk(folder):
+                    for item in containedObjects:
+                        futures.append(pool.submit(self._mirrorObject, item, d, deadline))
+                for future in futures:
+                    seen.update(future.result())
+            # an aborted run or an object that could not be listed prunes nothing
+            if not self._incomplete:
+                self._prune(seen, delete)
+        finally:
+            self.manifest.save()
+            self.result.seconds = time.time() - start
+
+        logger.info('%s', self.result)
+        return self.result
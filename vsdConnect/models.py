@@ -14,8 +14,8 @@ CHANGES
 * implemented objects as jsonmodels
 
 """
-import json
 from jsonmodels import models, fields, errors, validators
+from vsdConnect.codec import getCodec
 from pathlib import Path, PurePath, WindowsPath
 
 
@@ -168,7 +168,7 @@ class APIBase(models.Base):
         :return: json
         :rtype: json
         """
-        return json.dumps(self.to_struct())
+        return getCodec().dumps(self.to_struct())
 
 
     def show(self):
@@ -176,15 +176,16 @@ class APIBase(models.Base):
         show the object as json readable structure (dict), nicely formated
 
         """
-        print(json.dumps(self.to_struct(), sort_keys = True, indent = 4))
+        print(getCodec().dumps(self.to_struct(), sort_keys = True, indent = 4))
 
 
 
-    def save(self, fp = 'object.json'):
+    def save(self, fp = 'object.json', indent = 4):
         """
         save the object as json to the given filepath
 
         :params Path fp: the filepath to the file
+        :params int indent: indentation, None for compact output (fastest)
         :return: the path to the stored file
         :rtype: Path
 
@@ -199,8 +200,8 @@ class APIBase(models.Base):
             fp.touch()
 
 
-        with fp.open('w') as outfile:
-            json.dump(self.to_struct(), outfile, indent = 4)
+        with fp.open('wb') as outfile:
+            outfile.write(getCodec().dumpb(self.to_struct(), indent = indent))
 
         return fp
 
@@ -288,15 +289,17 @@ class Files(APIBaseID):
         res = apisession.getRequest(self.selfUrl)
         return Files(**res)
 
-    def download(self, apisession, working_dir=None, fn=None):
+    def download(self, apisession, working_dir=None, fn=None, verify=True):
         """
         download the file into a ZIP file based on the file name and the working directory
 
         :param connectVSD apisession: apisession
         :param Path working_dir: workpath, where to store the zip
         :param str fn: filename, default File_ID.zip
+        :param bool verify: check the SHA-1 against fileHashCode (or anonymizedFileHashCode) while downloading
         :return: None or filename
         :rtype: str
+        :raises: ChecksumMismatch
         """
 
         fp = Path('File_'+ str(self.id))
@@ -306,7 +309,28 @@ class Files(APIBaseID):
         if working_dir:
             fp = Path(working_dir, fp)
 
-        return apisession._download(apisession.fullUrl(self.downloadUrl), fp)
+        checksum = None
+        if verify:
+            checksum = [h for h in (self.fileHashCode, self.anonymizedFileHashCode) if h] or None
+
+        return apisession._download(apisession.fullUrl(self.downloadUrl), fp, checksum=checksum)
+
+    def download_buffer(self, apisession, buffer=None, verify=True):
+        """
+        download the file into memory, without writing it to disk
+
+        :param connectVSD apisession: apisession
+        :param buffer: bytearray, writable memoryview, writable file object or None (new buffer)
+        :param bool verify: check the SHA-1 against fileHashCode (or anonymizedFileHashCode) while downloading
+        :return: the bytearray, the filled part of the memoryview or the file object
+        :raises: ChecksumMismatch
+        """
+
+        checksum = None
+        if verify:
+            checksum = [h for h in (self.fileHashCode, self.anonymizedFileHashCode) if h] or None
+
+        return apisession.downloadBuffer(self.downloadUrl, buffer, checksum=checksum)
 
 ################################################
 #FOLDER
@@ -342,6 +366,57 @@ class Folder(APIBaseID):
 
         return Folder(selfUrl=self.parentFolder.selfUrl).get(apisession)
 
+    def mirror(self, apisession, target_dir, workers=4, delete=False):
+        """
+        mirror the folder tree with the files of all objects to a local directory
+
+        :param connectVSD apisession: the API session
+        :param Path target_dir: the mirror directory
+        :param int workers: objects downloaded concurrently
+        :param bool delete: remove local files that are no longer in the folder
+        :return: the counts of the run
+        :rtype: MirrorResult
+        """
+
+        return apisession.mirror(self, target_dir, workers=workers, delete=delete)
+
+    def add_objects(self, apisession, objects):
+        """
+        add many objects to the folder with one update
+
+        :param connectVSD apisession: the API session
+        :param objects: the objects to add (APIObject, APIBase or selfUrl)
+        :return: the updated folder
+        :rtype: Folder
+        """
+
+        return apisession.addObjectsToFolder(self, objects)
+
+    def remove_objects(self, apisession, objects):
+        """
+        remove many objects from the folder with one update
+
+        :param connectVSD apisession: the API session
+        :param objects: the objects to remove (APIObject, APIBase or selfUrl)
+        :return: if the folder was updated
+        :rtype: bool
+        """
+
+        return apisession.removeObjectsFromFolder(self, objects)
+
+    def ingest(self, apisession, local_dir, workers=4):
+        """
+        upload a local directory tree into the folder, the sub directories become sub folders
+
+        :param connectVSD apisession: the API session
+        :param Path local_dir: the local directory
+        :param int workers: concurrent uploads
+        :return: the counts and throughput per stage
+        :rtype: IngestResult
+        """
+
+        return apisession.ingest(local_dir, self, workers=workers)
+
     def get_objects(self, apisession):
         """
         return the APIobject contained in the folder (convert APIBase to the correct Object)
@@ -1079,11 +1154,7 @@ class APIObject(APIBaseID):
 
         :param Folder folder: the target folder object
         """
-        objSelfUrl = APIBase(**self.to_struct())
-
-        if not objSelfUrl in folder.containedObjects:
-            folder.containedObjects.append(objSelfUrl)
-            return apisession.putRequest('folders', data=folder.to_struct())
+        return apisession.updateFolderObjects(folder, add=[self])
 
     def remove(self, apisession, folder):
         """
@@ -1092,7 +1163,7 @@ class APIObject(APIBaseID):
         :param Folder folder: the target folder object
         :param connectVSD apisession: the connection to the API
         """
-        pass
+        return apisession.updateFolderObjects(folder, remove=[self])
 
     def delete(self, apisession):
         """
@@ -1125,6 +1196,44 @@ class APIObject(APIBaseID):
 
         return apisession._download(apisession.fullUrl(self.downloadUrl), fp)
 
+    def extract(self, apisession, working_dir=None, members=None, callback=None):
+        """
+        download the object and extract its files while the ZIP streams in, the ZIP is not stored
+
+        :param connectVSD apisession: apisession
+        :param Path working_dir: workpath, where to create the directory named after the object
+        :param members: None (all), a function name -> bool or a list of names and glob patterns
+        :param callback: function called with the name and the data of each file instead of writing files
+        :return: names of the extracted files
+        :rtype: list of str
+        """
+
+        return apisession.extractObject(self, working_dir, members=members, callback=callback)
+
+    def download_buffer(self, apisession, buffer=None):
+        """
+        download the object ZIP into memory, without writing it to disk
+
+        :param connectVSD apisession: apisession
+        :param buffer: bytearray, writable memoryview, writable file object or None (new buffer)
+        :return: the bytearray, the filled part of the memoryview or the file object
+        """
+
+        return apisession.downloadBuffer(self.downloadUrl, buffer)
+
+    def get_previews(self, apisession, thumbnail=True, paths=False):
+        """
+        get the preview images of the object, from the preview cache if possible
+
+        :param connectVSD apisession: apisession
+        :param bool thumbnail: the thumbnails, otherwise the full images
+        :param bool paths: return the files in the preview cache instead of the bytes
+        :return: list of images
+        :rtype: list of bytes or Path
+        """
+
+        return apisession.getObjectPreviews([self], thumbnail=thumbnail, paths=paths)[0]
+
     def  add_object_rights(self, apisession):
         """
         the permission defined in userRights or groupRights are pushed to the Database
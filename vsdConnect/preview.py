@@ -0,0 +1,215 @@
+#!/usr/bin/python
+"""
+=======
+INFOS
+=======
+* python version: 3.5
+* connectVSD 0.8.1
+* module: preview
+
+========
+CHANGES
+========
+* concurrent preview fetching with a disk cache of the images
+
+"""
+
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+from requests.exceptions import RequestException
+
+import vsdConnect.models as vsdModels
+from vsdConnect.blobstore import BlobStore
+
+logger = logging.getLogger(__name__)
+
+
+class PreviewCache(BlobStore):
+    """
+    disk cache of preview images keyed by the preview id, thumbnails and full images separately.
+    the least recently used images are removed when the cache grows over maxBytes (see BlobStore)
+
+    :param Path root: directory of the cache
+    :param int maxBytes: size cap in bytes, None is unlimited
+    """
+
+    def __init__(self, root, maxBytes=None):
+        super(PreviewCache, self).__init__(root, maxBytes=maxBytes, link='copy')
+
+    @staticmethod
+    def key(previewId, thumbnail=True):
+        """
+        :return: the cache key of a preview image, eg. thumbnail-1234
+        :rtype: str
+        """
+        return '{0}-{1}'.format('thumbnail' if thumbnail else 'image', previewId)
+
+    def path(self, key):
+        # a thumbnail and its image are stored next to each other
+        return self.root / key[-2:].replace('-', '0') / key
+
+    def find(self, key):
+        """
+        :return: the file of a cached image, marked as used, or None
+        :rtype: Path
+        """
+        fp = self.path(key)
+        try:
+            st = fp.stat()
+        except OSError:
+            self.misses += 1
+            return None
+        self._touch(fp, st)
+        self.hits += 1
+        return fp
+
+
+def createPreviewCache(cache):
+    """
+    :param cache: None, a directory or a PreviewCache
+    :return: the preview cache or None
+    :rtype: PreviewCache
+    """
+
+    if cache is None or isinstance(cache, PreviewCache):
+        return cache
+    return PreviewCache(cache)
+
+
+class PreviewFetcher(object):
+    """
+    fetches the preview images of objects with a pool of workers. with a cache, an image already
+    on disk is returned without any request, not even for the preview resource
+
+    :param VSDConnecter apisession: the API session
+    :param cache: a directory or a PreviewCache, None keeps the images in memory only
+    :param int workers: concurrent requests
+    """
+
+    def __init__(self, apisession, cache=None, workers=8):
+        self.api = apisession
+        self.cache = createPreviewCache(cache)
+        self.workers = max(1, workers)
+
+    @staticmethod
+    def previewId(preview):
+        """
+        :return: the id of a preview, taken from the selfUrl if the id is not set
+        :rtype: str
+        """
+        if preview.id is not None:
+            return str(preview.id)
+        return preview.selfUrl.rstrip('/').rsplit('/', 1)[-1]
+
+    def fetch(self, preview, thumbnail=True, path=False):
+        """
+        get the image of a preview
+
+        :param Preview preview: the preview, only the selfUrl is needed
+        :param bool thumbnail: the thumbnail, otherwise the full image
+        :param bool path: return the file in the cache instead of the bytes, valid until evicted
+        :return: the image
+        :rtype: bytes or Path
+        """
+
+        if path and self.cache is None:
+            raise ValueError('paths need a preview cache, see the previewCache of the VSDConnecter')
+
+        key = None
+        if self.cache is not None:
+            key = PreviewCache.key(self.previewId(preview), thumbnail)
+            if path:
+                fp = self.cache.find(key)
+                if fp is not None:
+                    return fp
+            else:
+                f = self.cache.open(key)
+                if f is not None:
+                    with f:
+                        return f.read()
+
+        url = preview.thumbnailUrl if thumbnail else preview.imageUrl
+        if not url:
+            preview = vsdModels.Preview(**self.api.getRequest(preview.selfUrl))
+            url = preview.thumbnailUrl if thumbnail else preview.imageUrl
+        data = bytes(self.api.downloadBuffer(url))
+
+        if self.cache is not None:
+            fp = self.cache.write(key, data)
+            if path:
+                return fp
+        return data
+
+    def _object(self, obj):
+        # objects listed as APIBase (eg. folder content) are fetched for their previews
+        if not isinstance(obj, vsdModels.APIObject):
+            obj = self.api.getObject(obj.selfUrl)
+        return obj
+
+    def _within(self, deadline, fn, *args):
+        # the deadline of the caller is thread-local, the pool workers enter it again
+        with self.api.deadline(deadline):
+            return fn(*args)
+
+    def fetchObjects(self, objects, thumbnail=True, paths=False):
+        """
+        get the preview images of many objects concurrently
+
+        :param objects: APIObjects (or APIBase with the selfUrl of the objects)
+        :param bool thumbnail: the thumbnails, otherwise the full images
+        :param bool paths: return the files in the cache instead of the bytes
+        :return: per object a list of images, in the order of objects
+        :rtype: list of list
+        """
+
+        objects = list(objects)
+        deadline = self.api._deadline()
+        with ThreadPoolExecutor(self.workers) as pool:
+            full = list(pool.map(lambda obj: self._within(deadline, self._object, obj), objects))
+            futures = [[pool.submit(self._within, deadline, self.fetch, p, thumbnail, paths)
+                        for p in obj.objectPreviews or []] for obj in full]
+            return [[f.result() for f in fs] for fs in futures]
+
+    def prefetch(self, folder, thumbnail=True, recursive=False):
+        """
+        load the preview images of the objects of a folder into the cache, eg. before showing a gallery
+
+        :param folder: Folder, selfUrl or ID of the folder
+        :param bool thumbnail: the thumbnails, otherwise the full images
+        :param bool recursive: also the objects of the sub folders
+        :return: number of images in the cache for the folder
+        :rtype: int
+        """
+
+        if self.cache is None:
+            raise ValueError('prefetching needs a preview cache, see the previewCache of the VSDConnecter')
+
+        if recursive:
+            items = [obj for f, dirs, objs in self.api.walkFolder(folder) for obj in objs]
+        else:
+            if not isinstance(folder, vsdModels.Folder):
+                folder = self.api.getFolder(folder)
+            items = folder.containedObjects or []
+
+        def one(item):
+            try:
+                obj = self._object(item)
+            except RequestException as err:
+                logger.info('object %s not fetched: %s', item.selfUrl, err)
+                return list()
+            return [pool.submit(self._within, deadline, image, p) for p in obj.objectPreviews or []]
+
+        def image(preview):
+            try:
+                self.fetch(preview, thumbnail, path=True)
+                return 1
+            except RequestException as err:
+                logger.info('preview %s not fetched: %s', preview.selfUrl, err)
+                return 0
+
+        deadline = self.api._deadline()
+        with ThreadPoolExecutor(self.workers) as pool:
+            futures = [f for fs in pool.map(lambda item: self._within(deadline, one, item), items) for f in fs]
+            return sum(f.result() for f in futures)
@@ -0,0 +1,175 @@
+#!/usr/bin/python
+"""
+=======
+INFOS
+=======
+* python version: 3.5
+* connectVSD 0.8.1
+* module: reconcile
+
+========
+CHANGES
+========
+* reconciliation of many local files with the files of many objects by SHA-1
+
+"""
+
+import logging
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from vsdConnect.dedup import HashIndex
+from vsdConnect.hashing import BulkHasher
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteIndex(HashIndex):
+    """
+    reverse index SHA-1 -> every (object, file) on the server with that content, built like a
+    HashIndex from folders, objects or file listings. a file is indexed under its hash and its
+    anonymized hash
+    """
+
+    def __init__(self, path=None):
+        super(RemoteIndex, self).__init__(path)
+        #: SHA-1 (uppercase) -> list of dict(file, object, size)
+        self.locations = dict()
+        #: selfUrl of the file -> dict(object, size, hashes)
+        self.files = dict()
+
+    def put(self, sha1, fileUrl, objectUrl=None, size=None):
+        super(RemoteIndex, self).put(sha1, fileUrl, objectUrl, size)
+        sha1 = sha1.upper()
+        with self._lock:
+            entry = self.files.setdefault(fileUrl, dict(object=objectUrl, size=size, hashes=list()))
+            if sha1 in entry['hashes']:
+                return
+            entry['hashes'].append(sha1)
+            self.locations.setdefault(sha1, list()).append(dict(file=fileUrl, object=objectUrl, size=size))
+
+    def _restore(self, data):
+        super(RemoteIndex, self)._restore(data)
+        self.files = data.get('files') or dict()
+        for url, entry in self.files.items():
+            for sha1 in entry['hashes']:
+                self.locations.setdefault(sha1, list()).append(dict(file=url, object=entry['object'],
+                                                                    size=entry['size']))
+
+    def _data(self):
+        data = super(RemoteIndex, self)._data()
+        data['files'] = self.files
+        return data
+
+
+class ReconcileResult(object):
+    """
+    local files matched with the files on the server
+
+    :param present: local path -> list of dict(file, object, size) on the server with the same content
+    :param missing: local paths not on the server
+    :param extra: selfUrl -> dict(object, size, hashes) of the server files without local copy
+    """
+
+    def __init__(self):
+        self.present = dict()
+        self.missing = list()
+        self.extra = dict()
+        #: (path, error) of the local files not hashed and (selfUrl, error) of the server objects and
+        #: files not indexed. with server errors, local files of those objects are reported missing
+        self.failed = list()
+        self.bytesPresent = 0
+        self.bytesMissing = 0
+        self.seconds = 0.0
+
+    def __str__(self):
+        return '{0} present ({1:.1f} MB), {2} missing ({3:.1f} MB), {4} extra on the server, {5} failed, ' \
+               '{6:.2f}s'.format(len(self.present), self.bytesPresent / 1e6, len(self.missing),
+                                 self.bytesMissing / 1e6, len(self.extra), len(self.failed), self.seconds)
+
+
+class Reconciler(object):
+    """
+    matches many local files with the files of a folder tree (or of a list of objects) by SHA-1.
+    the reverse index of the server files is fetched concurrently while the local files are hashed
+    (see hashing.BulkHasher, with the hash cache of the session), then joined with the local hashes
+    in one pass
+
+    :param VSDConnecter apisession: the API session
+    :param int workers: concurrent requests for the remote index
+    :param int hashWorkers: files hashed concurrently, default is the number of CPUs
+    """
+
+    def __init__(self, apisession, workers=8, hashWorkers=None):
+        self.api = apisession
+        self.workers = max(1, workers)
+        self.hashWorkers = hashWorkers
+
+    def index(self, remote, recursive=True, index=None):
+        """
+        build the reverse index of the server files
+
+        :param remote: Folder, selfUrl or ID of a folder, or a list of objects (APIObject or APIBase)
+        :param bool recursive: also the objects of the sub folders
+        :param RemoteIndex index: index to extend, objects already indexed are not fetched again
+        :return: the index
+        :rtype: RemoteIndex
+        """
+        index = index if index is not None else RemoteIndex()
+        if isinstance(remote, (list, tuple, set)):
+            index.addObjects(self.api, remote, workers=self.workers)
+        else:
+            index.addFolder(self.api, remote, recursive=recursive, workers=self.workers)
+        return index
+
+    def _index(self, deadline, remote, recursive, index):
+        # the index is built in a background thread, within the deadline of the caller
+        with self.api.deadline(deadline):
+            return self.index(remote, recursive, index)
+
+    def run(self, local, remote, recursive=True, index=None):
+        """
+        reconcile local files with the server
+
+        :param local: a directory (all files below), a file or an iterable of files
+        :param remote: Folder, selfUrl or ID of a folder, a list of objects or a RemoteIndex
+        :param bool recursive: also the objects of the sub folders
+        :param RemoteIndex index: index to extend instead of a new one
+        :return: present, missing and extra files
+        :rtype: ReconcileResult
+        """
+
+        start = time.time()
+        result = ReconcileResult()
+        deadline = self.api._deadline()
+        with ThreadPoolExecutor(1) as background:
+            if isinstance(remote, RemoteIndex):
+                remoteIndex = background.submit(lambda: remote)
+            else:
+                remoteIndex = background.submit(self._index, deadline, remote, recursive, index)
+            hasher = BulkHasher(self.hashWorkers, cache=self.api.hashes)
+            hashes = list(hasher.hash(local))
+            remoteIndex = remoteIndex.result()
+        result.failed = hasher.failed + sorted(remoteIndex.failed.items())
+
+        matched = set()
+        for fp, sha1 in hashes:
+            locations = remoteIndex.locations.get(sha1)
+            try:
+                size = os.stat(fp).st_size
+            except OSError:
+                size = 0
+            if locations:
+                result.present[fp] = locations
+                result.bytesPresent += size
+                matched.update(l['file'] for l in locations)
+            else:
+                result.missing.append(fp)
+                result.bytesMissing += size
+        result.extra = dict((url, entry) for url, entry in remoteIndex.files.items() if url not in matched)
+        result.missing.sort()
+        result.seconds = time.time() - start
+        logger.info('%s', result)
+        return result
@@ -0,0 +1,444 @@
+#!/usr/bin/python
+"""
+=======
+INFOS
+=======
+* python version: 3.5
+* connectVSD 0.8.1
+* module: transport
+
+========
+CHANGES
+========
+* pluggable transport layer: requests (default) and httpx (HTTP/1.1 and HTTP/2)
+* compression negotiation and transfer statistics per endpoint
+* streamed request bodies for httpx
+
+"""
+
+import logging
+import re
+import threading
+
+import requests
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+class TransferStats(object):
+    """
+    bytes transferred per endpoint: on the wire (compressed) and decoded.
+    ids in the path are replaced, so all objects/{id} requests are counted together
+    """
+
+    _id = re.compile(r'/\d+(?=/|$)')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = dict()
+
+    def endpoint(self, method, url):
+        """
+        :return: the endpoint key of a request, eg. 'GET /api/objects/{id}/files'
+        :rtype: str
+        """
+        return '{0} {1}'.format(method.upper(), self._id.sub('/{id}', urlsplit(url).path))
+
+    def record(self, method, url, wireBytes, bodyBytes, encoding=None):
+        """
+        count a response
+
+        :param str method: HTTP method
+        :param str url: url of the request
+        :param int wireBytes: bytes received (compressed)
+        :param int bodyBytes: bytes of the decoded body
+        :param str encoding: Content-Encoding of the response
+        """
+
+        key = self.endpoint(method, url)
+        with self._lock:
+            entry = self.endpoints.setdefault(
+                key, dict(requests=0, wireBytes=0, bodyBytes=0, encodings=dict()))
+            entry['requests'] += 1
+            entry['wireBytes'] += wireBytes
+            entry['bodyBytes'] += bodyBytes
+            encoding = encoding or 'identity'
+            entry['encodings'][encoding] = entry['encodings'].get(encoding, 0) + 1
+
+    def totals(self):
+        """
+        :return: requests, wireBytes and bodyBytes over all endpoints
+        :rtype: dict
+        """
+        with self._lock:
+            entries = list(self.endpoints.values())
+        return dict(
+            requests=sum(e['requests'] for e in entries),
+            wireBytes=sum(e['wireBytes'] for e in entries),
+            bodyBytes=sum(e['bodyBytes'] for e in entries),
+        )
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = dict()
+
+    def report(self):
+        """
+        :return: a table of the transferred bytes per endpoint, largest first
+        :rtype: str
+        """
+
+        with self._lock:
+            items = sorted(self.endpoints.items(), key=lambda kv: -kv[1]['wireBytes'])
+        lines = ['{0:50s} {1:>8s} {2:>12s} {3:>12s} {4:>6s}'.format(
+            'endpoint', 'requests', 'wire kB', 'decoded kB', 'ratio')]
+        for key, e in items:
+            ratio = e['bodyBytes'] / float(e['wireBytes']) if e['wireBytes'] else 1.0
+            lines.append('{0:50s} {1:8d} {2:12.1f} {3:12.1f} {4:6.1f}'.format(
+                key, e['requests'], e['wireBytes'] / 1024., e['bodyBytes'] / 1024., ratio))
+        return '\n'.join(lines)
+
+
+class Transport(object):
+    """
+    base class of the HTTP transports used by the VSDConnecter.
+
+    the requests session of the connecter holds auth, verify and headers, a transport
+    reads them on every request, so token renewal works for all backends.
+    responses behave like requests.Response and errors are raised as requests.exceptions
+
+    :param requests.Session session: the session of the connecter
+    """
+
+    name = None
+
+    def __init__(self, session):
+        self.session = session
+        self.stats = TransferStats()
+
+    def acceptEncoding(self):
+        """
+        :return: the content codings this backend decodes, for the Accept-Encoding header
+        :rtype: str
+        """
+        return 'gzip, deflate'
+
+    def _headers(self, headers, stream):
+        # metadata requests always negotiate compression, streamed downloads keep the session default
+        if stream:
+            return headers
+        headers = dict(headers or {})
+        headers.setdefault('Accept-Encoding', self.acceptEncoding())
+        return headers
+
+    def _record(self, method, url, res, wireBytes):
+        self.stats.record(method, url, wireBytes, len(res.content), res.headers.get('Content-Encoding'))
+
+    def request(self, method, url, **kwargs):
+        """
+        send a request
+
+        :param str method: HTTP method (GET, PUT, POST, DELETE, OPTIONS)
+        :param str url: full url
+        :param kwargs: params, data, json, files, headers, stream, timeout, auth, verify
+        :return: response
+        :rtype: requests.Response or compatible
+        :raises: RequestException
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RequestsTransport(Transport):
+    """
+    transport based on the requests session (default)
+    """
+
+    name = 'requests'
+
+    def acceptEncoding(self):
+        try:
+            # gzip, deflate and br or zstd if the decoders are installed
+            from urllib3.util.request import ACCEPT_ENCODING
+        except ImportError:
+            return super(RequestsTransport, self).acceptEncoding()
+        return ', '.join(ACCEPT_ENCODING.split(','))
+
+    def request(self, method, url, **kwargs):
+        stream = kwargs.get('stream', False)
+        kwargs['headers'] = self._headers(kwargs.get('headers'), stream)
+        res = self.session.request(method, url, **kwargs)
+        if not stream:
+            # urllib3 decodes while reading, tell() is the position in the undecoded body
+            try:
+                wireBytes = res.raw.tell()
+            except AttributeError:
+                wireBytes = int(res.headers.get('Content-Length', len(res.content)))
+            self._record(method, url, res, wireBytes)
+        return res
+
+    def close(self):
+        self.session.close()
+
+
+class HttpxTransport(Transport):
+    """
+    transport based on httpx, HTTP/1.1 or HTTP/2. with HTTP/2 all requests to the server
+    are multiplexed over one connection. requires httpx (pip install httpx[http2])
+
+    :param requests.Session session: the session of the connecter
+    :param bool http2: use HTTP/2
+    :param int maxConnections: size of the connection pool
+    """
+
+    name = 'httpx'
+
+    def __init__(self, session, http2=False, maxConnections=20):
+        super(HttpxTransport, self).__init__(session)
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError('the httpx transport requires httpx: pip install httpx[http2]')
+        self.httpx = httpx
+        self.http2 = http2
+        self.client = httpx.Client(
+            http2=http2,
+            verify=session.verify,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=maxConnections, max_keepalive_connections=maxConnections),
+        )
+        if http2:
+            self.name = 'http2'
+
+    #: content codings httpx decodes if one of the modules is installed
+    optionalEncodings = (('br', ('brotli', 'brotlicffi')), ('zstd', ('zstandard',)))
+
+    def acceptEncoding(self):
+        codings = [super(HttpxTransport, self).acceptEncoding()]
+        for coding, modules in self.optionalEncodings:
+            for module in modules:
+                try:
+                    __import__(module)
+                except ImportError:
+                    continue
+                codings.append(coding)
+                break
+        return ', '.join(codings)
+
+    def _timeout(self, timeout):
+        # requests timeouts are None, a float or a (connect, read) tuple
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return self.httpx.Timeout(connect=connect, read=read, write=read, pool=connect)
+        return self.httpx.Timeout(timeout)
+
+    def request(self, method, url, params=None, data=None, json=None, files=None, headers=None,
+                stream=False, timeout=None, auth=None, verify=None):
+
+        if isinstance(params, dict):
+            # requests drops None values, httpx would send them as empty strings
+            params = dict((k, v) for k, v in params.items() if v is not None)
+        if not params:
+            params = None
+
+        hdrs = dict(self.session.headers)
+        # the requests default headers are not meant for httpx
+        for key in ('User-Agent', 'Accept-Encoding', 'Connection'):
+            hdrs.pop(key, None)
+        hdrs.update(self._headers(headers, stream) or {})
+
+        content = None
+        if isinstance(data, (bytes, str)) or (data is not None and not isinstance(data, dict)):
+            # raw bodies (eg. encoded json) and streamed bodies (eg. upload.MultipartFile) are content in httpx
+            content, data = data, None
+
+        try:
+            req = self.client.build_request(
+                method, url, params=params, content=content, data=data, json=json, files=files,
+                headers=hdrs, timeout=self._timeout(timeout))
+            res = self.client.send(req, auth=auth or self.session.auth, stream=stream)
+        except self.httpx.HTTPError as err:
+            raise self._translate(err)
+        res = HttpxResponse(res, self)
+        if not stream:
+            self._record(method, url, res, res._res.num_bytes_downloaded)
+        return res
+
+    def _translate(self, err):
+        """
+        map a httpx exception to the requests exception the connecter handles
+
+        :param httpx.HTTPError err: the error
+        :return: the matching requests exception
+        :rtype: RequestException
+        """
+
+        httpx = self.httpx
+        if isinstance(err, httpx.ConnectTimeout):
+            cls = requests.exceptions.ConnectTimeout
+        elif isinstance(err, httpx.TimeoutException):
+            cls = requests.exceptions.ReadTimeout
+        elif isinstance(err, (httpx.NetworkError, httpx.RemoteProtocolError)):
+            cls = requests.exceptions.ConnectionError
+        else:
+            cls = requests.exceptions.RequestException
+        new = cls(str(err))
+        new.__cause__ = err
+        return new
+
+    def close(self):
+        self.client.close()
+
+
+class _RawStream(object):
+    """
+    file like read() on the undecoded body of a streamed httpx response (see requests.Response.raw)
+    """
+
+    def __init__(self, response, transport):
+        self._it = response.iter_raw()
+        self._transport = transport
+        self._rest = memoryview(b'')
+        self._error = None
+
+    def _next(self):
+        if self._error is not None:
+            err, self._error = self._error, None
+            raise err
+        try:
+            chunk = next(self._it, None)
+        except self._transport.httpx.HTTPError as err:
+            raise self._transport._translate(err)
+        self._rest = memoryview(chunk or b'')
+        return chunk is not None
+
+    def readinto(self, b):
+        size = len(b)
+        n = 0
+        while n < size:
+            if not len(self._rest):
+                try:
+                    if not self._next():
+                        break
+                except requests.exceptions.RequestException as err:
+                    if not n:
+                        raise
+                    # the bytes read so far are returned, the error is raised by the next read
+                    self._error = err
+                    break
+            take = min(size - n, len(self._rest))
+            b[n:n + take] = self._rest[:take]
+            self._rest = self._rest[take:]
+            n += take
+        return n
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            parts = [bytes(self._rest)]
+            while self._next():
+                parts.append(bytes(self._rest))
+            self._rest = memoryview(b'')
+            return b''.join(parts)
+        buf = bytearray(n)
+        return bytes(buf[:self.readinto(buf)])
+
+
+class HttpxResponse(object):
+    """
+    requests.Response compatible view of a httpx response
+    """
+
+    def __init__(self, response, transport):
+        self._res = response
+        self._transport = transport
+        self._raw = None
+
+    @property
+    def status_code(self):
+        return self._res.status_code
+
+    @property
+    def reason(self):
+        return self._res.reason_phrase
+
+    @property
+    def ok(self):
+        return self._res.status_code < 400
+
+    @property
+    def headers(self):
+        return self._res.headers
+
+    @property
+    def url(self):
+        return str(self._res.url)
+
+    @property
+    def content(self):
+        try:
+            return self._res.read()
+        except self._transport.httpx.HTTPError as err:
+            raise self._transport._translate(err)
+
+    @property
+    def text(self):
+        self.content
+        return self._res.text
+
+    @property
+    def raw(self):
+        if self._raw is None:
+            self._raw = _RawStream(self._res, self._transport)
+        return self._raw
+
+    def json(self, **kwargs):
+        self.content
+        return self._res.json(**kwargs)
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        try:
+            for chunk in self._res.iter_bytes(chunk_size):
+                yield chunk
+        except self._transport.httpx.HTTPError as err:
+            raise self._transport._translate(err)
+
+    def raise_for_status(self):
+        if 400 <= self.status_code < 600:
+            kind = 'Client' if self.status_code < 500 else 'Server'
+            raise requests.exceptions.HTTPError(
+                '{0} {1} Error: {2} for url: {3}'.format(self.status_code, kind, self.reason, self.url),
+                response=self)
+
+    def close(self):
+        self._res.close()
+
+    def __repr__(self):
+        return '<Response [{0}] {1}>'.format(self.status_code, self._res.http_version)
+
+
+def createTransport(transport, session):
+    """
+    create the transport for a connecter
+
+    :param transport: 'requests', 'httpx', 'http2' or a Transport instance
+    :param requests.Session session: the session of the connecter
+    :return: the transport
+    :rtype: Transport
+    """
+
+    if isinstance(transport, Transport):
+        return transport
+    if transport in (None, 'requests'):
+        return RequestsTransport(session)
+    if transport == 'httpx':
+        return HttpxTransport(session)
+    if transport == 'http2':
+        return HttpxTransport(session, http2=True)
+    raise ValueError("unknown transport '{0}', use 'requests', 'httpx' or 'http2'".format(transport))
@@ -0,0 +1,284 @@
+#!/usr/bin/python
+"""
+=======
+INFOS
+=======
+* python version: 3.5
+* connectVSD 0.8.1
+* module: unitofwork
+
+========
+CHANGES
+========
+* unit of work collecting changes and sending them coalesced on exit
+
+"""
+
+import logging
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from requests.exceptions import RequestException
+
+logger = logging.getLogger(__name__)
+
+
+class UnitOfWorkResult(object):
+    """
+    counts of a unit of work: the changes recorded and the requests sent for them
+    """
+
+    def __init__(self):
+        #: calls recorded, each would have sent a request
+        self.recorded = 0
+        #: calls not sent, the block raised
+        self.discarded = 0
+        #: requests sent on flush
+        self.issued = 0
+        #: (resource, error) of the failed requests
+        self.failed = list()
+        self.seconds = 0.0
+
+    @property
+    def avoided(self):
+        """
+        :return: requests saved by merging the recorded calls
+        :rtype: int
+        """
+        return max(0, self.recorded - self.discarded - self.issued)
+
+    def __str__(self):
+        return '{0} changes recorded, {1} requests issued, {2} avoided, {3} discarded, {4} failed, ' \
+               '{5:.2f}s'.format(self.recorded, self.issued, self.avoided, self.discarded, len(self.failed),
+                                 self.seconds)
+
+
+class UnitOfWork(object):
+    """
+    collects changes and sends them when the with block ends, with redundant changes merged:
+
+    * putObject: one update per object with its state at the end of the block
+    * add/removeObject(s)To/FromFolder: one update per folder, the last change of an object wins
+    * postObjectGroupRights / postObjectUserRights: one right per object and group (user),
+      with the permissions of all calls
+    * addLink: one link per pair of objects
+
+    the objects are updated first, then the folders, rights and links concurrently, as they refer to
+    the objects. if the block raises, nothing is sent. a failed request does not stop the others,
+    it is listed in result.failed with the counts in result
+
+    :param VSDConnecter apisession: the API session
+    :param int workers: concurrent requests on flush
+    """
+
+    def __init__(self, apisession, workers=8):
+        self.api = apisession
+        self.workers = max(1, workers)
+        self.result = UnitOfWorkResult()
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        #: calls recorded since the last flush
+        self._calls = 0
+        #: selfUrl -> APIObject
+        self._objects = dict()
+        #: selfUrl -> [Folder, dict(object selfUrl -> True to add, False to remove)]
+        self._folders = dict()
+        #: (kind, object selfUrl, group or user selfUrl) -> [object, group or user, dict(selfUrl -> right)]
+        self._rights = dict()
+        #: frozenset of the two selfUrls -> (object1, object2)
+        self._links = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            logger.info('unit of work discarded: %s', exc)
+            with self._lock:
+                self.result.discarded += self._calls
+                self._clear()
+            return False
+        self.flush()
+        return False
+
+    def _record(self):
+        self.result.recorded += 1
+        self._calls += 1
+
+    def putObject(self, obj):
+        """
+        update an object, with its state at flush
+
+        :param APIObject obj: the object
+        """
+        with self._lock:
+            self._record()
+            self._objects[obj.selfUrl] = obj
+
+    def _member(self, target, objects, add):
+        with self._lock:
+            self._record()
+            entry = self._folders.setdefault(target.selfUrl, [target, dict()])
+            # the latest folder model is the one updated
+            entry[0] = target
+            for obj in objects:
+                entry[1][getattr(obj, 'selfUrl', obj)] = add
+
+    def addObjectToFolder(self, target, obj):
+        """
+        add an object to a folder
+
+        :param Folder target: the folder
+        :param obj: the object (APIObject, APIBase or selfUrl)
+        """
+        self._member(target, [obj], True)
+
+    def addObjectsToFolder(self, target, objects):
+        """
+        add objects to a folder
+
+        :param Folder target: the folder
+        :param objects: the objects (APIObject, APIBase or selfUrl)
+        """
+        self._member(target, objects, True)
+
+    def removeObjectFromFolder(self, target, obj):
+        """
+        remove an object from a folder
+
+        :param Folder target: the folder
+        :param obj: the object (APIObject, APIBase or selfUrl)
+        """
+        self._member(target, [obj], False)
+
+    def removeObjectsFromFolder(self, target, objects):
+        """
+        remove objects from a folder
+
+        :param Folder target: the folder
+        :param objects: the objects (APIObject, APIBase or selfUrl)
+        """
+        self._member(target, objects, False)
+
+    def _right(self, kind, obj, subject, perms):
+        with self._lock:
+            self._record()
+            entry = self._rights.setdefault((kind, obj.selfUrl, subject.selfUrl), [obj, subject, dict()])
+            for perm in perms:
+                entry[2].setdefault(perm.selfUrl, perm)
+
+    def postObjectGroupRights(self, obj, group, perms):
+        """
+        add permissions of a group to an object
+
+        :param APIObject obj: the object
+        :param Group group: the group
+        :param list perms: the object rights (APIObjectRight)
+        """
+        self._right('group', obj, group, perms)
+
+    def postObjectUserRights(self, obj, user, perms):
+        """
+        add permissions of a user to an object
+
+        :param APIObject obj: the object
+        :param User user: the user
+        :param list perms: the object rights (APIObjectRight)
+        """
+        self._right('user', obj, user, perms)
+
+    def addLink(self, obj1, obj2):
+        """
+        link two objects
+
+        :param APIBase obj1: a linked object with selfUrl
+        :param APIBase obj2: a linked object with selfUrl
+        """
+        with self._lock:
+            self._record()
+            self._links.setdefault(frozenset((obj1.selfUrl, obj2.selfUrl)), (obj1, obj2))
+
+    def _issued(self, n=1):
+        with self._lock:
+            self.result.issued += n
+
+    def _fail(self, what, err):
+        logger.error('unit of work: %s failed: %s', what, err)
+        with self._lock:
+            self.result.failed.append((str(what), str(err)))
+
+    def _putObject(self, obj):
+        self._issued()
+        if self.api.putObject(obj) is None:
+            self._fail(obj.selfUrl, 'update failed')
+
+    def _putFolder(self, target, changes):
+        add = [url for url, a in changes.items() if a]
+        remove = [url for url, a in changes.items() if not a]
+        objects = self.api._changedFolderObjects(target, add=add, remove=remove)
+        if objects is None:
+            # already as requested, nothing sent
+            return
+        self._issued()
+        if self.api._putFolderObjects(target, objects) is None:
+            self._fail(target.selfUrl, 'update failed')
+
+    def _postRight(self, kind, obj, subject, perms):
+        self._issued()
+        if kind == 'group':
+            right = self.api.postObjectGroupRights(obj, subject, perms)
+        else:
+            right = self.api.postObjectUserRights(obj, subject, perms)
+        # posts answer an error status with the error as body, no exception
+        if right.selfUrl is None:
+            self._fail(obj.selfUrl, 'rights not created')
+
+    def _addLink(self, obj1, obj2):
+        self._issued()
+        res = self.api.addLink(obj1, obj2)
+        if not isinstance(res, dict) or res.get('selfUrl') is None:
+            self._fail(obj1.selfUrl, 'link not created')
+
+    def _within(self, deadline, fn, *args):
+        # the deadline of the caller is thread-local, the pool workers enter it again
+        with self.api.deadline(deadline):
+            return fn(*args)
+
+    def _run(self, pool, tasks):
+        deadline = self.api._deadline()
+        futures = [(what, pool.submit(self._within, deadline, fn, *args)) for what, fn, args in tasks]
+        for what, future in futures:
+            try:
+                future.result()
+            except (RequestException, ValueError) as err:
+                # ValueError: an error page that is not JSON
+                self._fail(what, err)
+
+    def flush(self):
+        """
+        send the recorded changes, the objects first, then folders, rights and links
+
+        :return: the counts
+        :rtype: UnitOfWorkResult
+        """
+
+        start = time.time()
+        with self._lock:
+            objects, folders, rights, links = self._objects, self._folders, self._rights, self._links
+            self._clear()
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            self._run(pool, [(url, self._putObject, (obj,)) for url, obj in objects.items()])
+            tasks = [(url, self._putFolder, tuple(entry)) for url, entry in folders.items()]
+            tasks += [(key[1], self._postRight, (key[0], obj, subject, list(perms.values())))
+                      for key, (obj, subject, perms) in rights.items()]
+            tasks += [(obj1.selfUrl, self._addLink, (obj1, obj2)) for obj1, obj2 in links.values()]
+            self._run(pool, tasks)
+
+        self.result.seconds += time.time() - start
+        logger.info('%s', self.result)
+        return self.result
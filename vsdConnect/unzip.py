@@ -0,0 +1,445 @@
+#!/usr/bin/python
+"""
+=======
+INFOS
+=======
+* python version: 3.5
+* connectVSD 0.8.1
+* module: unzip
+
+========
+CHANGES
+========
+* extraction of ZIP files while they are downloaded, no .zip on disk
+
+"""
+
+import fnmatch
+import logging
+import struct
+import threading
+import zlib
+from zipfile import BadZipFile
+
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+LOCAL_SIG = 0x04034b50
+CENTRAL_SIG = 0x02014b50
+DESCRIPTOR_SIG = 0x08074b50
+EOCD_SIG = 0x06054b50
+EOCD64_SIG = 0x06064b50
+EOCD64_LOCATOR_SIG = 0x07064b50
+
+STORED = 0
+DEFLATED = 8
+
+_LOCAL = struct.Struct('<IHHHHHIIIHH')
+_CENTRAL = struct.Struct('<IHHHHHHIIIHHHHHII')
+_EOCD = struct.Struct('<IHHHHIIH')
+_EOCD64_LOCATOR = struct.Struct('<IIQI')
+_EOCD64 = struct.Struct('<IQHHIIQQQQ')
+
+#: bytes at the end of a ZIP file holding the end of central directory record (with the longest comment)
+TAIL_BYTES = _EOCD.size + 0xffff + _EOCD64_LOCATOR.size
+
+
+class ZipMember(object):
+    """
+    a member of a ZIP file
+
+    :param str name: name in the archive
+    :param int method: compression method, STORED or DEFLATED
+    :param int flags: general purpose flags
+    :param int crc: CRC-32 of the data
+    :param int compressSize: bytes in the archive
+    :param int size: bytes extracted
+    :param int offset: offset of the local header, known from the central directory
+    """
+
+    def __init__(self, name, method, flags, crc, compressSize, size, offset=None):
+        self.name = name
+        self.method = method
+        self.flags = flags
+        self.crc = crc
+        self.compressSize = compressSize
+        self.size = size
+        self.offset = offset
+
+    @property
+    def isDir(self):
+        return self.name.endswith('/')
+
+    def __repr__(self):
+        return '<ZipMember {0} {1} bytes>'.format(self.name, self.size)
+
+
+def _name(raw, flags):
+    # bit 11: the name is UTF-8, cp437 otherwise
+    return bytes(raw).decode('utf-8' if flags & 0x800 else 'cp437')
+
+
+def _zip64(extra, size, compressSize, offset=None):
+    """
+    sizes and offset marked 0xffffffff are in the zip64 extra field
+
+    :return: (size, compressSize, offset)
+    """
+
+    pos = 0
+    while pos + 4 <= len(extra):
+        tag, length = struct.unpack_from('<HH', extra, pos)
+        if tag == 0x0001:
+            values = list(struct.unpack_from('<{0}Q'.format(length // 8), extra, pos + 4))
+            if size == 0xffffffff and values:
+                size = values.pop(0)
+            if compressSize == 0xffffffff and values:
+                compressSize = values.pop(0)
+            if offset == 0xffffffff and values:
+                offset = values.pop(0)
+            break
+        pos += 4 + length
+    return size, compressSize, offset
+
+
+def endOfCentralDirectory(tail, tailOffset):
+    """
+    find the central directory from the end of a ZIP file
+
+    :param bytes tail: the last bytes of the file
+    :param int tailOffset: offset of tail in the file
+    :return: (offset, size) of the central directory, or (None, offset of the zip64 record)
+        if the zip64 end of central directory record is not in tail
+    :rtype: tuple
+    :raises: BadZipFile
+    """
+
+    pos = bytes(tail).rfind(struct.pack('<I', EOCD_SIG))
+    if pos < 0:
+        raise BadZipFile('end of central directory not found')
+    (sig, disk, cdDisk, entriesDisk, entries, cdSize, cdOffset, commentLength) = _EOCD.unpack_from(tail, pos)
+    if cdOffset != 0xffffffff and cdSize != 0xffffffff and entries != 0xffff:
+        return cdOffset, cdSize
+    loc = pos - _EOCD64_LOCATOR.size
+    if loc < 0:
+        raise BadZipFile('zip64 locator not found')
+    sig, disk, eocd64Offset, disks = _EOCD64_LOCATOR.unpack_from(tail, loc)
+    if sig != EOCD64_LOCATOR_SIG:
+        raise BadZipFile('zip64 locator not found')
+    rel = eocd64Offset - tailOffset
+    if rel < 0:
+        return None, eocd64Offset
+    return endOfCentralDirectory64(tail[rel:rel + _EOCD64.size])
+
+
+def endOfCentralDirectory64(record):
+    """
+    :param bytes record: the zip64 end of central directory record
+    :return: (offset, size) of the central directory
+    """
+
+    fields = _EOCD64.unpack_from(record)
+    if fields[0] != EOCD64_SIG:
+        raise BadZipFile('zip64 end of central directory not found')
+    return fields[9], fields[8]
+
+
+def centralDirectory(data):
+    """
+    parse the central directory
+
+    :param bytes data: the central directory
+    :return: the members in the order of the directory
+    :rtype: list of ZipMember
+    """
+
+    members = list()
+    pos = 0
+    while pos + _CENTRAL.size <= len(data):
+        fields = _CENTRAL.unpack_from(data, pos)
+        if fields[0] != CENTRAL_SIG:
+            break
+        flags, method, crc, compressSize, size = fields[3], fields[4], fields[7], fields[8], fields[9]
+        nameLength, extraLength, commentLength, offset = fields[10], fields[11], fields[12], fields[16]
+        start = pos + _CENTRAL.size
+        name = _name(data[start:start + nameLength], flags)
+        extra = data[start + nameLength:start + nameLength + extraLength]
+        size, compressSize, offset = _zip64(extra, size, compressSize, offset)
+        members.append(ZipMember(name, method, flags, crc, compressSize, size, offset))
+        pos = start + nameLength + extraLength + commentLength
+    return members
+
+
+def memberFilter(members=None):
+    """
+    :param members: None (all members), a function name -> bool, or a list of names and glob patterns
+    :return: function name -> bool
+    """
+
+    if members is None:
+        return lambda name: True
+    if callable(members):
+        return members
+    if isinstance(members, str):
+        members = [members]
+    patterns = list(members)
+    return lambda name: any(name == p or fnmatch.fnmatchcase(name, p) for p in patterns)
+
+
+class _FileSink(object):
+    # writes a member into a file
+
+    def __init__(self, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.f = path.open('wb')
+        self.write = self.f.write
+
+    def close(self):
+        self.f.close()
+
+    def abort(self):
+        self.f.close()
+
+
+class _BufferSink(object):
+    # collects a member and hands it to the callback
+
+    def __init__(self, member, callback):
+        self.member = member
+        self.callback = callback
+        self.data = bytearray()
+        self.write = self.data.extend
+
+    def close(self):
+        self.callback(self.member.name, self.data)
+
+    def abort(self):
+        pass
+
+
+class MemberHandler(object):
+    """
+    receives the extracted members: written below target, or passed to callback(name, data) with
+    the data of the member as bytearray. members not accepted by the filter are skipped without
+    decompressing them
+
+    :param Path target: directory to extract to
+    :param callback: function called with the name and the data of each member
+    :param members: filter, see memberFilter
+    """
+
+    def __init__(self, target=None, callback=None, members=None):
+        if target is None and callback is None:
+            raise ValueError('a target directory or a callback is required')
+        self.target = None if target is None else Path(target)
+        self.callback = callback
+        self.accept = memberFilter(members)
+        self._lock = threading.Lock()
+        #: names of the extracted members
+        self.members = list()
+
+    def path(self, name):
+        """
+        :return: the file of a member below target, None for names without a file part
+        :rtype: Path
+        """
+        # like zipfile: absolute paths and .. components are dropped
+        parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.', '..')]
+        if not parts:
+            return None
+        return Path(self.target, *parts)
+
+    def open(self, member):
+        """
+        :return: the sink of a member (write, close and abort) or None to skip it
+        """
+        if not self.accept(member.name):
+            return None
+        if self.callback is not None:
+            if member.isDir:
+                return None
+            return _BufferSink(member, self.callback)
+        path = self.path(member.name)
+        if path is None:
+            return None
+        if member.isDir:
+            path.mkdir(parents=True, exist_ok=True)
+            return None
+        return _FileSink(path)
+
+    def done(self, member):
+        with self._lock:
+            self.members.append(member.name)
+
+
+class ZipStreamParser(object):
+    """
+    push parser extracting the members of a ZIP file while its bytes arrive. feed() takes the
+    bytes in order from a local file header on, eg. the whole file or the span of some members;
+    parsing stops at the central directory. memory is bounded by one chunk and the decompressor
+
+    :param MemberHandler handler: receives the members
+    :param dict known: name -> ZipMember from the central directory, for members with data descriptor
+    """
+
+    def __init__(self, handler, known=None):
+        self.handler = handler
+        self.known = known or dict()
+        self._buf = bytearray()
+        self._state = self._header
+        self.member = None
+        self._sink = None
+        #: bytes consumed
+        self.consumed = 0
+        #: the central directory was reached
+        self.done = False
+
+    def feed(self, data):
+        """
+        parse the next bytes
+
+        :param data: bytes or memoryview
+        :raises: BadZipFile
+        """
+        view = memoryview(data)
+        pos = 0
+        while pos < len(view) and not self.done:
+            pos += self._state(view[pos:])
+        self.consumed += len(view)
+
+    def close(self):
+        """
+        :raises: BadZipFile if the data ended inside a member
+        """
+        if self.member is not None or self._buf:
+            if self._sink is not None:
+                self._sink.abort()
+            raise BadZipFile('truncated ZIP data in {0}'.format(self.member.name if self.member else 'a header'))
+
+    def _fill(self, view, need):
+        # copy up to need bytes into the header buffer, return the bytes taken from view
+        take = max(0, min(need - len(self._buf), len(view)))
+        self._buf += view[:take]
+        return take
+
+    def _header(self, view):
+        n = self._fill(view, 4)
+        if len(self._buf) < 4:
+            return n
+        sig = struct.unpack_from('<I', self._buf)[0]
+        if sig != LOCAL_SIG:
+            if sig in (CENTRAL_SIG, EOCD_SIG, EOCD64_SIG):
+                del self._buf[:]
+                self.done = True
+                return len(view)
+            raise BadZipFile('bad local file header signature {0:#x}'.format(sig))
+        n += self._fill(view[n:], _LOCAL.size)
+        if len(self._buf) < _LOCAL.size:
+            return n
+        fields = _LOCAL.unpack_from(self._buf)
+        nameLength, extraLength = fields[9], fields[10]
+        n += self._fill(view[n:], _LOCAL.size + nameLength + extraLength)
+        if len(self._buf) < _LOCAL.size + nameLength + extraLength:
+            return n
+
+        flags, method, crc, compressSize, size = fields[2], fields[3], fields[6], fields[7], fields[8]
+        name = _name(self._buf[_LOCAL.size:_LOCAL.size + nameLength], flags)
+        extra = bytes(self._buf[_LOCAL.size + nameLength:])
+        del self._buf[:]
+        zip64 = 0xffffffff in (size, compressSize)
+        size, compressSize, offset = _zip64(extra, size, compressSize)
+        member = ZipMember(name, method, flags, crc, compressSize, size)
+        member.zip64 = zip64
+        if flags & 0x08:
+            # sizes and crc follow the data, the central directory knows them
+            known = self.known.get(name)
+            if known is not None:
+                member.crc, member.compressSize, member.size = known.crc, known.compressSize, known.size
+            elif not compressSize:
+                member.compressSize = member.size = None
+        self._start(member)
+        return n
+
+    def _start(self, member):
+        self.member = member
+        self._remaining = member.compressSize
+        self._crc = 0
+        self._written = 0
+        self._sink = self.handler.open(member)
+        self._inflate = None
+        if member.method == DEFLATED:
+            if self._sink is not None or self._remaining is None:
+                self._inflate = zlib.decompressobj(-15)
+        elif member.method == STORED:
+            if self._remaining is None:
+                raise BadZipFile('{0}: stored with a data descriptor, the size is unknown'.format(member.name))
+        elif self._sink is not None:
+            raise BadZipFile('{0}: unsupported compression method {1}'.format(member.name, member.method))
+        self._state = self._data
+
+    def _output(self, data):
+        if data and self._sink is not None:
+            self._crc = zlib.crc32(data, self._crc)
+            self._written += len(data)
+            self._sink.write(data)
+
+    def _data(self, view):
+        if self._remaining is not None:
+            take = min(self._remaining, len(view))
+            self._remaining -= take
+            if self._sink is not None:
+                if self._inflate is not None:
+                    self._output(self._inflate.decompress(view[:take]))
+                    if not self._remaining:
+                        self._output(self._inflate.flush())
+                else:
+                    self._output(view[:take])
+            if not self._remaining:
+                self._end()
+            return take
+
+        # deflate of unknown length: the stream ends by itself
+        self._output(self._inflate.decompress(view))
+        if not self._inflate.eof:
+            return len(view)
+        unused = len(self._inflate.unused_data)
+        self._output(self._inflate.flush())
+        self._end()
+        return len(view) - unused
+
+    def _end(self):
+        if self.member.flags & 0x08:
+            self._state = self._descriptor
+        else:
+            self._finish()
+
+    def _descriptor(self, view):
+        n = self._fill(view, 4)
+        if len(self._buf) < 4:
+            return n
+        signed = struct.unpack_from('<I', self._buf)[0] == DESCRIPTOR_SIG
+        need = (4 if signed else 0) + (20 if self.member.zip64 else 12)
+        n += self._fill(view[n:], need)
+        if len(self._buf) < need:
+            return n
+        fmt = '<IQQ' if self.member.zip64 else '<III'
+        crc, compressSize, size = struct.unpack_from(fmt, self._buf, 4 if signed else 0)
+        del self._buf[:]
+        if self.member.size is None:
+            self.member.crc, self.member.compressSize, self.member.size = crc, compressSize, size
+        self._finish()
+        return n
+
+    def _finish(self):
+        member, sink = self.member, self._sink
+        self.member = self._sink = None
+        self._state = self._header
+        if sink is None:
+            return
+        if self._written != member.size or self._crc != member.crc:
+            sink.abort()
+            raise BadZipFile('{0}: bad CRC-32 or size ({1} of {2} bytes)'.format(
+                member.name, self._written, member.size))
+        sink.close()
+        self.handler.done(member)
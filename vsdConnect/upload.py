@@ -0,0 +1,521 @@
+#!/usr/bin/python
+"""
+=======
+INFOS
+=======
+* python version: 3.5
+* connectVSD 0.8.1
+* module: upload
+
+========
+CHANGES
+========
+* streaming multipart bodies for uploads
+* parallel chunked uploads with retries
+* resumable chunked uploads with an upload manifest
+* adaptive chunk sizes
+
+"""
+
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+from pathlib import Path
+
+from requests.exceptions import RequestException
+
+from vsdConnect.codec import getCodec
+
+logger = logging.getLogger(__name__)
+
+
+class MultipartFile(object):
+    """
+    multipart/form-data body with one file, streamed from disk. the body is an iterable of blocks
+    of bufsize with a known length, so the transports send it with a Content-Length header and
+    memory stays at one block regardless of the file size. it can be iterated again, eg. for a retry
+
+    :param Path fp: the file to upload
+    :param str filename: file name sent to the server, default is the name of fp
+    :param str field: name of the form field
+    :param int bufsize: size of the blocks read from the file
+    :param progress: function called with the number of bytes of the file sent so far
+    :param int offset: first byte of the file to send, eg. for a chunk
+    :param int length: bytes to send, default is up to the end of the file
+    :param bool digest: compute the SHA-1 of the sent bytes while sending, see sha1
+    """
+
+    def __init__(self, fp, filename=None, field='file', bufsize=1024 * 1024, progress=None, offset=0, length=None,
+                 digest=False):
+        self.fp = Path(fp)
+        self.offset = offset
+        self.size = self.fp.stat().st_size - offset if length is None else length
+        self.bufsize = bufsize
+        self.progress = progress
+        self.boundary = uuid.uuid4().hex
+        name = (filename or self.fp.name).replace('"', '%22')
+        self._head = ('--{0}\r\nContent-Disposition: form-data; name="{1}"; filename="{2}"\r\n\r\n'.format(
+            self.boundary, field, name)).encode('utf-8')
+        self._tail = '\r\n--{0}--\r\n'.format(self.boundary).encode('ascii')
+        #: bytes of the file sent by the last iteration
+        self.bytes = 0
+        self.seconds = 0.0
+        self.digest = digest
+        #: SHA-1 of the sent bytes (uppercase hex) if digest is set
+        self.sha1 = None
+
+    @property
+    def contentType(self):
+        return 'multipart/form-data; boundary={0}'.format(self.boundary)
+
+    def headers(self):
+        """
+        :return: the Content-Type and Content-Length headers of the body
+        :rtype: dict
+        """
+        return {'Content-Type': self.contentType, 'Content-Length': str(len(self))}
+
+    def __len__(self):
+        return len(self._head) + self.size + len(self._tail)
+
+    def __iter__(self):
+        start = time.time()
+        self.bytes = 0
+        hasher = hashlib.sha1() if self.digest else None
+        yield self._head
+        with self.fp.open('rb') as f:
+            if self.offset:
+                f.seek(self.offset)
+            # the file is read up to its size when the body was created, Content-Length must match
+            left = self.size
+            while left > 0:
+                block = f.read(min(self.bufsize, left))
+                if not block:
+                    raise IOError('{0} was truncated during the upload'.format(self.fp))
+                left -= len(block)
+                self.bytes += len(block)
+                if hasher is not None:
+                    hasher.update(block)
+                yield block
+                if self.progress is not None:
+                    self.progress(self.bytes)
+        yield self._tail
+        if hasher is not None:
+            self.sha1 = hasher.hexdigest().upper()
+        self.seconds = time.time() - start
+
+    @property
+    def throughput(self):
+        """
+        :return: bytes per second of the last upload
+        :rtype: float
+        """
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return '{0}: {1:.1f} MB uploaded in {2:.2f}s ({3:.1f} MB/s)'.format(
+            self.fp.name, self.bytes / 1e6, self.seconds, self.throughput / 1e6)
+
+
+class UploadManifest(object):
+    """
+    state of a chunked upload, stored next to the file (<name>.upload.json) or in a state directory:
+    the identity of the file (path, size, mtime), the chunk size and offset, length and SHA-1 of every
+    chunk. the SHA-1 is None while the chunk is being sent. an interrupted upload started again only
+    sends the missing chunks. a manifest of a modified file or of another chunk size is not used
+
+    :param Path path: the manifest file
+    :param Path fp: the uploaded file
+    :param str filename: file name sent to the server
+    :param chunksize: size in bytes of the chunks, 'auto' for adaptive sizes
+    :param dict chunks: index -> [offset, length, SHA-1] of the chunks
+    """
+
+    def __init__(self, path, fp, filename, chunksize, chunks=None):
+        self.path = Path(path)
+        self.fp = Path(fp)
+        st = self.fp.stat()
+        self.size = st.st_size
+        self.mtime = st.st_mtime_ns
+        self.filename = filename
+        self.chunksize = chunksize
+        self.chunks = dict((int(k), v) for k, v in (chunks or {}).items())
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def location(fp, stateDir=None):
+        """
+        :param Path fp: the uploaded file
+        :param Path stateDir: directory of the manifests, default is the directory of fp
+        :return: the manifest file of fp
+        :rtype: Path
+        """
+        fp = Path(fp)
+        if stateDir is None:
+            return fp.with_name(fp.name + '.upload.json')
+        key = hashlib.sha1(str(fp.resolve()).encode('utf-8')).hexdigest()[:16]
+        return Path(stateDir, '{0}.{1}.upload.json'.format(fp.name, key))
+
+    @classmethod
+    def load(cls, path, fp, filename, chunksize):
+        """
+        :return: the manifest stored in path if it belongs to the unchanged file and chunk size, else None
+        :rtype: UploadManifest
+        """
+        try:
+            data = getCodec().loads(Path(path).read_bytes())
+        except (IOError, OSError, ValueError):
+            return None
+        manifest = cls(path, fp, filename, chunksize, data.get('chunks') if isinstance(data, dict) else None)
+        expected = dict(fp=str(manifest.fp.resolve()), size=manifest.size, mtime=manifest.mtime,
+                        filename=filename, chunksize=chunksize)
+        if any(data.get(k) != v for k, v in expected.items()):
+            logger.info('upload manifest %s is not used, the file or the chunk size changed', path)
+            return None
+        return manifest
+
+    def done(self, index, offset, length):
+        """
+        :return: if the chunk was uploaded
+        :rtype: bool
+        """
+        with self._lock:
+            entry = self.chunks.get(index)
+        return entry is not None and entry[:2] == [offset, length] and entry[2] is not None
+
+    def pending(self):
+        """
+        :return: index, offset and length of the chunks that were being sent
+        :rtype: list of tuple
+        """
+        with self._lock:
+            return sorted((k, v[0], v[1]) for k, v in self.chunks.items() if v[2] is None)
+
+    def completed(self):
+        """
+        :return: bytes uploaded
+        :rtype: int
+        """
+        with self._lock:
+            return sum(v[1] for v in self.chunks.values() if v[2] is not None)
+
+    def end(self):
+        """
+        :return: the next index and the offset after the last recorded chunk
+        :rtype: tuple
+        """
+        with self._lock:
+            if not self.chunks:
+                return 1, 0
+            index = max(self.chunks)
+            return index + 1, max(v[0] + v[1] for v in self.chunks.values())
+
+    def start(self, index, offset, length):
+        """
+        record a chunk that is sent now and save the manifest
+        """
+        self.add(index, offset, length, None)
+
+    def add(self, index, offset, length, sha1):
+        """
+        record an uploaded chunk and save the manifest
+        """
+        with self._lock:
+            self.chunks[index] = [offset, length, sha1]
+        self.save()
+
+    def save(self):
+        """
+        write the manifest atomically
+        """
+        with self._lock:
+            data = dict(fp=str(self.fp.resolve()), size=self.size, mtime=self.mtime, filename=self.filename,
+                        chunksize=self.chunksize, chunks=dict((str(k), v) for k, v in self.chunks.items()))
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + '.tmp')
+            tmp.write_bytes(getCodec().dumpb(data))
+            os.replace(str(tmp), str(self.path))
+
+    def remove(self):
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+
+class UploadResult(object):
+    """
+    result of a chunked upload
+
+    :param Path fp: the uploaded file
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.size = 0
+        #: bytes sent, including chunks sent again
+        self.bytes = 0
+        self.seconds = 0.0
+        self.chunks = 0
+        self.workers = 1
+        #: chunks sent again after a failed attempt
+        self.retries = 0
+        #: bytes already uploaded by an interrupted upload
+        self.resumed = 0
+        #: (index, size, seconds) of the chunks sent, see ChunkedUpload.adaptive
+        self.chunkSizes = list()
+        #: the response of the commit (file and relatedObject)
+        self.response = None
+
+    @property
+    def throughput(self):
+        """
+        :return: bytes of the file uploaded per second, without the resumed part
+        :rtype: float
+        """
+        return (self.size - self.resumed) / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return ('{0}: {1:.1f} MB in {2:.2f}s ({3:.1f} MB/s, {4} chunks, {5} connections, {6} retries, '
+                '{7:.1f} MB resumed)').format(
+            self.fp.name, self.size / 1e6, self.seconds, self.throughput / 1e6, self.chunks, self.workers,
+            self.retries, self.resumed / 1e6)
+
+
+class ChunkedUpload(object):
+    """
+    uploads a file in chunks to chunked_upload?chunk=N and commits it. every chunk carries its index,
+    so the chunks are sent concurrently over maxWorkers connections. a chunk is streamed from its
+    range of the file (see MultipartFile), memory stays at one block per connection.
+
+    a failed chunk is sent again up to attempts times with an exponential backoff, on connection
+    errors, timeouts and the statuses in retryStatus. otherwise the upload fails with the error
+
+    with adaptive, chunksize is only the size of the first chunks. the next chunks are sized so each
+    takes about chunkSeconds at the rate measured on its connection, between minChunk and maxChunk,
+    changing at most by a factor 2 per chunk. a failed attempt halves the size. the sizes are in
+    result.chunkSizes
+
+    with resume, the chunks are recorded in an UploadManifest. a failed upload started again skips
+    the uploaded chunks and continues with the missing chunks and the commit. the server has to keep
+    the chunks of an upload that was not committed
+
+    :param VSDConnecter apisession: the API session
+    :param Path fp: the file to upload
+    :param int chunksize: size in bytes of the chunks, at most maxChunk
+    :param int maxWorkers: chunks sent concurrently
+    :param progress: function called with the number of bytes sent so far
+    :param str filename: file name sent to the server, default is the name of fp
+    :param bool resume: record the uploaded chunks and skip them when the upload is started again
+    :param Path stateDir: directory of the upload manifest, default is next to the file
+    :param bool adaptive: adapt the chunk size to the measured throughput
+    """
+
+    #: largest chunk the server accepts
+    maxChunk = 100 * 1024 * 1024
+    #: smallest adaptive chunk
+    minChunk = 1024 * 1024
+    #: time an adaptive chunk should take
+    chunkSeconds = 2.0
+    attempts = 5
+    backoff = 0.5
+    retryStatus = (401, 408, 429, 500, 502, 503, 504)
+
+    def __init__(self, apisession, fp, chunksize=4 * 1024 * 1024, maxWorkers=4, progress=None, filename=None,
+                 resume=True, stateDir=None, adaptive=False):
+        if chunksize > self.maxChunk:
+            raise ValueError('chunksize {0} is bigger than the allowed maximum {1}'.format(chunksize, self.maxChunk))
+        self.api = apisession
+        self.fp = Path(fp)
+        self.filename = filename or self.fp.name
+        self.chunksize = chunksize
+        self.maxWorkers = max(1, maxWorkers)
+        self.bufsize = min(chunksize, 1024 * 1024)
+        self.progress = progress
+        self.resume = resume
+        self.stateDir = stateDir
+        self.adaptive = adaptive
+        self.manifest = None
+        self.result = None
+        self._lock = threading.Lock()
+        self._abort = threading.Event()
+        self._sentPerChunk = dict()
+        self._sentTotal = 0
+        # chunks to send, then with adaptive the next chunk at offset with size
+        self._queue = list()
+        self._index = 1
+        self._offset = 0
+        self._size = 0
+        self._chunk = chunksize
+
+    def chunks(self):
+        """
+        :return: index (starting at 1), offset and length of the chunks of chunksize
+        :rtype: list of tuple
+        """
+        size = self.fp.stat().st_size
+        parts = int(math.ceil(size / float(self.chunksize)))
+        return [(i + 1, i * self.chunksize, min(self.chunksize, size - i * self.chunksize)) for i in range(parts)]
+
+    def _bounded(self, size):
+        # adaptive sizes are multiples of 64 kB within the limits of the server
+        return int(min(max(size, self.minChunk), self.maxChunk)) // 65536 * 65536
+
+    def _adapt(self, length, seconds):
+        rate = length / max(seconds, 0.001)
+        with self._lock:
+            size = min(max(rate * self.chunkSeconds, self._chunk / 2.), self._chunk * 2.)
+            self._chunk = self._bounded(size)
+
+    def _shrink(self):
+        with self._lock:
+            self._chunk = self._bounded(self._chunk / 2.)
+
+    def _take(self):
+        """
+        :return: index, offset and length of the next chunk to send or None
+        :rtype: tuple
+        """
+        with self._lock:
+            if self._abort.is_set():
+                return None
+            if self._queue:
+                return self._queue.pop(0)
+            if not self.adaptive or self._offset >= self._size:
+                return None
+            # the last chunks are spread over all connections
+            left = self._size - self._offset
+            chunk = (self._index, self._offset, min(self._chunk, max(self.minChunk, left // self.result.workers), left))
+            self._index += 1
+            self._offset += chunk[2]
+        if self.manifest is not None:
+            # the index of a chunk is fixed once it is used, it is sent again with the same range
+            self.manifest.start(*chunk)
+        return chunk
+
+    def _sent(self, index, n):
+        # bytes sent of a chunk, 0 when it starts again
+        with self._lock:
+            self._sentTotal += n - self._sentPerChunk.get(index, 0)
+            self._sentPerChunk[index] = n
+            total = self._sentTotal
+        if self.progress is not None:
+            self.progress(total)
+
+    def _send(self, index, start, length, timeout, deadline):
+        """
+        post one chunk, with retries
+        """
+
+        url = self.api.fullUrl('chunked_upload')
+        for attempt in range(self.attempts):
+            if self._abort.is_set():
+                return
+            body = MultipartFile(self.fp, self.filename, bufsize=self.bufsize, offset=start, length=length,
+                                 progress=lambda n: self._sent(index, n), digest=self.manifest is not None)
+            try:
+                self.api._stayAlive()
+                res = self.api.transport.request('POST', url, params={'chunk': index}, data=body,
+                                                 headers=body.headers(), timeout=self.api._timeout(timeout))
+                res.raise_for_status()
+                if self.manifest is not None:
+                    self.manifest.add(index, start, length, body.sha1)
+                with self._lock:
+                    self.result.bytes += body.bytes
+                    self.result.chunkSizes.append((index, length, body.seconds))
+                if self.adaptive:
+                    self._adapt(length, body.seconds)
+                logger.info('(%s) uploaded part %s (%.1f MB) in %.2fs', self.filename, index, length / 1e6,
+                            body.seconds)
+                return
+            except RequestException as err:
+                status = getattr(getattr(err, 'response', None), 'status_code', None)
+                if deadline is not None:
+                    deadline.check()
+                if (status is not None and status not in self.retryStatus) or attempt == self.attempts - 1:
+                    raise
+                logger.info('(%s) part %s attempt %s/%s: %s', self.filename, index, attempt + 1,
+                            self.attempts, err)
+                with self._lock:
+                    self.result.bytes += body.bytes
+                    self.result.retries += 1
+                if self.adaptive:
+                    self._shrink()
+                self._sent(index, 0)
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def _worker(self, timeout, deadline):
+        with self.api.deadline(deadline):
+            while True:
+                chunk = self._take()
+                if chunk is None:
+                    return
+                self._send(chunk[0], chunk[1], chunk[2], timeout, deadline)
+
+    def _commit(self, timeout):
+        return self.api._post(self.api.fullUrl('chunked_upload/commit'), params={'filename': self.filename},
+                              timeout=timeout)
+
+    def run(self, timeout=None):
+        """
+        upload the chunks and commit the file
+
+        :param timeout: timeout for the requests, default is the connecter timeout
+        :return: the result, the commit response is result.response
+        :rtype: UploadResult
+        :raises: RequestException of the first chunk that failed
+        """
+
+        start = time.time()
+        self.result = result = UploadResult(self.fp)
+        result.size = self._size = self.fp.stat().st_size
+        deadline = self.api._deadline()
+        self._abort.clear()
+        self._sentPerChunk = dict()
+        self._sentTotal = 0
+        self._chunk = self.chunksize
+        self._index, self._offset = 1, 0
+
+        if self.resume:
+            path = UploadManifest.location(self.fp, self.stateDir)
+            layout = 'auto' if self.adaptive else self.chunksize
+            self.manifest = (UploadManifest.load(path, self.fp, self.filename, layout) or
+                             UploadManifest(path, self.fp, self.filename, layout))
+            result.resumed = self._sentTotal = self.manifest.completed()
+            if result.resumed:
+                logger.info('(%s) resuming upload, %.1f MB done', self.filename, result.resumed / 1e6)
+
+        if self.adaptive:
+            self._queue = self.manifest.pending() if self.manifest is not None else list()
+            if self.manifest is not None:
+                self._index, self._offset = self.manifest.end()
+            left = len(self._queue) + int(math.ceil((self._size - self._offset) / float(self.minChunk)))
+        else:
+            chunks = self.chunks()
+            self._queue = [c for c in chunks if self.manifest is None or not self.manifest.done(*c)]
+            left = len(self._queue)
+        result.workers = min(self.maxWorkers, left) or 1
+
+        if left:
+            with ThreadPoolExecutor(result.workers) as pool:
+                futures = [pool.submit(self._worker, timeout, deadline) for i in range(result.workers)]
+                done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+                for future in done:
+                    if future.exception() is not None:
+                        # the chunks not yet started are dropped, the running ones stop retrying
+                        self._abort.set()
+                        raise future.exception()
+
+        result.chunks = self._index - 1 if self.adaptive else len(chunks)
+        result.chunkSizes.sort()
+        result.response = self._commit(timeout)
+        if self.manifest is not None:
+            self.manifest.remove()
+        result.seconds = time.time() - start
+        return result